@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Arabic Normalization - تحويل نصوص ملفات CSV العربية (التواريخ والمبالغ وأرقام الهواتف)
+يُستخدم من import_csv_data.py: جداول التحويل والتعابير النمطية مجهزة مرة واحدة عند التحميل،
+ودوال الأعمدة تحوّل عموداً كاملاً في مرور واحد (بعمليات pandas النصية إذا كانت مثبتة)
+"""
+
+import os
+import re
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+from customer_index import NON_PHONE_CHARS, PHONE_PLACEHOLDERS, clean_phone
+
+# Arabic month names to numbers
+ARABIC_MONTHS = {
+    'يناير': 1, 'فبراير': 2, 'مارس': 3, 'أبريل': 4,
+    'مايو': 5, 'يونيو': 6, 'يوليو': 7, 'أغسطس': 8,
+    'سبتمبر': 9, 'أكتوبر': 10, 'نوفمبر': 11, 'ديسمبر': 12
+}
+
+# Arabic day names
+ARABIC_DAYS = ['السبت', 'الأحد', 'الإثنين', 'الثلاثاء', 'الأربعاء', 'الخميس', 'الجمعة']
+
+# اسم اليوم في بداية التاريخ (بنفس ترتيب ARABIC_DAYS)
+ARABIC_DAY_PREFIX = re.compile('|'.join(re.escape(day) for day in ARABIC_DAYS))
+
+# الأرقام العربية إلى إنجليزية
+ARABIC_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩', '0123456789')
+
+# الأرقام العربية إلى إنجليزية مع حذف الفواصل والمسافات (للمبالغ)
+AMOUNT_CHARS = str.maketrans('٠١٢٣٤٥٦٧٨٩', '0123456789', ', ')
+
+# أقصى عدد قيم مختلفة في كل ذاكرة تحويل مؤقتة (LRU) للتواريخ والحالات والأنواع
+PARSE_CACHE_SIZE = int(os.getenv('PARSE_CACHE_SIZE', 4096))
+
+# أقل عدد صفوف لاستخدام pandas (للأعمدة الصغيرة الحلقة العادية أسرع)
+PANDAS_MIN_ROWS = 10000
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_arabic_date(date_str: str) -> Optional[datetime]:
+    """تحويل التاريخ العربي إلى datetime (مع ذاكرة مؤقتة: التاريخ المتكرر يُحوّل مرة واحدة)"""
+    if not date_str:
+        return None
+
+    try:
+        # Remove day name and comma if present
+        date_str = date_str.strip()
+        day_name = ARABIC_DAY_PREFIX.match(date_str)
+        if day_name:
+            date_str = date_str.replace(day_name.group() + ',', '').strip()
+
+        # Replace Arabic digits and extra spaces: "٢٠ نوفمبر ٢٠٢٥" -> "20 نوفمبر 2025"
+        parts = date_str.translate(ARABIC_DIGITS).split()
+        date_str = ' '.join(parts)
+
+        if len(parts) >= 3:
+            day = int(parts[0])
+            month_name = parts[1]
+            year = int(parts[2])
+
+            month = ARABIC_MONTHS.get(month_name)
+            if month:
+                return datetime(year, month, day)
+
+        return None
+    except Exception as e:
+        print(f"خطأ في تحويل التاريخ: {date_str} - {e}")
+        return None
+
+
+def amount_from_normalized(amount_str: str) -> Decimal:
+    """تحويل مبلغ تم تحويل أرقامه وحذف فواصله ومسافاته إلى Decimal"""
+    amount_str = amount_str.strip()
+    if not amount_str:
+        return Decimal('0')
+
+    try:
+        return Decimal(amount_str)
+    except Exception as e:
+        print(f"خطأ في تحويل المبلغ: {amount_str} - {e}")
+        return Decimal('0')
+
+
+def parse_amount(amount_str: str) -> Optional[Decimal]:
+    """تحويل المبلغ من نص إلى Decimal"""
+    if not amount_str:
+        return Decimal('0')
+    return amount_from_normalized(str(amount_str).translate(AMOUNT_CHARS))
+
+
+def use_pandas(values: Sequence) -> bool:
+    """هل يتم تحويل العمود بعمليات pandas النصية"""
+    return pd is not None and len(values) >= PANDAS_MIN_ROWS
+
+
+def parse_dates(values: Sequence[str]) -> List[Optional[datetime]]:
+    """تحويل عمود تواريخ كامل؛ التواريخ المتكررة تُقرأ من ذاكرة parse_arabic_date المؤقتة"""
+    return [parse_arabic_date(value) for value in values]
+
+
+def parse_amounts(values: Sequence[str]) -> List[Decimal]:
+    """تحويل عمود مبالغ كامل بنفس نتيجة parse_amount لكل قيمة"""
+    if use_pandas(values):
+        series = pd.Series(values, dtype=object)
+        normalized = series.where(series.notna(), '').astype(str).str.translate(AMOUNT_CHARS).tolist()
+    else:
+        normalized = [str(value).translate(AMOUNT_CHARS) if value else '' for value in values]
+
+    parsed: Dict[str, Decimal] = {}
+    result = []
+    for value, amount_str in zip(values, normalized):
+        if not value:
+            result.append(Decimal('0'))
+            continue
+        if amount_str not in parsed:
+            parsed[amount_str] = amount_from_normalized(amount_str)
+        result.append(parsed[amount_str])
+    return result
+
+
+def clean_phones(values: Sequence[str]) -> List[Optional[str]]:
+    """تنظيف عمود أرقام هواتف كامل بنفس نتيجة clean_phone لكل قيمة"""
+    if not use_pandas(values):
+        return [clean_phone(value) for value in values]
+
+    series = pd.Series(values, dtype=object)
+    empty = series.isna() | (series == '') | series.isin(PHONE_PLACEHOLDERS)
+    cleaned = series.where(~empty, '').astype(str).str.replace(NON_PHONE_CHARS, '', regex=True)
+    keep = ~empty & (cleaned.str.len() >= 8)
+    return [phone if ok else None for phone, ok in zip(cleaned.tolist(), keep.tolist())]
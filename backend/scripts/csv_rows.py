@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+CSV Rows - قراءة ملفات CSV المصدّرة من النظام القديم بشكل متدفق
+يُستخدم من import_csv_data.py: يتخطى BOM وسطر العنوان من أول سطر في الملف، ويُرجع كل صف
+كـ namedtuple بالأعمدة المطلوبة فقط (فهارسها محسوبة مرة واحدة من سطر أسماء الأعمدة)
+"""
+
+import csv
+from collections import namedtuple
+from itertools import chain
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+
+def csv_row_type(name: str, columns: Dict[str, str]) -> type:
+    """نوع الصف: namedtuple حقوله أسماء الأعمدة في قاعدة البيانات (قيم columns)"""
+    return namedtuple(name, columns.values())
+
+
+def iter_csv_rows(csv_file_path: str, row_type: type, columns: Dict[str, str], header_markers: Iterable[str],
+                  defaults: Optional[Dict[str, str]] = None) -> Iterator[Tuple[int, tuple]]:
+    """قراءة صفوف CSV واحداً تلو الآخر: (رقم السطر، الصف) بنفس نتيجة readlines ثم DictReader
+
+    - BOM يُحذف عند فتح الملف (utf-8-sig).
+    - السطر الأول عنوان يتم تخطيه إذا لم يحتوِ أياً من header_markers (أسماء أعمدة معروفة).
+    - عمود غير موجود في الملف يأخذ قيمته من defaults (أو '')، وخلية ناقصة في صف قصير تكون None.
+    - الصفوف الفارغة يتم تخطيها ولا تُحسب في ترقيم السطور.
+    """
+    defaults = defaults or {}
+    with open(csv_file_path, 'r', encoding='utf-8-sig') as file:
+        # Skip first line if it's a title (doesn't contain column names)
+        first_line = file.readline()
+        start_line = 0
+        lines = chain([first_line], file)
+        if first_line and not any(marker in first_line for marker in header_markers):
+            start_line = 1
+            lines = file
+
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+
+        # فهرس كل عمود مطلوب في الصف (آخر عمود بنفس الاسم كما في DictReader)، أو None إذا لم يكن موجوداً
+        positions = {name: index for index, name in enumerate(header)}
+        fields = [(positions.get(column), defaults.get(field, '')) for column, field in columns.items()]
+
+        row_num = start_line + 1
+        for values in reader:
+            if not values:
+                continue
+            row_num += 1
+            size = len(values)
+            yield row_num, row_type._make(
+                default if index is None else (values[index] if index < size else None)
+                for index, default in fields
+            )
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Customer Lookup Index - فهرس البحث عن العملاء في الذاكرة
+يُستخدم من import_csv_data.py و import_invoices_from_sql_dump.py لمطابقة العملاء
+بالاسم أو بالهاتف بدون استعلام لكل صف، ومن مسارات دفعات العملاء (plan_customer_upserts)
+"""
+
+import os
+import re
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+# قيم تعني عدم وجود رقم هاتف
+PHONE_PLACEHOLDERS = ('.', '000', '00000000000')
+
+# كل ما ليس رقماً أو +
+NON_PHONE_CHARS = re.compile(r'[^\d+]')
+
+# collation عمودي Customer.name و Customer.phone؛ المطابقة في الفهرس تتم بمفاتيحه
+CUSTOMER_COLLATION = os.getenv('CUSTOMER_COLLATION', 'utf8mb4_unicode_ci')
+
+# استخدام الفهرس في مسار الصف الواحد (CUSTOMER_INDEX=1)؛ افتراضياً استعلام لكل عميل
+CUSTOMER_INDEX = os.getenv('CUSTOMER_INDEX', '0') == '1'
+
+# عدد القيم في استعلام حساب المفاتيح الواحد
+COLLATION_KEYS_PER_QUERY = 500
+
+
+def clean_phone(phone: str) -> str:
+    """تنظيف رقم الهاتف"""
+    if not phone or phone in PHONE_PLACEHOLDERS:
+        return None
+    # Remove non-digits except +
+    cleaned = NON_PHONE_CHARS.sub('', str(phone))
+    if not cleaned or len(cleaned) < 8:
+        return None
+    return cleaned
+
+
+def collation_key_sql(expression: str) -> str:
+    """تعبير SQL لمفتاح مقارنة القيمة في CUSTOMER_COLLATION
+    
+    قيمتان متساويتان في WHERE name = %s إذا وفقط إذا تساوى مفتاحاهما: الهمزات والتشكيل
+    والتطويل وحالة الأحرف كما يقارنها الخادم، والمسافات في النهاية تُحذف (PAD SPACE).
+    """
+    return f"HEX(WEIGHT_STRING(TRIM(TRAILING ' ' FROM {expression}) COLLATE {CUSTOMER_COLLATION}))"
+
+
+def server_collation_keys(connection) -> Callable[[List[str]], List[Optional[str]]]:
+    """دالة تحسب مفاتيح المقارنة لقائمة قيم على الخادم باستعلام واحد"""
+    def compute(values: List[str]) -> List[Optional[str]]:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT " + ', '.join([collation_key_sql('%s')] * len(values)), list(values))
+            return list(cursor.fetchone())
+        finally:
+            cursor.close()
+    return compute
+
+
+def build_customer_custom_fields(notes: str = None, csv_order: int = None) -> Optional[str]:
+    """تجهيز customFields للعميل (الملاحظات وترتيب CSV)"""
+    custom_fields_parts = []
+    if notes:
+        custom_fields_parts.append(f'"notes": "{notes}"')
+    if csv_order:
+        custom_fields_parts.append(f'"csvOrder": {csv_order}')
+    
+    return '{' + ', '.join(custom_fields_parts) + '}' if custom_fields_parts else None
+
+
+class CollationKeys:
+    """مفاتيح المقارنة للقيم النصية مع ذاكرة مؤقتة
+
+    compute(values) تُرجع مفتاح كل قيمة بنفس الترتيب (server_collation_keys أو ما يكافئها).
+    القيم غير المعروفة تُحسب عند أول استخدام، و prefetch تحسب قائمة كاملة باستعلامات مجمعة.
+    """
+
+    def __init__(self, compute: Callable[[List[str]], List[Optional[str]]]):
+        self.compute = compute
+        self.keys: Dict[str, Optional[str]] = {}
+
+    def remember(self, value: str, key: Optional[str]):
+        """حفظ مفتاح معروف (مثلاً مفتاح قيمة مخزنة تم جلبه مع الصف)"""
+        if value is not None:
+            self.keys[value] = key
+
+    def prefetch(self, values: Iterable[str], compute: Optional[Callable] = None):
+        """حساب مفاتيح القيم غير المعروفة على دفعات من COLLATION_KEYS_PER_QUERY قيمة"""
+        compute = compute or self.compute
+        missing = list(dict.fromkeys(value for value in values if value is not None and value not in self.keys))
+        for start in range(0, len(missing), COLLATION_KEYS_PER_QUERY):
+            chunk = missing[start:start + COLLATION_KEYS_PER_QUERY]
+            for value, key in zip(chunk, compute(chunk)):
+                self.keys[value] = key
+
+    def __getitem__(self, value: str) -> Optional[str]:
+        if value is None:
+            return None
+        if value not in self.keys:
+            self.prefetch([value])
+        return self.keys[value]
+
+
+class CustomerIndex:
+    """فهرس العملاء بالاسم وبالهاتف
+
+    يحاكي استعلامات "WHERE name = %s LIMIT 1" و "WHERE phone = %s LIMIT 1":
+    القيم تُقارن بمفاتيح collation العمود (CollationKeys) وليس بتطبيع في Python،
+    والهاتف المخزن يُفهرس كما هو، وعند وجود أكثر من عميل بنفس المفتاح يُرجع أصغر معرف.
+    """
+
+    def __init__(self, keys: CollationKeys):
+        self.keys = keys
+        self.by_name: Dict[str, Hashable] = {}
+        self.by_phone: Dict[str, Set[Hashable]] = {}
+        self.phone_of: Dict[Hashable, Optional[str]] = {}
+
+    @classmethod
+    def for_connection(cls, connection) -> 'CustomerIndex':
+        """فهرس فارغ يحسب مفاتيح المقارنة على connection"""
+        return cls(CollationKeys(server_collation_keys(connection)))
+
+    @classmethod
+    def load(cls, connection) -> 'CustomerIndex':
+        """تحميل جميع العملاء غير المحذوفين مع مفاتيح المقارنة مرة واحدة"""
+        index = cls.for_connection(connection)
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                f"""SELECT id, name, phone, {collation_key_sql('name')}, {collation_key_sql('phone')}
+                    FROM Customer WHERE deletedAt IS NULL ORDER BY id"""
+            )
+            for customer_id, name, phone, name_key, phone_key in cursor:
+                index.add_with_keys(customer_id, name, phone, name_key, phone_key)
+        finally:
+            cursor.close()
+        return index
+
+    def reload(self, connection):
+        """إعادة تحميل الفهرس من قاعدة البيانات (بعد rollback لعملاء أضيفوا للفهرس)"""
+        fresh = self.load(connection)
+        self.keys, self.by_name, self.by_phone, self.phone_of = fresh.keys, fresh.by_name, fresh.by_phone, fresh.phone_of
+
+    def __len__(self) -> int:
+        return len(self.phone_of)
+
+    def prefetch(self, values: Iterable[str], connection=None):
+        """حساب مفاتيح الأسماء والهواتف مسبقاً (على connection إذا تم تمريره، مثلاً من thread آخر)"""
+        self.keys.prefetch(values, server_collation_keys(connection) if connection is not None else None)
+
+    def add(self, customer_id: Hashable, name: str, phone: str = None):
+        """إضافة عميل (موجود أو تم إدراجه للتو) إلى الفهرس بالاسم والهاتف كما خُزنا"""
+        name_key = self.keys[name]
+        if name_key is not None:
+            self.by_name.setdefault(name_key, customer_id)
+        self.phone_of[customer_id] = None
+        self.update_phone(customer_id, phone)
+
+    def add_with_keys(self, customer_id: Hashable, name: str, phone: Optional[str],
+                      name_key: Optional[str], phone_key: Optional[str]):
+        """إضافة عميل تم جلبه مع مفاتيح المقارنة (collation_key_sql) بدون حسابها مرة أخرى"""
+        self.keys.remember(name, name_key)
+        self.keys.remember(phone, phone_key)
+        self.add(customer_id, name, phone)
+
+    def update_phone(self, customer_id: Hashable, phone: str):
+        """تحديث هاتف عميل في الفهرس بعد UPDATE (بالقيمة التي كُتبت)"""
+        old_key = self.phone_of.get(customer_id)
+        if old_key is not None:
+            owners = self.by_phone[old_key]
+            owners.discard(customer_id)
+            if not owners:
+                del self.by_phone[old_key]
+
+        phone_key = self.keys[phone]
+        self.phone_of[customer_id] = phone_key
+        if phone_key is not None:
+            self.by_phone.setdefault(phone_key, set()).add(customer_id)
+
+    def find_by_name(self, name: str) -> Optional[Hashable]:
+        """البحث عن العميل بالاسم"""
+        if name is None:
+            return None
+        return self.by_name.get(self.keys[name])
+
+    def find_by_phone(self, phone: str) -> Optional[Hashable]:
+        """البحث عن العميل بالهاتف (بنفس القيمة التي كانت تُمرر للاستعلام)"""
+        if phone is None:
+            return None
+        owners = self.by_phone.get(self.keys[phone])
+        return min(owners) if owners else None
+
+    def find(self, name: str, phone: str = None) -> Optional[Hashable]:
+        """البحث بالاسم أولاً ثم بالهاتف (إذا لم يكن '.')"""
+        customer_id = self.find_by_name(name)
+        if customer_id is None and phone and phone != '.':
+            customer_id = self.find_by_phone(phone)
+        return customer_id
+
+
+def plan_customer_upserts(rows: List[Tuple[Dict, Optional[str]]],
+                          index: CustomerIndex) -> Tuple[List[List], Dict[int, str]]:
+    """مطابقة صفوف العملاء في الذاكرة بنفس منطق get_or_create_customer
+    
+    index يحتوي على العملاء الموجودين بمراجع ('db', id)، ويُضاف له العملاء الجدد بمراجع ('new', index).
+    يُرجع (قيم العملاء الجدد بالترتيب، تحديثات الهاتف للعملاء الموجودين {id: phone}).
+    """
+    new_customers = []
+    phone_updates = {}
+    
+    for customer_data, clean_phone_num in rows:
+        name = customer_data['name'].strip()
+        
+        # Found by name: update phone if provided
+        ref = index.find_by_name(name)
+        if ref is not None:
+            if clean_phone_num:
+                index.update_phone(ref, clean_phone_num)
+                if ref[0] == 'new':
+                    new_customers[ref[1]][1] = clean_phone_num
+                else:
+                    phone_updates[ref[1]] = clean_phone_num
+            continue
+        
+        # Found by phone
+        if clean_phone_num and index.find_by_phone(clean_phone_num) is not None:
+            continue
+        
+        # Create new customer
+        ref = ('new', len(new_customers))
+        new_customers.append([
+            name,
+            clean_phone_num,
+            customer_data['address'],
+            build_customer_custom_fields(customer_data['notes'], customer_data['csv_order'])
+        ])
+        index.add(ref, name, clean_phone_num)
+    
+    return new_customers, phone_updates
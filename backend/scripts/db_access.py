@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Database Access - الاتصال المشترك بقاعدة البيانات لسكربتات الاستيراد والتصدير
+يقرأ الإعدادات من نفس متغيرات البيئة (DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
+ويوفر pool اتصالات منفصل لكل قاعدة بيانات: FZ (الهدف) و temp_import_db (النظام القديم)
+"""
+
+import os
+import sys
+import time
+import weakref
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import mysql.connector
+    from mysql.connector import pooling
+except ImportError:
+    print("❌ mysql-connector-python غير مثبت!")
+    print("📦 يرجى تثبيته باستخدام: pip3 install mysql-connector-python")
+    sys.exit(1)
+
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'user': os.getenv('DB_USER', 'root'),
+    'password': os.getenv('DB_PASSWORD', ''),
+    'database': os.getenv('DB_NAME', 'FZ'),
+    'port': int(os.getenv('DB_PORT', 3306)),
+    'charset': 'utf8mb4',
+    'collation': 'utf8mb4_unicode_ci'
+}
+
+# قاعدة البيانات المؤقتة التي يُستورد إليها SQL dump للنظام القديم
+LEGACY_DATABASE = 'temp_import_db'
+
+# عدد الاتصالات في كل pool
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+
+# pool لكل (process, قاعدة بيانات): الاتصالات لا تُشارك بين العمليات بعد fork
+pools: Dict[Tuple[int, str], 'pooling.MySQLConnectionPool'] = {}
+
+
+# سياسة الـ commit في مسارات الصف الواحد: commit كل N صف أو كل T ثانية (1 = commit بعد كل صف)
+COMMIT_EVERY_ROWS = int(os.getenv('COMMIT_EVERY_ROWS', 1))
+COMMIT_EVERY_SECONDS = float(os.getenv('COMMIT_EVERY_SECONDS', 0))
+
+# عدد مرات التنفيذ والزمن التراكمي (بالثواني) لكل جملة مجهزة: {الاسم: [العدد، الزمن]}
+STATEMENT_STATS: Dict[str, List] = {}
+
+# سجل الجمل المجهزة لكل اتصال (يُحذف مع الاتصال)
+registries = weakref.WeakKeyDictionary()
+
+
+def connection_config(database: Optional[str] = None) -> Dict:
+    """إعدادات الاتصال لقاعدة بيانات معينة (أو للخادم فقط إذا كانت None)"""
+    config = dict(DB_CONFIG)
+    del config['database']
+    if database:
+        config['database'] = database
+    return config
+
+
+def get_pool(database: Optional[str] = None) -> 'pooling.MySQLConnectionPool':
+    """pool الاتصالات لقاعدة البيانات (يُنشأ عند أول استخدام)"""
+    database = database or DB_CONFIG['database']
+    key = (os.getpid(), database)
+    pool = pools.get(key)
+    if pool is None:
+        pool = pooling.MySQLConnectionPool(
+            pool_name=f"{database}_{os.getpid()}",
+            pool_size=DB_POOL_SIZE,
+            **connection_config(database)
+        )
+        pools[key] = pool
+    return pool
+
+
+def connect(database: Optional[str] = None):
+    """اتصال من pool قاعدة البيانات الهدف (FZ) أو قاعدة أخرى؛ close() يعيده إلى الـ pool"""
+    return get_pool(database).get_connection()
+
+
+def connect_legacy():
+    """اتصال من pool قاعدة بيانات النظام القديم temp_import_db"""
+    return connect(LEGACY_DATABASE)
+
+
+def connect_local_infile(database: Optional[str] = None):
+    """اتصال مباشر (خارج الـ pool) يسمح بـ LOAD DATA LOCAL INFILE"""
+    return mysql.connector.connect(allow_local_infile=True,
+                                   **connection_config(database or DB_CONFIG['database']))
+
+
+def connect_server():
+    """اتصال بالخادم بدون تحديد قاعدة بيانات (لإنشاء temp_import_db أو حذفها)"""
+    return mysql.connector.connect(**connection_config())
+
+
+class StatementRegistry:
+    """prepared cursors لاتصال واحد
+
+    كل جملة تُجهز على الخادم مرة واحدة (عند أول تنفيذ) ويُعاد استخدام نفس الـ cursor
+    لبقية التشغيل، مع تسجيل عدد مرات التنفيذ والزمن في STATEMENT_STATS.
+    """
+
+    def __init__(self, connection):
+        # مرجع ضعيف حتى لا يبقى الاتصال حياً بسبب السجل نفسه
+        self.connection = weakref.ref(connection)
+        self.cursors = {}
+
+    def run(self, name: str, sql: str, params: Tuple = ()):
+        """تنفيذ جملة مجهزة وإرجاع (الـ cursor، الصفوف أو None)"""
+        cursor = self.cursors.get(name)
+        if cursor is None:
+            cursor = self.cursors[name] = self.connection().cursor(prepared=True)
+        started = time.perf_counter()
+        try:
+            cursor.execute(sql, params)
+            # قراءة كل النتائج حتى يبقى الاتصال جاهزاً للجملة التالية
+            rows = cursor.fetchall() if cursor.description else None
+        finally:
+            stats = STATEMENT_STATS.setdefault(name, [0, 0.0])
+            stats[0] += 1
+            stats[1] += time.perf_counter() - started
+        return cursor, rows
+
+    def fetchone(self, name: str, sql: str, params: Tuple = ()):
+        """أول صف من نتيجة SELECT أو None"""
+        _, rows = self.run(name, sql, params)
+        return rows[0] if rows else None
+
+    def insert(self, name: str, sql: str, params: Tuple = ()) -> int:
+        """تنفيذ INSERT وإرجاع المعرف الجديد"""
+        cursor, _ = self.run(name, sql, params)
+        return cursor.lastrowid
+
+    def execute(self, name: str, sql: str, params: Tuple = ()) -> int:
+        """تنفيذ UPDATE/DELETE وإرجاع عدد الصفوف المتأثرة"""
+        cursor, _ = self.run(name, sql, params)
+        return cursor.rowcount
+
+
+def prepared_statements(connection) -> StatementRegistry:
+    """سجل الجمل المجهزة للاتصال (يُنشأ مرة واحدة لكل اتصال)"""
+    registry = registries.get(connection)
+    if registry is None:
+        registry = registries[connection] = StatementRegistry(connection)
+    return registry
+
+
+def merge_statement_stats(stats: Dict[str, List]):
+    """إضافة إحصائيات جمل مجهزة من عملية أخرى (worker) إلى إحصائيات هذه العملية"""
+    for name, (count, seconds) in stats.items():
+        total = STATEMENT_STATS.setdefault(name, [0, 0.0])
+        total[0] += count
+        total[1] += seconds
+
+
+def print_statement_stats():
+    """طباعة عدد مرات التنفيذ والزمن التراكمي لكل جملة مجهزة"""
+    if not STATEMENT_STATS:
+        return
+    print("📈 الجمل المجهزة (prepared statements):")
+    for name, (count, seconds) in sorted(STATEMENT_STATS.items(), key=lambda item: item[1][1], reverse=True):
+        print(f"  {name}: {count} تنفيذ، {seconds * 1000:.0f} ms ({seconds * 1000 / count:.2f} ms لكل تنفيذ)")
+
+
+class BatchRollback(Exception):
+    """تُرفع من CommitPolicy.rollback() داخل دفعة حتى تُعاد الدفعة صفاً صفاً"""
+
+
+class CommitPolicy:
+    """تجميع الصفوف في transactions من N صف أو T ثانية
+
+    الدوال تستدعي commit() و rollback() من السياسة بدلاً من الاتصال مباشرة:
+    - بعد كل صف: commit() لا يفعل شيئاً داخل الدفعة، والـ commit الفعلي عند اكتمال الدفعة.
+    - عند خطأ: rollback() يلغي الدفعة كاملة ثم تُعاد صفوفها صفاً صفاً (commit بعد كل صف)
+      لتخطي السجلات التالفة فقط كما في الاستيراد العادي.
+    """
+
+    def __init__(self, connection, every_rows: int = COMMIT_EVERY_ROWS, every_seconds: float = COMMIT_EVERY_SECONDS,
+                 on_rollback: Optional[Callable[[], None]] = None):
+        self.connection = connection
+        self.every_rows = max(1, every_rows)
+        self.every_seconds = every_seconds
+        # يُستدعى بعد إلغاء دفعة (مثلاً لإعادة تحميل فهرس في الذاكرة أضيفت له صفوف ملغاة)
+        self.on_rollback = on_rollback
+        self.pending: List = []
+        self.batch_started = 0.0
+        self.replaying = False
+        self.commits = 0
+        self.replays = 0
+
+    @property
+    def per_row(self) -> bool:
+        return self.replaying or self.every_rows <= 1
+
+    def commit(self):
+        """commit بعد صف واحد (فعلي فقط في وضع الصف الواحد أو أثناء إعادة دفعة)"""
+        if self.per_row:
+            self.connection.commit()
+
+    def rollback(self):
+        """إلغاء الصف الحالي؛ داخل دفعة يتم إلغاء الدفعة كاملة وإعادتها صفاً صفاً"""
+        self.connection.rollback()
+        if not self.per_row:
+            raise BatchRollback()
+
+    def is_due(self) -> bool:
+        if len(self.pending) >= self.every_rows:
+            return True
+        return self.every_seconds > 0 and time.monotonic() - self.batch_started >= self.every_seconds
+
+    def run(self, items: Iterable, process: Callable) -> Iterator:
+        """معالجة الصفوف بـ process(item) وإرجاع نتائجها بعد أن يتم حفظها (commit) فقط"""
+        for item in items:
+            if not self.pending:
+                self.batch_started = time.monotonic()
+            try:
+                result = process(item)
+            except BatchRollback:
+                self.pending.append((item, None))
+                yield from self.replay(process)
+                continue
+            self.pending.append((item, result))
+            if self.is_due():
+                yield from self.flush()
+        yield from self.flush()
+
+    def flush(self) -> List:
+        """commit للدفعة الحالية وإرجاع نتائج صفوفها"""
+        results = [result for _, result in self.pending]
+        if self.pending and not self.per_row:
+            self.connection.commit()
+            self.commits += 1
+        self.pending = []
+        return results
+
+    def replay(self, process: Callable) -> List:
+        """إعادة صفوف الدفعة الملغاة صفاً صفاً"""
+        items = [item for item, _ in self.pending]
+        self.pending = []
+        self.replays += 1
+        print(f"⚠️  فشلت دفعة من {len(items)} صف، جاري الإعادة صفاً صفاً...")
+        if self.on_rollback:
+            self.on_rollback()
+        self.replaying = True
+        try:
+            results = [process(item) for item in items]
+            self.connection.commit()
+        finally:
+            self.replaying = False
+        return results
+
+
+class RowTransaction:
+    """كل كتابات سجل واحد (عدة كيانات مع صف سجل الاستيراد) في commit واحد
+
+    تُمرر للدوال بدلاً من CommitPolicy أو الاتصال: commit() بعد كل كيان لا يفعل شيئاً،
+    و rollback() يلغي السجل كاملاً (داخل دفعة CommitPolicy تُلغى الدفعة وتُعاد صفاً صفاً)،
+    و commit_row() يحفظ السجل عبر transaction الأصلية بعد آخر كيان.
+    """
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+        self.rolled_back = False
+
+    def commit(self):
+        """لا شيء: الحفظ بعد اكتمال السجل في commit_row()"""
+
+    def rollback(self):
+        self.rolled_back = True
+        self.transaction.rollback()
+
+    def commit_row(self):
+        self.transaction.commit()
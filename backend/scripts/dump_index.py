@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+فهرس ملف SQL Dump للنظام القديم
+يقرأ الملف مرة واحدة عبر mmap ويحفظ بجانبه ملف .index.json يحتوي على
+مواضع (byte offsets) جملة CREATE TABLE وجمل INSERT لكل جدول مع hash للمحتوى،
+حتى تنتقل التشغيلات التالية مباشرة للجداول المطلوبة وتتخطى الملفات التي لم تتغير
+"""
+
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import re
+import subprocess
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+INDEX_VERSION = 1
+
+# بداية كل جملة أو تعليق يفصل بين أجزاء الـ dump (mysqldump و phpMyAdmin)
+STATEMENT_RE = re.compile(
+    rb'^(?:(CREATE TABLE|INSERT INTO|ALTER TABLE) `([^`]+)`'
+    rb'|UNLOCK TABLES|LOCK TABLES|DROP TABLE|CREATE |SET |COMMIT|START TRANSACTION|DELIMITER|--|/\*)',
+    re.M
+)
+
+HASH_BLOCK_SIZE = 16 * 1024 * 1024
+
+# إيقاف الاستيراد عند خطأ mysql CLI (DUMP_LOAD_STRICT=1)؛ افتراضياً يُطبع الخطأ ويستمر الاستيراد
+DUMP_LOAD_STRICT = os.getenv('DUMP_LOAD_STRICT', '0') == '1'
+
+# جدول داخل temp_import_db يسجل hash كل جدول تم تحميله من الـ dump
+LOADED_TABLES_DDL = """CREATE TABLE IF NOT EXISTS _dump_tables (
+    name VARCHAR(64) PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL,
+    loaded_at DATETIME NOT NULL
+)"""
+
+
+def sha256_of(data, start: int = 0, end: Optional[int] = None) -> str:
+    """hash لجزء من الملف (mmap) على أجزاء لتجنب نسخ الملف كاملاً"""
+    end = len(data) if end is None else end
+    digest = hashlib.sha256()
+    for position in range(start, end, HASH_BLOCK_SIZE):
+        digest.update(data[position:min(position + HASH_BLOCK_SIZE, end)])
+    return digest.hexdigest()
+
+
+def table_ranges(entry: Dict, include_alter: bool = False) -> List[Tuple[int, int]]:
+    """نطاقات (start, end) لجدول واحد في الفهرس"""
+    ranges = [tuple(entry[key]) for key in ('create', 'data') if entry[key]]
+    if include_alter:
+        ranges.extend(tuple(item) for item in entry['alter'])
+    return ranges
+
+
+class DumpIndex:
+    """مواضع جداول ملف الـ dump
+
+    {'table': {'create': [start, end], 'data': [start, end], 'alter': [[start, end], ...], 'sha256': ...}}
+    """
+
+    def __init__(self, dump_file: str, data: Dict):
+        self.dump_file = dump_file
+        self.data = data
+
+    @property
+    def sha256(self) -> str:
+        return self.data['sha256']
+
+    @property
+    def tables(self) -> Dict[str, Dict]:
+        return self.data['tables']
+
+    @staticmethod
+    def index_path(dump_file: str) -> str:
+        return dump_file + '.index.json'
+
+    @classmethod
+    def build(cls, dump_file: str) -> 'DumpIndex':
+        """بناء الفهرس بمسح الملف عبر mmap"""
+        stat = os.stat(dump_file)
+        tables: Dict[str, Dict] = {}
+        order: List[str] = []
+
+        with open(dump_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            matches = list(STATEMENT_RE.finditer(data))
+            boundaries = [match.start() for match in matches] + [len(data)]
+
+            for position, match in enumerate(matches):
+                if not match.group(1):
+                    continue
+                statement = match.group(1)
+                table = match.group(2).decode('utf-8')
+                end = boundaries[position + 1]
+                entry = tables.get(table)
+                if entry is None:
+                    entry = tables[table] = {'create': None, 'data': None, 'alter': []}
+                    order.append(table)
+                if statement == b'CREATE TABLE':
+                    entry['create'] = [match.start(), end]
+                elif statement == b'INSERT INTO':
+                    # جمل INSERT للجدول متتالية في الـ dump: نطاق واحد من أولها إلى نهاية آخرها
+                    if entry['data'] is None:
+                        entry['data'] = [match.start(), end]
+                    else:
+                        entry['data'][1] = end
+                else:
+                    # الفهارس و AUTO_INCREMENT في dump الخاص بـ phpMyAdmin تأتي في نهاية الملف
+                    entry['alter'].append([match.start(), end])
+
+            for table, entry in tables.items():
+                digest = hashlib.sha256()
+                for start, end in table_ranges(entry, include_alter=True):
+                    digest.update(sha256_of(data, start, end).encode())
+                entry['sha256'] = digest.hexdigest()
+
+            file_sha256 = sha256_of(data)
+
+        return cls(dump_file, {
+            'version': INDEX_VERSION,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': file_sha256,
+            'order': order,
+            'tables': tables,
+        })
+
+    @classmethod
+    def load(cls, dump_file: str) -> 'DumpIndex':
+        """قراءة الفهرس من الملف الجانبي، وإعادة بنائه فقط إذا تغير الـ dump"""
+        index_file = cls.index_path(dump_file)
+        stat = os.stat(dump_file)
+        cached = None
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                cached = None
+
+        if cached and cached.get('version') == INDEX_VERSION and cached.get('size') == stat.st_size:
+            if cached.get('mtime') == stat.st_mtime:
+                return cls(dump_file, cached)
+            # تغير وقت التعديل فقط: نتحقق من الـ hash قبل إعادة بناء الفهرس
+            with open(dump_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                unchanged = sha256_of(data) == cached.get('sha256')
+            if unchanged:
+                cached['mtime'] = stat.st_mtime
+                index = cls(dump_file, cached)
+                index.save()
+                return index
+
+        index = cls.build(dump_file)
+        index.save()
+        return index
+
+    def save(self):
+        """حفظ الفهرس بجانب ملف الـ dump"""
+        try:
+            with open(self.index_path(self.dump_file), 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=1)
+        except OSError as e:
+            print(f"⚠️  تعذر حفظ فهرس الـ dump: {e}")
+
+    def ranges_for(self, tables: Iterable[str], include_alter: bool = False) -> List[Tuple[int, int]]:
+        """مواضع جمل الجداول المطلوبة بترتيبها في الملف"""
+        wanted = set(tables)
+        ranges = []
+        for table in self.data['order']:
+            if table in wanted:
+                ranges.extend(table_ranges(self.tables[table], include_alter))
+        return sorted(ranges)
+
+    def iter_lines(self, tables: Iterable[str]) -> Iterator[str]:
+        """أسطر جمل الجداول المطلوبة فقط (بالانتقال مباشرة لمواضعها)"""
+        with open(self.dump_file, 'rb') as f:
+            for start, end in self.ranges_for(tables):
+                f.seek(start)
+                position = start
+                while position < end:
+                    line = f.readline()
+                    if not line:
+                        break
+                    position += len(line)
+                    yield line.decode('utf-8')
+
+    def write_tables(self, out, tables: Iterable[str]):
+        """كتابة جمل الجداول المطلوبة (كما هي في الـ dump) إلى ملف/pipe مفتوح
+
+        كل جدول يُحذف أولاً حتى يمكن إعادة تحميل الجداول التي تغيرت فقط.
+        """
+        wanted = set(tables)
+        out.write(b"SET NAMES utf8mb4;\nSET FOREIGN_KEY_CHECKS=0;\n")
+        with open(self.dump_file, 'rb') as f:
+            for table in self.data['order']:
+                if table not in wanted:
+                    continue
+                out.write(f"DROP TABLE IF EXISTS `{table}`;\n".encode('utf-8'))
+                for start, end in table_ranges(self.tables[table], include_alter=True):
+                    f.seek(start)
+                    remaining = end - start
+                    while remaining > 0:
+                        block = f.read(min(HASH_BLOCK_SIZE, remaining))
+                        if not block:
+                            break
+                        out.write(block)
+                        remaining -= len(block)
+                    out.write(b"\n")
+
+
+class DumpLoadError(Exception):
+    """فشل mysql CLI في تحميل جداول الـ dump مع DUMP_LOAD_STRICT=1 (الجداول لا تُسجل كمحملة)"""
+
+
+def mysql_cli_command(db_config: Dict, database: str = 'temp_import_db') -> str:
+    """أمر mysql CLI المستخدم لاستيراد جمل الـ dump"""
+    mysql_cmd = f"/opt/lampp/bin/mysql -u {db_config['user']}"
+    if db_config['password']:
+        mysql_cmd += f" -p{db_config['password']}"
+    return mysql_cmd + f" {database}"
+
+
+def load_tables_into_temp_db(connection, index: DumpIndex, tables: Iterable[str], mysql_cmd: str,
+                             strict: bool = DUMP_LOAD_STRICT) -> List[str]:
+    """تحميل الجداول المطلوبة فقط إلى temp_import_db وتخطي الجداول التي لم يتغير hash لها
+
+    mysql_cmd هو أمر mysql CLI متصل بقاعدة temp_import_db. يُرجع أسماء الجداول التي تم تحميلها.
+    إذا انتهى mysql CLI بخطأ يُطبع التحذير ويستمر الاستيراد بما تم تحميله (أو تُرفع DumpLoadError مع strict)،
+    وفي الحالتين لا يُسجل hash الجداول فيُعاد تحميلها في التشغيل التالي.
+    """
+    tables = [table for table in tables if table in index.tables]
+    cursor = connection.cursor()
+    try:
+        cursor.execute("CREATE DATABASE IF NOT EXISTS temp_import_db CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+        cursor.execute("USE temp_import_db")
+        cursor.execute(LOADED_TABLES_DDL)
+        cursor.execute("SELECT name, sha256 FROM _dump_tables")
+        loaded = dict(cursor.fetchall())
+
+        stale = [table for table in tables if loaded.get(table) != index.tables[table]['sha256']]
+        if not stale:
+            return []
+
+        # الجداول التي سيُعاد تحميلها لا تبقى مسجلة بالـ hash القديم إذا توقف التحميل في منتصفه
+        cursor.execute(
+            f"DELETE FROM _dump_tables WHERE name IN ({', '.join(['%s'] * len(stale))})", stale
+        )
+        connection.commit()
+
+        # تمرير جمل الجداول المطلوبة فقط إلى mysql CLI بدون نسخ الملف في الذاكرة
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(mysql_cmd, shell=True, stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=stderr)
+            try:
+                index.write_tables(process.stdin, stale)
+            except BrokenPipeError:
+                # mysql CLI توقف قبل قراءة كل الجمل: يتم الإبلاغ برمز الخروج ورسالة الخطأ أدناه
+                pass
+            finally:
+                with contextlib.suppress(BrokenPipeError):
+                    process.stdin.close()
+                process.wait()
+            if process.returncode != 0:
+                stderr.seek(0)
+                message = stderr.read().decode('utf-8', 'replace')[:300].strip()
+                if strict:
+                    raise DumpLoadError(
+                        f"فشل استيراد الجداول {', '.join(stale)} (mysql exit {process.returncode}): {message}"
+                    )
+                # نحاول المتابعة على أي حال
+                print(f"⚠️  تحذير في استيراد SQL dump (mysql exit {process.returncode}): {message}")
+                return stale
+
+        now = datetime.now()
+        cursor.executemany(
+            "REPLACE INTO _dump_tables (name, sha256, loaded_at) VALUES (%s, %s, %s)",
+            [(table, index.tables[table]['sha256'], now) for table in stale]
+        )
+        connection.commit()
+        return stale
+    finally:
+        cursor.close()
+
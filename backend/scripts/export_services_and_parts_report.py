@@ -13,8 +13,10 @@ import os
 import sys
 import json
 import csv
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Tuple
 from collections import defaultdict
 
 try:
@@ -25,15 +27,8 @@ except ImportError:
     print("📦 يرجى تثبيته باستخدام: pip3 install mysql-connector-python")
     sys.exit(1)
 
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'user': os.getenv('DB_USER', 'root'),
-    'password': os.getenv('DB_PASSWORD', ''),
-    'database': 'temp_import_db',  # قاعدة البيانات المؤقتة
-    'port': int(os.getenv('DB_PORT', 3306)),
-    'charset': 'utf8mb4',
-    'collation': 'utf8mb4_unicode_ci'
-}
+from db_access import DB_CONFIG, connect_legacy, connect_server
+from dump_index import DumpIndex, load_tables_into_temp_db, mysql_cli_command
 
 SQL_DUMP_FILE = os.path.join(
     os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
@@ -47,45 +42,170 @@ OUTPUT_DIR = os.path.join(
     'EXPORT_REPORTS'
 )
 
+# جداول النظام القديم التي يحتاجها كل تقرير (تُستورد من الـ dump عند الحاجة فقط)
+EXPORT_TABLES = {
+    'services': ('invoice_services', 'invoices', 'clients'),
+    'products': ('products',),
+    'parts': ('invoices',),
+    'repairs': ('invoices', 'clients', 'invoice_status', 'status'),
+}
 
-def ensure_temp_db_imported():
-    """التأكد من استيراد قاعدة البيانات المؤقتة"""
-    import subprocess
-    
+# التقارير المطلوب تصديرها (مفصولة بفواصل)، الافتراضي: جميع التقارير
+EXPORTS = [name.strip() for name in os.getenv('EXPORTS', ','.join(EXPORT_TABLES)).split(',') if name.strip()]
+
+# عدد العمليات (processes) لتصدير التقارير بالتوازي، 1 = تصدير متتالي
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', 1))
+
+# عدد الصفوف التي تُجلب من الخادم في كل مرة عند قراءة التقارير بشكل متدفق
+STREAM_FETCH_SIZE = int(os.getenv('STREAM_FETCH_SIZE', 1000))
+
+# طريقة تجميع تقارير الملخص: 'python' (قراءة الصفوف وتجميعها) أو 'sql' (GROUP BY على الخادم)
+REPORT_AGGREGATION = os.getenv('REPORT_AGGREGATION', 'python')
+
+# في وضع sql: تصدير ملفات التفاصيل (services_details.csv, repairs_details.csv) اختياري
+EXPORT_DETAILS = os.getenv('EXPORT_DETAILS', '0') == '1'
+
+SERVICES_DETAILS_SQL = """
+            SELECT 
+                isv.id,
+                isv.title as service_name,
+                isv.price as service_price,
+                isv.invoice_id,
+                isv.created_at,
+                i.date as invoice_date,
+                i.client_id,
+                c.name as client_name
+            FROM invoice_services isv
+            LEFT JOIN invoices i ON isv.invoice_id = i.id
+            LEFT JOIN clients c ON i.client_id = c.id
+            ORDER BY isv.id
+        """
+
+
+def strip_sql(expr: str) -> str:
+    """تعبير SQL يعادل str.strip() في وضع python (TRIM يحذف المسافة فقط وليس \t و \r و \n)
+
+    [[:space:]] يشمل المسافات البيضاء في Unicode مثل str.isspace، عدا فواصل التحكم \x1c-\x1f
+    التي يحذفها Python فقط.
+    """
+    return f"REGEXP_REPLACE({expr}, '^[[:space:]]+|[[:space:]]+$', '')"
+
+
+# تجميع الخدمات على الخادم: المقارنة ثنائية (BINARY) مثل مفاتيح القاموس في وضع python،
+# و first_seen من أول صف (أصغر id) لكل خدمة
+SERVICES_SUMMARY_SQL = f"""
+            SELECT 
+                s.service_name,
+                s.count,
+                s.total_revenue,
+                s.min_price,
+                s.max_price,
+                i.date as first_seen_date,
+                f.invoice_id as first_invoice_id
+            FROM (
+                SELECT 
+                    MIN({strip_sql('title')}) as service_name,
+                    COUNT(*) as count,
+                    SUM(COALESCE(price, 0)) as total_revenue,
+                    MIN(COALESCE(price, 0)) as min_price,
+                    MAX(COALESCE(price, 0)) as max_price,
+                    MIN(id) as first_id
+                FROM invoice_services
+                WHERE {strip_sql('title')} <> ''
+                GROUP BY BINARY {strip_sql('title')}
+            ) s
+            JOIN invoice_services f ON f.id = s.first_id
+            LEFT JOIN invoices i ON f.invoice_id = i.id
+            ORDER BY s.count DESC, s.first_id
+        """
+
+# آخر حالة لكل فاتورة (صف واحد لكل فاتورة بدلاً من صف لكل تغيير حالة)،
+# بنفس ترتيب سكربت استيراد الفواتير: created_at ثم id تنازلياً
+LATEST_INVOICE_STATUS_SQL = """
+                SELECT invoice_id, status_id FROM (
+                    SELECT invoice_id, status_id,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY invoice_id ORDER BY created_at DESC, id DESC
+                           ) AS rn
+                    FROM invoice_status
+                ) ranked
+                WHERE rn = 1"""
+
+REPAIRS_FROM_SQL = """
+            FROM invoices i
+            LEFT JOIN clients c ON i.client_id = c.id
+            LEFT JOIN (""" + LATEST_INVOICE_STATUS_SQL + """
+            ) ins ON i.id = ins.invoice_id
+            LEFT JOIN status s ON ins.status_id = s.id
+            WHERE i.id IS NOT NULL"""
+
+# فهارس تُنشأ في temp_import_db بعد تحميل الجدول من الـ dump
+TEMP_DB_INDEXES = {
+    # يغطي PARTITION BY / ORDER BY في LATEST_INVOICE_STATUS_SQL
+    'invoice_status': "CREATE INDEX idx_invoice_status_latest ON invoice_status (invoice_id, created_at, id)",
+}
+
+REPAIRS_DETAILS_SQL = """
+            SELECT 
+                i.id as invoice_id,
+                i.date as invoice_date,
+                i.entery_at,
+                i.exit_at,
+                i.problem_description,
+                i.device_type,
+                i.brand,
+                i.device_model,
+                i.total,
+                i.paid,
+                i.due,
+                i.client_id,
+                c.name as client_name,
+                s.name as status_name""" + REPAIRS_FROM_SQL + """
+            ORDER BY i.id
+        """
+
+
+def repairs_group_sql(column: str) -> str:
+    """عدد الإصلاحات لكل قيمة من عمود في invoices (نوع الجهاز أو العلامة التجارية)"""
+    name = strip_sql(f'i.{column}')
+    return f"""
+            SELECT MIN({name}) as {column}, COUNT(*) as count""" + REPAIRS_FROM_SQL + f"""
+                AND {name} <> ''
+            GROUP BY BINARY {name}
+            ORDER BY count DESC, MIN(i.id)
+        """
+
+
+# وصف كل تقرير في الملخص النهائي: (العنوان، وحدة العد)
+EXPORT_LABELS = {
+    'services': ('الخدمات', 'خدمة فريدة'),
+    'products': ('قطع الغيار من products', 'قطعة'),
+    'parts': ('قطع الغيار من invoices', 'قطعة فريدة'),
+    'repairs': ('الإصلاحات', 'إصلاح'),
+}
+
+
+def ensure_temp_db_imported(tables: List[str]):
+    """التأكد من استيراد جداول قاعدة البيانات المؤقتة المطلوبة
+
+    يستخدم فهرس الـ dump لاستيراد الجداول المطلوبة فقط، ويعيد استيراد
+    الجدول فقط إذا تغير محتواه في ملف الـ dump منذ آخر استيراد.
+    """
     print("📖 التحقق من قاعدة البيانات المؤقتة...")
     
     connection = None
     try:
-        connection = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            port=DB_CONFIG['port']
-        )
+        index = DumpIndex.load(SQL_DUMP_FILE)
         
-        cursor = connection.cursor()
-        cursor.execute("SHOW DATABASES LIKE 'temp_import_db'")
-        result = cursor.fetchone()
+        connection = connect_server()
         
-        if not result:
-            print("  📦 قاعدة البيانات المؤقتة غير موجودة، جاري الاستيراد...")
-            cursor.execute("CREATE DATABASE temp_import_db CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
-            cursor.execute("USE temp_import_db")
-            
-            # استيراد SQL dump
-            mysql_cmd = f"/opt/lampp/bin/mysql -u {DB_CONFIG['user']}"
-            if DB_CONFIG['password']:
-                mysql_cmd += f" -p{DB_CONFIG['password']}"
-            mysql_cmd += " temp_import_db"
-            
-            with open(SQL_DUMP_FILE, 'r', encoding='utf-8') as f:
-                subprocess.run(mysql_cmd, shell=True, stdin=f, capture_output=True, text=True, check=False)
-            
-            print("  ✅ تم استيراد قاعدة البيانات المؤقتة")
+        loaded = load_tables_into_temp_db(connection, index, tables, mysql_cli_command(DB_CONFIG))
+        if loaded:
+            print(f"  ✅ تم استيراد الجداول: {', '.join(loaded)}")
+            create_temp_db_indexes(connection, loaded)
         else:
-            print("  ✅ قاعدة البيانات المؤقتة موجودة")
+            print("  ✅ قاعدة البيانات المؤقتة محدثة")
         
-        cursor.close()
         return True
         
     except Exception as e:
@@ -96,6 +216,21 @@ def ensure_temp_db_imported():
             connection.close()
 
 
+def create_temp_db_indexes(connection, tables: List[str]):
+    """إنشاء فهارس التقارير على الجداول التي تم تحميلها للتو"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("USE temp_import_db")
+        for table in tables:
+            if table in TEMP_DB_INDEXES:
+                try:
+                    cursor.execute(TEMP_DB_INDEXES[table])
+                except Error as e:
+                    print(f"  ⚠️  تعذر إنشاء فهرس {table}: {e}")
+    finally:
+        cursor.close()
+
+
 def parse_json_field(value: str) -> Dict:
     """تحليل حقل JSON"""
     if not value or value == 'NULL' or value == 'null':
@@ -109,106 +244,147 @@ def parse_json_field(value: str) -> Dict:
         return {}
 
 
+def write_rows_stream(cursor, file_path: str) -> int:
+    """كتابة نتيجة استعلام منفذ إلى ملف CSV على دفعات بدون الاحتفاظ بالصفوف في الذاكرة"""
+    count = 0
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = None
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+                writer.writeheader()
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def write_services_report(services_file: str, services: List[Dict]):
+    """حفظ تقرير الخدمات الفريدة (مرتبة حسب العدد)"""
+    with open(services_file, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=[
+            'service_name', 'count', 'total_revenue', 'avg_price', 
+            'min_price', 'max_price', 'first_seen_date', 'first_invoice_id'
+        ])
+        writer.writeheader()
+        
+        for service_data in services:
+            writer.writerow({
+                'service_name': service_data['service_name'],
+                'count': service_data['count'],
+                'total_revenue': f"{service_data['total_revenue']:.2f}",
+                'avg_price': f"{service_data['total_revenue'] / service_data['count']:.2f}",
+                'min_price': f"{service_data['min_price']:.2f}",
+                'max_price': f"{service_data['max_price']:.2f}",
+                'first_seen_date': service_data['first_seen_date'],
+                'first_invoice_id': service_data['first_invoice_id']
+            })
+
+
+def write_counts_report(file_path: str, column: str, counts: List[Tuple[str, int]]):
+    """حفظ تقرير عدد لكل قيمة (أنواع الأجهزة أو العلامات التجارية)"""
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=[column, 'count'])
+        writer.writeheader()
+        for value, count in counts:
+            writer.writerow({column: value, 'count': count})
+
+
+def export_services_grouped(cursor) -> List[Dict]:
+    """تصدير تقرير الخدمات بتجميع GROUP BY على الخادم، والتفاصيل فقط عند EXPORT_DETAILS"""
+    cursor.execute(SERVICES_SUMMARY_SQL)
+    services = cursor.fetchall()
+    
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    services_file = os.path.join(OUTPUT_DIR, 'services_report.csv')
+    write_services_report(services_file, services)
+    print(f"  ✅ تم حفظ {len(services)} خدمة فريدة في: {services_file}")
+    
+    if EXPORT_DETAILS:
+        services_details_file = os.path.join(OUTPUT_DIR, 'services_details.csv')
+        cursor.execute(SERVICES_DETAILS_SQL)
+        count = write_rows_stream(cursor, services_details_file)
+        print(f"  ✅ تم حفظ التفاصيل الكاملة ({count} خدمة) في: {services_details_file}")
+    
+    return services
+
+
 def export_services():
     """تصدير الخدمات من invoice_services"""
     print("\n📋 جاري تصدير الخدمات...")
     
-    connection = mysql.connector.connect(
-        host=DB_CONFIG['host'],
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password'],
-        database=DB_CONFIG['database'],
-        port=DB_CONFIG['port']
-    )
+    connection = connect_legacy()
     
-    cursor = connection.cursor(dictionary=True)
+    # cursor غير مخزن (unbuffered): الصفوف تُقرأ من الخادم على دفعات بدلاً من fetchall
+    cursor = connection.cursor(dictionary=True, buffered=False)
     
     try:
+        if REPORT_AGGREGATION == 'sql':
+            return export_services_grouped(cursor)
+        
         # قراءة جميع الخدمات
-        cursor.execute("""
-            SELECT 
-                isv.id,
-                isv.title as service_name,
-                isv.price as service_price,
-                isv.invoice_id,
-                isv.created_at,
-                i.date as invoice_date,
-                i.client_id,
-                c.name as client_name
-            FROM invoice_services isv
-            LEFT JOIN invoices i ON isv.invoice_id = i.id
-            LEFT JOIN clients c ON i.client_id = c.id
-            ORDER BY isv.id
-        """)
+        cursor.execute(SERVICES_DETAILS_SQL)
         
-        services = cursor.fetchall()
-        print(f"  ✅ تم العثور على {len(services)} خدمة")
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        services_details_file = os.path.join(OUTPUT_DIR, 'services_details.csv')
         
-        # تجميع الخدمات الفريدة
+        # تجميع الخدمات الفريدة أثناء القراءة (عدد، مجموع، أقل وأعلى سعر لكل خدمة)
+        # وكتابة التفاصيل الكاملة في نفس المرور بدون الاحتفاظ بالصفوف في الذاكرة
         unique_services = {}
-        service_stats = defaultdict(lambda: {'count': 0, 'total_revenue': 0, 'min_price': float('inf'), 'max_price': 0})
+        services_count = 0
         
-        for service in services:
-            service_name = (service.get('service_name') or '').strip()
-            if not service_name:
-                continue
+        with open(services_details_file, 'w', encoding='utf-8-sig', newline='') as details:
+            details_writer = None
             
-            price = float(service.get('service_price') or 0)
-            
-            if service_name not in unique_services:
-                unique_services[service_name] = {
-                    'service_name': service_name,
-                    'first_seen_date': service.get('invoice_date'),
-                    'first_invoice_id': service.get('invoice_id'),
-                    'count': 0,
-                    'total_revenue': 0,
-                    'prices': []
-                }
-            
-            unique_services[service_name]['count'] += 1
-            unique_services[service_name]['total_revenue'] += price
-            unique_services[service_name]['prices'].append(price)
-        
-        # حساب الإحصائيات
-        for name, data in unique_services.items():
-            data['avg_price'] = data['total_revenue'] / data['count'] if data['count'] > 0 else 0
-            data['min_price'] = min(data['prices']) if data['prices'] else 0
-            data['max_price'] = max(data['prices']) if data['prices'] else 0
-            del data['prices']  # حذف قائمة الأسعار
+            while True:
+                rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+                if not rows:
+                    break
+                
+                if details_writer is None:
+                    details_writer = csv.DictWriter(details, fieldnames=rows[0].keys())
+                    details_writer.writeheader()
+                details_writer.writerows(rows)
+                services_count += len(rows)
+                
+                for service in rows:
+                    service_name = (service.get('service_name') or '').strip()
+                    if not service_name:
+                        continue
+                    
+                    price = float(service.get('service_price') or 0)
+                    
+                    data = unique_services.get(service_name)
+                    if data is None:
+                        unique_services[service_name] = {
+                            'service_name': service_name,
+                            'first_seen_date': service.get('invoice_date'),
+                            'first_invoice_id': service.get('invoice_id'),
+                            'count': 1,
+                            'total_revenue': price,
+                            'min_price': price,
+                            'max_price': price
+                        }
+                        continue
+                    
+                    data['count'] += 1
+                    data['total_revenue'] += price
+                    if price < data['min_price']:
+                        data['min_price'] = price
+                    if price > data['max_price']:
+                        data['max_price'] = price
+        
+        print(f"  ✅ تم العثور على {services_count} خدمة")
         
         # حفظ التقرير
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
         services_file = os.path.join(OUTPUT_DIR, 'services_report.csv')
-        
-        with open(services_file, 'w', encoding='utf-8-sig', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=[
-                'service_name', 'count', 'total_revenue', 'avg_price', 
-                'min_price', 'max_price', 'first_seen_date', 'first_invoice_id'
-            ])
-            writer.writeheader()
-            
-            for service_data in sorted(unique_services.values(), key=lambda x: x['count'], reverse=True):
-                writer.writerow({
-                    'service_name': service_data['service_name'],
-                    'count': service_data['count'],
-                    'total_revenue': f"{service_data['total_revenue']:.2f}",
-                    'avg_price': f"{service_data['avg_price']:.2f}",
-                    'min_price': f"{service_data['min_price']:.2f}",
-                    'max_price': f"{service_data['max_price']:.2f}",
-                    'first_seen_date': service_data['first_seen_date'],
-                    'first_invoice_id': service_data['first_invoice_id']
-                })
+        write_services_report(
+            services_file, sorted(unique_services.values(), key=lambda x: x['count'], reverse=True)
+        )
         
         print(f"  ✅ تم حفظ {len(unique_services)} خدمة فريدة في: {services_file}")
-        
-        # حفظ التفاصيل الكاملة
-        services_details_file = os.path.join(OUTPUT_DIR, 'services_details.csv')
-        with open(services_details_file, 'w', encoding='utf-8-sig', newline='') as f:
-            if services:
-                writer = csv.DictWriter(f, fieldnames=services[0].keys())
-                writer.writeheader()
-                writer.writerows(services)
-        
         print(f"  ✅ تم حفظ التفاصيل الكاملة في: {services_details_file}")
         
         return unique_services
@@ -227,13 +403,7 @@ def export_parts_from_products():
     """تصدير قطع الغيار من جدول products"""
     print("\n🔧 جاري تصدير قطع الغيار من جدول products...")
     
-    connection = mysql.connector.connect(
-        host=DB_CONFIG['host'],
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password'],
-        database=DB_CONFIG['database'],
-        port=DB_CONFIG['port']
-    )
+    connection = connect_legacy()
     
     cursor = connection.cursor(dictionary=True)
     
@@ -290,13 +460,7 @@ def export_parts_from_invoices():
     """تصدير قطع الغيار من حقل accessories في invoices"""
     print("\n🔧 جاري تصدير قطع الغيار من invoices (accessories)...")
     
-    connection = mysql.connector.connect(
-        host=DB_CONFIG['host'],
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password'],
-        database=DB_CONFIG['database'],
-        port=DB_CONFIG['port']
-    )
+    connection = connect_legacy()
     
     cursor = connection.cursor(dictionary=True)
     
@@ -405,45 +569,97 @@ def export_parts_from_invoices():
         connection.close()
 
 
+def add_problem(problem_types: Dict, problem: str, invoice_id):
+    """إضافة وصف مشكلة إلى تجميع أنواع المشاكل (بأول 5 كلمات)"""
+    problem = (problem or '').strip()
+    if problem:
+        # استخراج الكلمات المفتاحية من المشكلة
+        problem_keywords = problem.split()[:5]  # أول 5 كلمات
+        problem_key = ' '.join(problem_keywords)
+        problem_types[problem_key]['count'] += 1
+        problem_types[problem_key]['invoices'].append(invoice_id)
+
+
+def write_problems_report(problems_file: str, problem_types: Dict):
+    """حفظ تقرير أنواع المشاكل"""
+    with open(problems_file, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['problem_description', 'count', 'invoice_ids'])
+        writer.writeheader()
+        
+        for problem, data in sorted(problem_types.items(), key=lambda x: x[1]['count'], reverse=True):
+            invoice_ids = ','.join(map(str, data['invoices'][:50]))  # أول 50 فاتورة
+            writer.writerow({
+                'problem_description': problem,
+                'count': data['count'],
+                'invoice_ids': invoice_ids
+            })
+
+
+def export_repairs_grouped(cursor) -> int:
+    """تصدير ملخص الإصلاحات بتجميع GROUP BY على الخادم، والتفاصيل فقط عند EXPORT_DETAILS
+
+    أنواع المشاكل تعتمد على تقسيم النص إلى كلمات، لذلك تُقرأ أعمدة الوصف فقط بشكل متدفق.
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    
+    cursor.execute("SELECT COUNT(*) as count" + REPAIRS_FROM_SQL)
+    repairs_count = cursor.fetchone()['count']
+    print(f"  ✅ تم العثور على {repairs_count} إصلاح")
+    
+    # تقرير أنواع المشاكل
+    problem_types = defaultdict(lambda: {'count': 0, 'invoices': []})
+    cursor.execute(
+        "SELECT i.id as invoice_id, i.problem_description" + REPAIRS_FROM_SQL
+        + " AND i.problem_description IS NOT NULL ORDER BY i.id"
+    )
+    while True:
+        rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+        if not rows:
+            break
+        for repair in rows:
+            add_problem(problem_types, repair.get('problem_description'), repair.get('invoice_id'))
+    
+    problems_file = os.path.join(OUTPUT_DIR, 'repair_problems_report.csv')
+    write_problems_report(problems_file, problem_types)
+    print(f"  ✅ تم حفظ {len(problem_types)} نوع مشكلة في: {problems_file}")
+    
+    # تقرير أنواع الأجهزة
+    cursor.execute(repairs_group_sql('device_type'))
+    device_types = [(row['device_type'], row['count']) for row in cursor.fetchall()]
+    devices_file = os.path.join(OUTPUT_DIR, 'device_types_report.csv')
+    write_counts_report(devices_file, 'device_type', device_types)
+    print(f"  ✅ تم حفظ {len(device_types)} نوع جهاز في: {devices_file}")
+    
+    # تقرير العلامات التجارية
+    cursor.execute(repairs_group_sql('brand'))
+    brands = [(row['brand'], row['count']) for row in cursor.fetchall()]
+    brands_file = os.path.join(OUTPUT_DIR, 'brands_report.csv')
+    write_counts_report(brands_file, 'brand', brands)
+    print(f"  ✅ تم حفظ {len(brands)} علامة تجارية في: {brands_file}")
+    
+    if EXPORT_DETAILS:
+        repairs_details_file = os.path.join(OUTPUT_DIR, 'repairs_details.csv')
+        cursor.execute(REPAIRS_DETAILS_SQL)
+        write_rows_stream(cursor, repairs_details_file)
+        print(f"  ✅ تم حفظ التفاصيل الكاملة في: {repairs_details_file}")
+    
+    return repairs_count
+
+
 def export_repairs_summary():
     """تصدير ملخص الإصلاحات"""
     print("\n🔨 جاري تصدير ملخص الإصلاحات...")
     
-    connection = mysql.connector.connect(
-        host=DB_CONFIG['host'],
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password'],
-        database=DB_CONFIG['database'],
-        port=DB_CONFIG['port']
-    )
+    connection = connect_legacy()
     
     cursor = connection.cursor(dictionary=True)
     
     try:
+        if REPORT_AGGREGATION == 'sql':
+            return export_repairs_grouped(cursor)
+        
         # قراءة جميع الفواتير (الإصلاحات)
-        cursor.execute("""
-            SELECT 
-                i.id as invoice_id,
-                i.date as invoice_date,
-                i.entery_at,
-                i.exit_at,
-                i.problem_description,
-                i.device_type,
-                i.brand,
-                i.device_model,
-                i.total,
-                i.paid,
-                i.due,
-                i.client_id,
-                c.name as client_name,
-                s.name as status_name
-            FROM invoices i
-            LEFT JOIN clients c ON i.client_id = c.id
-            LEFT JOIN invoice_status ins ON i.id = ins.invoice_id
-            LEFT JOIN status s ON ins.status_id = s.id
-            WHERE i.id IS NOT NULL
-            ORDER BY i.id
-        """)
+        cursor.execute(REPAIRS_DETAILS_SQL)
         
         repairs = cursor.fetchall()
         print(f"  ✅ تم العثور على {len(repairs)} إصلاح")
@@ -454,16 +670,10 @@ def export_repairs_summary():
         brands = defaultdict(int)
         
         for repair in repairs:
-            problem = (repair.get('problem_description') or '').strip()
             device_type = (repair.get('device_type') or '').strip()
             brand = (repair.get('brand') or '').strip()
             
-            if problem:
-                # استخراج الكلمات المفتاحية من المشكلة
-                problem_keywords = problem.split()[:5]  # أول 5 كلمات
-                problem_key = ' '.join(problem_keywords)
-                problem_types[problem_key]['count'] += 1
-                problem_types[problem_key]['invoices'].append(repair.get('invoice_id'))
+            add_problem(problem_types, repair.get('problem_description'), repair.get('invoice_id'))
             
             if device_type:
                 device_types[device_type] += 1
@@ -476,37 +686,19 @@ def export_repairs_summary():
         
         # تقرير أنواع المشاكل
         problems_file = os.path.join(OUTPUT_DIR, 'repair_problems_report.csv')
-        with open(problems_file, 'w', encoding='utf-8-sig', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=['problem_description', 'count', 'invoice_ids'])
-            writer.writeheader()
-            
-            for problem, data in sorted(problem_types.items(), key=lambda x: x[1]['count'], reverse=True):
-                invoice_ids = ','.join(map(str, data['invoices'][:50]))  # أول 50 فاتورة
-                writer.writerow({
-                    'problem_description': problem,
-                    'count': data['count'],
-                    'invoice_ids': invoice_ids
-                })
+        write_problems_report(problems_file, problem_types)
         
         print(f"  ✅ تم حفظ {len(problem_types)} نوع مشكلة في: {problems_file}")
         
         # تقرير أنواع الأجهزة
         devices_file = os.path.join(OUTPUT_DIR, 'device_types_report.csv')
-        with open(devices_file, 'w', encoding='utf-8-sig', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=['device_type', 'count'])
-            writer.writeheader()
-            for device_type, count in sorted(device_types.items(), key=lambda x: x[1], reverse=True):
-                writer.writerow({'device_type': device_type, 'count': count})
+        write_counts_report(devices_file, 'device_type', sorted(device_types.items(), key=lambda x: x[1], reverse=True))
         
         print(f"  ✅ تم حفظ {len(device_types)} نوع جهاز في: {devices_file}")
         
         # تقرير العلامات التجارية
         brands_file = os.path.join(OUTPUT_DIR, 'brands_report.csv')
-        with open(brands_file, 'w', encoding='utf-8-sig', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=['brand', 'count'])
-            writer.writeheader()
-            for brand, count in sorted(brands.items(), key=lambda x: x[1], reverse=True):
-                writer.writerow({'brand': brand, 'count': count})
+        write_counts_report(brands_file, 'brand', sorted(brands.items(), key=lambda x: x[1], reverse=True))
         
         print(f"  ✅ تم حفظ {len(brands)} علامة تجارية في: {brands_file}")
         
@@ -532,36 +724,84 @@ def export_repairs_summary():
         connection.close()
 
 
+# دالة كل تقرير حسب اسمه في EXPORTS
+EXPORT_FUNCTIONS = {
+    'services': export_services,
+    'products': export_parts_from_products,
+    'parts': export_parts_from_invoices,
+    'repairs': export_repairs_summary,
+}
+
+
+def run_export_job(name: str) -> Tuple[str, int, float]:
+    """تشغيل تقرير واحد وإرجاع (اسمه، عدد الصفوف، الزمن بالثواني)"""
+    started = time.perf_counter()
+    result = EXPORT_FUNCTIONS[name]()
+    rows = result if isinstance(result, int) else len(result)
+    return name, rows, time.perf_counter() - started
+
+
+def run_export_jobs(names: List[str], workers: int) -> Dict[str, Tuple[int, float]]:
+    """تشغيل التقارير بالتتابع أو بالتوازي في process pool
+
+    كل تقرير يفتح اتصاله الخاص ويكتب ملفاته الخاصة، لذلك لا تعتمد التقارير على بعضها.
+    """
+    results = {}
+    if workers <= 1 or len(names) <= 1:
+        for name in names:
+            _, rows, seconds = run_export_job(name)
+            results[name] = (rows, seconds)
+        return results
+    
+    print(f"\n⚡ تصدير {len(names)} تقارير بالتوازي ({min(workers, len(names))} عمليات)...")
+    with ProcessPoolExecutor(max_workers=min(workers, len(names))) as pool:
+        futures = {pool.submit(run_export_job, name): name for name in names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                _, rows, seconds = future.result()
+            except Exception as e:
+                print(f"❌ فشل تصدير {EXPORT_LABELS[name][0]}: {e}")
+                continue
+            results[name] = (rows, seconds)
+            print(f"  ⏱️  انتهى تصدير {EXPORT_LABELS[name][0]} خلال {seconds:.1f} ثانية")
+    return results
+
+
 def main():
     """الدالة الرئيسية"""
     print("=" * 60)
     print("🚀 بدء تصدير تقرير الخدمات وقطع الغيار والإصلاحات")
     print("=" * 60)
     
-    # التأكد من استيراد قاعدة البيانات المؤقتة
-    if not ensure_temp_db_imported():
-        print("❌ فشل في استيراد قاعدة البيانات المؤقتة")
+    unknown = [name for name in EXPORTS if name not in EXPORT_TABLES]
+    if unknown:
+        print(f"❌ تقارير غير معروفة: {', '.join(unknown)} (المتاح: {', '.join(EXPORT_TABLES)})")
         return
     
-    # تصدير الخدمات
-    services = export_services()
-    
-    # تصدير قطع الغيار من جدول products
-    products = export_parts_from_products()
-    
-    # تصدير قطع الغيار من invoices
-    parts = export_parts_from_invoices()
+    # التأكد من استيراد الجداول التي تحتاجها التقارير المطلوبة فقط
+    tables = []
+    for name in EXPORTS:
+        tables.extend(table for table in EXPORT_TABLES[name] if table not in tables)
+    if not ensure_temp_db_imported(tables):
+        print("❌ فشل في استيراد قاعدة البيانات المؤقتة")
+        return
     
-    # تصدير ملخص الإصلاحات
-    repairs = export_repairs_summary()
+    started = time.perf_counter()
+    results = run_export_jobs(EXPORTS, EXPORT_WORKERS)
+    elapsed = time.perf_counter() - started
     
     # ملخص نهائي
     print("\n" + "=" * 60)
     print("📊 ملخص التصدير:")
-    print(f"  ✅ الخدمات: {len(services)} خدمة فريدة")
-    print(f"  ✅ قطع الغيار من products: {len(products)} قطعة")
-    print(f"  ✅ قطع الغيار من invoices: {len(parts)} قطعة فريدة")
-    print(f"  ✅ الإصلاحات: {len(repairs)} إصلاح")
+    for name in EXPORTS:
+        label, unit = EXPORT_LABELS[name]
+        if name in results:
+            rows, seconds = results[name]
+            print(f"  ✅ {label}: {rows} {unit} ({seconds:.1f} ثانية)")
+        else:
+            print(f"  ❌ {label}: فشل التصدير")
+    print(f"  ⏱️  الزمن الكلي: {elapsed:.1f} ثانية")
     print(f"  📁 الملفات المحفوظة في: {OUTPUT_DIR}")
     print("=" * 60)
     print("\n✅ اكتمل التصدير!")
@@ -569,4 +809,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+External Sort - ترتيب عدد كبير من السجلات بذاكرة محدودة
+يُستخدم من import_csv_data.py لترتيب العملاء بعمود #: السجلات تُقسم إلى أجزاء مرتبة
+تُكتب في ملفات مؤقتة على القرص ثم تُدمج (merge) بنفس نتيجة sort() المستقر في الذاكرة
+"""
+
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List
+
+
+def is_sorted(keys: Iterable) -> bool:
+    """هل المفاتيح مرتبة تصاعدياً (غير متناقصة)"""
+    previous = None
+    first = True
+    for key in keys:
+        if not first and key < previous:
+            return False
+        previous = key
+        first = False
+    return True
+
+
+def write_run(directory: str, index: int, items: List) -> str:
+    """كتابة جزء مرتب في ملف مؤقت (سجل pickle لكل عنصر) وإرجاع مساره"""
+    path = os.path.join(directory, f"run_{index:05d}.pickle")
+    with open(path, 'wb') as f:
+        for item in items:
+            pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def read_run(path: str) -> Iterator:
+    """قراءة عناصر جزء مرتب من ملفه بالترتيب"""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def external_sorted(items: Iterable, key: Callable[[Any], Any], chunk_size: int) -> Iterator:
+    """ترتيب مستقر للعناصر بذاكرة لا تتجاوز chunk_size عنصر تقريباً
+
+    إذا كانت كل العناصر في جزء واحد يتم ترتيبها في الذاكرة بدون ملفات؛ وإلا يُكتب كل جزء
+    مرتباً في ملف مؤقت، ثم تُدمج الملفات بـ heapq.merge الذي يحافظ على ترتيب الأجزاء
+    للمفاتيح المتساوية (أي نفس نتيجة sorted(items, key=key)). الملفات تُحذف عند الانتهاء.
+    """
+    items = iter(items)
+    chunk_size = max(1, chunk_size)
+    chunk = sorted(islice(items, chunk_size), key=key)
+    if len(chunk) < chunk_size:
+        yield from chunk
+        return
+
+    directory = tempfile.mkdtemp(prefix='external_sort_')
+    try:
+        runs = []
+        while chunk:
+            runs.append(write_run(directory, len(runs), chunk))
+            chunk = sorted(islice(items, chunk_size), key=key)
+        print(f"  💽 ترتيب خارجي: {len(runs)} جزء مرتب على القرص (حتى {chunk_size} سجل لكل جزء)")
+        yield from heapq.merge(*(read_run(path) for path in runs), key=key)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -6,13 +6,14 @@ Import CSV Data to Database - استيراد البيانات من CSV إلى ق
 هذا السكربت يقوم بقراءة ملفات CSV وإضافة البيانات إلى قاعدة البيانات
 """
 
-import csv
-import re
 import os
 import sys
+import tempfile
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, Optional, Tuple
+from functools import lru_cache
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 # Try to import mysql connector, if not available, provide helpful error
 try:
@@ -24,19 +25,51 @@ except ImportError:
     print("   أو: python3 -m pip install mysql-connector-python")
     sys.exit(1)
 
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'user': os.getenv('DB_USER', 'root'),
-    'password': os.getenv('DB_PASSWORD', ''),
-    'database': os.getenv('DB_NAME', 'FZ'),
-    'port': int(os.getenv('DB_PORT', 3306)),
-    'charset': 'utf8mb4',
-    'collation': 'utf8mb4_unicode_ci'
-}
+from arabic_normalize import (PARSE_CACHE_SIZE, clean_phones, parse_amount, parse_amounts, parse_arabic_date,
+                              parse_dates)
+from csv_rows import csv_row_type, iter_csv_rows
+from customer_index import (CUSTOMER_INDEX, CustomerIndex, build_customer_custom_fields, clean_phone,
+                            collation_key_sql, plan_customer_upserts)
+from external_sort import external_sorted, is_sorted
+from import_ledger import ImportLedger, load_ledger
+from pipeline import IMPORT_PIPELINE, Pipeline
+from db_access import (DB_CONFIG, BatchRollback, CommitPolicy, connect, connect_local_infile,
+                       prepared_statements, print_statement_stats)
+
+# Customer import mode: 'row' (one lookup/insert per customer), 'batch',
+# or 'load' (LOAD DATA LOCAL INFILE into a staging table, for the initial load)
+CUSTOMER_IMPORT_MODE = os.getenv('CUSTOMER_IMPORT_MODE', 'row')
+
+# Number of customers written per transaction in batch mode
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+
+# Customers sorted in memory at once when the CSV is not already in '#' order
+# (larger files are sorted in chunks on disk and merged)
+CUSTOMER_SORT_CHUNK_ROWS = int(os.getenv('CUSTOMER_SORT_CHUNK_ROWS', 100000))
+
+# Sort position of customers without a '#' number (after all numbered rows)
+UNNUMBERED_CUSTOMER_ORDER = 999999
+
+# Staging table for the 'load' mode: one row per new customer ('insert')
+# or per phone update of an existing customer ('phone'), in CSV order (seq)
+CUSTOMER_STAGING_DDL = """CREATE TEMPORARY TABLE customer_staging (
+    seq INT NOT NULL PRIMARY KEY,
+    action VARCHAR(10) NOT NULL,
+    customer_id INT NULL,
+    name VARCHAR(100) NULL,
+    phone VARCHAR(30) NULL,
+    address VARCHAR(255) NULL,
+    customFields LONGTEXT NULL
+) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"""
+
+CUSTOMER_STAGING_LOAD_SQL = """LOAD DATA LOCAL INFILE %s INTO TABLE customer_staging
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+    (seq, action, customer_id, name, phone, address, customFields)"""
 
 # Mapping between CSV columns and database columns
 CUSTOMER_CSV_COLUMNS = {
+    '#': 'csv_order',
     'الاسم': 'name',
     'رقم الجوال': 'phone',
     'المنطقة': 'address',
@@ -58,93 +91,26 @@ INVOICE_CSV_COLUMNS = {
     'الخدمات': 'services_amount'
 }
 
-# Arabic month names to numbers
-ARABIC_MONTHS = {
-    'يناير': 1, 'فبراير': 2, 'مارس': 3, 'أبريل': 4,
-    'مايو': 5, 'يونيو': 6, 'يوليو': 7, 'أغسطس': 8,
-    'سبتمبر': 9, 'أكتوبر': 10, 'نوفمبر': 11, 'ديسمبر': 12
+# Values used when a column is missing from an invoices CSV (other columns default to '')
+INVOICE_CSV_DEFAULTS = {
+    'total_amount': '0',
+    'amount_paid': '0',
+    'remaining_amount': '0',
+    'status': 'تم الاستلام من العميل',
+    'invoice_type': 'فاتورة صيانه',
+    'payment_method': 'كاش'
 }
 
-# Arabic day names
-ARABIC_DAYS = ['السبت', 'الأحد', 'الإثنين', 'الثلاثاء', 'الأربعاء', 'الخميس', 'الجمعة']
-
-
-def clean_phone(phone: str) -> str:
-    """تنظيف رقم الهاتف"""
-    if not phone or phone == '.' or phone == '000' or phone == '00000000000':
-        return None
-    # Remove non-digits except +
-    cleaned = re.sub(r'[^\d+]', '', str(phone))
-    if not cleaned or len(cleaned) < 8:
-        return None
-    return cleaned
-
-
-def parse_arabic_date(date_str: str) -> Optional[datetime]:
-    """تحويل التاريخ العربي إلى datetime"""
-    if not date_str:
-        return None
-    
-    try:
-        # Remove day name and comma if present
-        date_str = date_str.strip()
-        for day in ARABIC_DAYS:
-            if date_str.startswith(day):
-                date_str = date_str.replace(day + ',', '').strip()
-                break
-        
-        # Extract date parts: "٢٠ نوفمبر ٢٠٢٥"
-        # Replace Arabic digits with English digits
-        arabic_to_english = str.maketrans('٠١٢٣٤٥٦٧٨٩', '0123456789')
-        date_str = date_str.translate(arabic_to_english)
-        
-        # Remove extra spaces
-        date_str = ' '.join(date_str.split())
-        
-        # Parse date: "20 نوفمبر 2025"
-        parts = date_str.split()
-        if len(parts) >= 3:
-            day = int(parts[0])
-            month_name = parts[1]
-            year = int(parts[2])
-            
-            month = ARABIC_MONTHS.get(month_name)
-            if month:
-                return datetime(year, month, day)
-        
-        return None
-    except Exception as e:
-        print(f"خطأ في تحويل التاريخ: {date_str} - {e}")
-        return None
-
-
-def parse_amount(amount_str: str) -> Optional[Decimal]:
-    """تحويل المبلغ من نص إلى Decimal"""
-    if not amount_str:
-        return Decimal('0')
-    
-    try:
-        # Replace Arabic digits
-        arabic_to_english = str.maketrans('٠١٢٣٤٥٦٧٨٩', '0123456789')
-        amount_str = str(amount_str).translate(arabic_to_english)
-        
-        # Remove commas and spaces
-        amount_str = amount_str.replace(',', '').replace(' ', '').strip()
-        
-        if not amount_str or amount_str == '':
-            return Decimal('0')
-        
-        return Decimal(amount_str)
-    except Exception as e:
-        print(f"خطأ في تحويل المبلغ: {amount_str} - {e}")
-        return Decimal('0')
+# Compact per-row tuples read from the CSV files (fields are the database-side names above)
+CustomerCsvRow = csv_row_type('CustomerCsvRow', CUSTOMER_CSV_COLUMNS)
+InvoiceCsvRow = csv_row_type('InvoiceCsvRow', INVOICE_CSV_COLUMNS)
 
+# Number of CSV rows normalized together (the file is streamed in chunks of this size)
+CSV_CHUNK_ROWS = int(os.getenv('CSV_CHUNK_ROWS', 5000))
 
-def map_invoice_status(status: str) -> str:
-    """تحويل حالة الفاتورة من النص العربي إلى حالة في النظام"""
-    status = status.strip().lower()
-    
-    status_map = {
+# Invoice status labels (lower-cased once) to system statuses, checked in order
+INVOICE_STATUS_MAP = [
+    (arabic_status.lower(), english_status) for arabic_status, english_status in {
         'تم الاستلام من العميل': 'pending',
         'تم الاصلاح وجاهز للاستلام ✨': 'ready',
         'تم تسليم الجهاز للعميل👍✨': 'completed',
@@ -152,15 +118,23 @@ def map_invoice_status(status: str) -> str:
         'تحت الاختبارت النهائيه...': 'testing',
         'بانتظار قطع غيار': 'waiting_parts',
         'تم التسليم للمهندس وجارى الفحص': 'in_progress'
-    }
+    }.items()
+]
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def map_invoice_status(status: str) -> str:
+    """تحويل حالة الفاتورة من النص العربي إلى حالة في النظام"""
+    status = status.strip().lower()
     
-    for arabic_status, english_status in status_map.items():
-        if arabic_status.lower() in status:
+    for arabic_status, english_status in INVOICE_STATUS_MAP:
+        if arabic_status in status:
             return english_status
     
     return 'pending'
 
 
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
 def map_invoice_type(invoice_type: str) -> str:
     """تحويل نوع الفاتورة"""
     if 'مبيعات' in invoice_type or 'sale' in invoice_type.lower():
@@ -171,9 +145,17 @@ def map_invoice_type(invoice_type: str) -> str:
 
 
 def get_or_create_customer(connection, customer_name: str, phone: str = None, 
-                           address: str = None, notes: str = None, csv_order: int = None) -> Optional[int]:
-    """الحصول على العميل أو إنشاؤه إذا لم يكن موجوداً"""
-    cursor = connection.cursor()
+                           address: str = None, notes: str = None, csv_order: int = None,
+                           customer_index: Optional[CustomerIndex] = None,
+                           commit_policy: Optional[CommitPolicy] = None) -> Optional[int]:
+    """الحصول على العميل أو إنشاؤه إذا لم يكن موجوداً
+    
+    إذا تم تمرير customer_index تتم المطابقة بالاسم والهاتف من الفهرس بدون استعلام،
+    ويتم تحديث الفهرس بعد أي UPDATE أو INSERT.
+    مع commit_policy يتم الـ commit حسب سياسة الدفعات بدلاً من commit بعد كل عميل.
+    """
+    statements = prepared_statements(connection)
+    transaction = commit_policy or connection
     
     try:
         # Clean customer name
@@ -182,63 +164,66 @@ def get_or_create_customer(connection, customer_name: str, phone: str = None,
             return None
         
         # Try to find by name first
-        cursor.execute(
-            "SELECT id FROM Customer WHERE name = %s AND deletedAt IS NULL LIMIT 1",
-            (customer_name,)
-        )
-        result = cursor.fetchone()
-        if result:
-            customer_id = result[0]
+        if customer_index is not None:
+            customer_id = customer_index.find_by_name(customer_name)
+        else:
+            result = statements.fetchone(
+                'Customer.by_name',
+                "SELECT id FROM Customer WHERE name = %s AND deletedAt IS NULL LIMIT 1",
+                (customer_name,)
+            )
+            customer_id = result[0] if result else None
+        if customer_id:
             # Update phone if provided and different
             if phone:
                 clean_phone_num = clean_phone(phone)
                 if clean_phone_num:
-                    cursor.execute(
+                    statements.execute(
+                        'Customer.update_phone',
                         "UPDATE Customer SET phone = %s WHERE id = %s",
                         (clean_phone_num, customer_id)
                     )
+                    transaction.commit()
+                    if customer_index is not None:
+                        customer_index.update_phone(customer_id, clean_phone_num)
             return customer_id
         
         # Try to find by phone if provided
         if phone:
             clean_phone_num = clean_phone(phone)
             if clean_phone_num:
-                cursor.execute(
-                    "SELECT id FROM Customer WHERE phone = %s AND deletedAt IS NULL LIMIT 1",
-                    (clean_phone_num,)
-                )
-                result = cursor.fetchone()
-                if result:
-                    return result[0]
+                if customer_index is not None:
+                    customer_id = customer_index.find_by_phone(clean_phone_num)
+                    if customer_id:
+                        return customer_id
+                else:
+                    result = statements.fetchone(
+                        'Customer.by_phone',
+                        "SELECT id FROM Customer WHERE phone = %s AND deletedAt IS NULL LIMIT 1",
+                        (clean_phone_num,)
+                    )
+                    if result:
+                        return result[0]
         
         # Create new customer
         clean_phone_num = clean_phone(phone) if phone else None
+        custom_fields = build_customer_custom_fields(notes, csv_order)
         
-        # Prepare customFields with notes and CSV order
-        custom_fields_parts = []
-        if notes:
-            custom_fields_parts.append(f'"notes": "{notes}"')
-        if csv_order:
-            custom_fields_parts.append(f'"csvOrder": {csv_order}')
-        
-        custom_fields = '{' + ', '.join(custom_fields_parts) + '}' if custom_fields_parts else None
-        
-        cursor.execute(
+        customer_id = statements.insert(
+            'Customer.insert',
             """INSERT INTO Customer (name, phone, address, customFields, createdAt)
                VALUES (%s, %s, %s, %s, NOW())""",
             (customer_name, clean_phone_num, address, custom_fields)
         )
-        
-        customer_id = cursor.lastrowid
-        connection.commit()
+        transaction.commit()
+        if customer_index is not None:
+            customer_index.add(customer_id, customer_name, clean_phone_num)
         return customer_id
         
     except Error as e:
         print(f"❌ خطأ في get_or_create_customer: {e}")
-        connection.rollback()
+        transaction.rollback()
         return None
-    finally:
-        cursor.close()
 
 
 def get_branch_id(connection, branch_name: str) -> Optional[int]:
@@ -281,6 +266,350 @@ def get_user_id(connection, user_name: str) -> Optional[int]:
         cursor.close()
 
 
+def upsert_customer_row(connection, customer_data: Dict, customer_index: Optional[CustomerIndex] = None,
+                        commit_policy: Optional[CommitPolicy] = None,
+                        ledger: Optional[ImportLedger] = None) -> bool:
+    """إدراج عميل واحد، ويُرجع True إذا تم استيراده"""
+    try:
+        customer_id = get_or_create_customer(
+            connection, 
+            customer_data['name'], 
+            customer_data['phone'], 
+            customer_data['address'], 
+            customer_data['notes'], 
+            customer_data['csv_order'],
+            customer_index,
+            commit_policy
+        )
+        # تسجيل صف CSV (عمود #) في سجل الاستيراد حتى يتخطاه أي تشغيل لاحق
+        if customer_id and ledger is not None:
+            ledger.record(connection, customer_data['csv_order'], customer_id)
+            (commit_policy or connection).commit()
+        return bool(customer_id)
+    except BatchRollback:
+        raise
+    except Exception as e:
+        print(f"❌ خطأ في إدراج العميل {customer_data['name']}: {e}")
+        return False
+
+
+def upsert_customers_row_by_row(connection, customers_list: Iterable[Dict],
+                                customer_index: Optional[CustomerIndex] = None,
+                                commit_policy: Optional[CommitPolicy] = None,
+                                ledger: Optional[ImportLedger] = None) -> Tuple[int, int]:
+    """إدراج العملاء واحداً تلو الآخر (commit حسب commit_policy، افتراضياً بعد كل عميل)"""
+    customers_imported = 0
+    customers_skipped = 0
+    
+    if commit_policy is None:
+        # بعد إلغاء دفعة يُعاد تحميل الفهرس لأن العملاء الملغين أضيفوا له
+        on_rollback = (lambda: customer_index.reload(connection)) if customer_index is not None else None
+        commit_policy = CommitPolicy(connection, on_rollback=on_rollback)
+    
+    results = commit_policy.run(
+        customers_list,
+        lambda customer_data: upsert_customer_row(connection, customer_data, customer_index, commit_policy, ledger)
+    )
+    for imported in results:
+        if imported:
+            customers_imported += 1
+            if customers_imported % 50 == 0:
+                print(f"  ✅ تم استيراد {customers_imported} عميل...")
+        else:
+            customers_skipped += 1
+    
+    return customers_imported, customers_skipped
+
+
+def fetch_customer_candidates(cursor, names: List[str], phones: List[str]) -> List[Tuple]:
+    """جلب العملاء الموجودين المطابقين لأي اسم أو هاتف في الدفعة باستعلام واحد (مع مفاتيح المقارنة)"""
+    conditions = []
+    params = []
+    if names:
+        conditions.append(f"name IN ({', '.join(['%s'] * len(names))})")
+        params.extend(names)
+    if phones:
+        conditions.append(f"phone IN ({', '.join(['%s'] * len(phones))})")
+        params.extend(phones)
+    if not conditions:
+        return []
+    
+    cursor.execute(
+        f"""SELECT id, name, phone, {collation_key_sql('name')}, {collation_key_sql('phone')} FROM Customer
+            WHERE deletedAt IS NULL AND ({' OR '.join(conditions)})
+            ORDER BY id""",
+        params
+    )
+    return cursor.fetchall()
+
+
+def customer_rows(chunk: List[Dict]) -> List[Tuple[Dict, Optional[str]]]:
+    """صفوف دفعة العملاء مع الهاتف بعد التنظيف: (بيانات العميل، الهاتف)"""
+    return list(zip(chunk, clean_phones([customer_data['phone'] for customer_data in chunk])))
+
+
+def iter_customer_chunks(customers: Iterable[Dict], batch_size: int) -> Iterator[List[Tuple[Dict, Optional[str]]]]:
+    """العملاء على دفعات من batch_size عميل مجهزة بـ customer_rows"""
+    customers = iter(customers)
+    while True:
+        chunk = list(islice(customers, max(1, batch_size)))
+        if not chunk:
+            break
+        yield customer_rows(chunk)
+
+
+def upsert_customers_chunk(connection, rows: List[Tuple[Dict, Optional[str]]],
+                           ledger: Optional[ImportLedger] = None) -> int:
+    """معالجة دفعة من العملاء في transaction واحدة بنفس منطق get_or_create_customer
+    
+    يتم جلب العملاء المرشحين بالاسم والهاتف مرة واحدة، ثم تتم المطابقة في الذاكرة
+    بنفس ترتيب الصفوف: البحث بالاسم أولاً (مع تحديث الهاتف)، ثم بالهاتف، وإلا إنشاء عميل جديد.
+    العملاء الجدد يُكتبون بـ INSERT متعدد الصفوف وتحديثات الهاتف بـ UPDATE واحد.
+    """
+    cursor = connection.cursor()
+    try:
+        names = sorted({customer_data['name'].strip() for customer_data, _ in rows})
+        phones = sorted({phone for _, phone in rows if phone})
+        candidates = fetch_customer_candidates(cursor, names, phones)
+        
+        # Existing customers are referenced by ('db', id), new ones by ('new', index).
+        # Both sort the same way LIMIT 1 resolves them: existing rows by id, then new rows in insert order.
+        # Names and phones are compared by the server's collation keys, like the per-row queries.
+        chunk_index = CustomerIndex.for_connection(connection)
+        for customer_id, name, phone, name_key, phone_key in candidates:
+            chunk_index.add_with_keys(('db', customer_id), name, phone, name_key, phone_key)
+        chunk_index.prefetch(names + phones)
+        
+        new_customers, phone_updates = plan_customer_upserts(rows, chunk_index)
+        
+        if phone_updates:
+            case_sql = ' '.join(['WHEN %s THEN %s'] * len(phone_updates))
+            params = [value for item in phone_updates.items() for value in item]
+            params.extend(phone_updates.keys())
+            cursor.execute(
+                f"""UPDATE Customer SET phone = CASE id {case_sql} END
+                    WHERE id IN ({', '.join(['%s'] * len(phone_updates))})""",
+                params
+            )
+        
+        if new_customers:
+            cursor.executemany(
+                """INSERT INTO Customer (name, phone, address, customFields, createdAt)
+                   VALUES (%s, %s, %s, %s, NOW())""",
+                [tuple(values) for values in new_customers]
+            )
+        
+        # تسجيل صفوف الدفعة في سجل الاستيراد ضمن نفس الـ transaction
+        if ledger is not None:
+            ledger.record_many(cursor, [(customer_data['csv_order'], None) for customer_data, _ in rows])
+        
+        connection.commit()
+        return len(rows)
+        
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def upsert_customers_batched(connection, customers_list: Iterable[Dict], batch_size: int,
+                             ledger: Optional[ImportLedger] = None, pipeline: bool = IMPORT_PIPELINE) -> Tuple[int, int]:
+    """إدراج العملاء على دفعات، كل دفعة في transaction واحدة
+    
+    مع pipeline تتم قراءة الملف وتنظيف الهواتف في thread منفصل بينما تُكتب الدفعات السابقة.
+    """
+    customers_imported = 0
+    customers_skipped = 0
+    start = 0
+    
+    chunks = iter_customer_chunks(customers_list, batch_size)
+    customer_pipeline = Pipeline('customers') if pipeline else None
+    if customer_pipeline is not None:
+        chunks = customer_pipeline.run(chunks)
+    
+    for rows in chunks:
+        try:
+            customers_imported += upsert_customers_chunk(connection, rows, ledger)
+        except Error as e:
+            # Replay the failed chunk row by row to skip only the bad records
+            print(f"⚠️  فشلت الدفعة {start + 1}-{start + len(rows)}، جاري الإعادة صفاً صفاً: {e}")
+            imported, skipped = upsert_customers_row_by_row(connection, [customer_data for customer_data, _ in rows],
+                                                            commit_policy=CommitPolicy(connection, every_rows=1),
+                                                            ledger=ledger)
+            customers_imported += imported
+            customers_skipped += skipped
+        
+        start += len(rows)
+        print(f"  ✅ تم استيراد {customers_imported} عميل...")
+    
+    if customer_pipeline is not None:
+        customer_pipeline.print_stats()
+    return customers_imported, customers_skipped
+
+
+def tsv_value(value) -> str:
+    """قيمة حقل في ملف TSV بصيغة LOAD DATA الافتراضية (\\N للقيمة NULL)"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def write_customer_staging_tsv(path: str, new_customers: List[List], phone_updates: Dict[int, str]) -> int:
+    """كتابة تحديثات الهاتف ثم العملاء الجدد (بترتيب CSV) في ملف TSV، ويُرجع عدد الصفوف"""
+    seq = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for customer_id, phone in phone_updates.items():
+            seq += 1
+            f.write('\t'.join(tsv_value(value) for value in (seq, 'phone', customer_id, None, phone, None, None)) + '\n')
+        for name, phone, address, custom_fields in new_customers:
+            seq += 1
+            f.write('\t'.join(tsv_value(value) for value in (seq, 'insert', None, name, phone, address, custom_fields)) + '\n')
+    return seq
+
+
+def upsert_customers_load_data(customers_list: List[Dict], ledger: Optional[ImportLedger] = None) -> Tuple[int, int]:
+    """المسار السريع للتحميل الأولي: LOAD DATA LOCAL INFILE إلى جدول مؤقت ثم دمج بجمل SQL مجمعة
+    
+    المطابقة بالاسم والهاتف تتم في الذاكرة بنفس منطق get_or_create_customer مقابل كل العملاء
+    الموجودين (بمفاتيح collation من الخادم)، ثم تُكتب النتيجة في ملف TSV يُحمّل إلى customer_staging، ويُدمج في Customer
+    بـ UPDATE ... JOIN واحد لتحديثات الهاتف و INSERT ... SELECT واحد للعملاء الجدد بترتيب CSV.
+    """
+    connection = connect_local_infile()
+    cursor = connection.cursor()
+    staging_file = tempfile.NamedTemporaryFile(prefix='customers_', suffix='.tsv', delete=False)
+    staging_file.close()
+    try:
+        rows = customer_rows(customers_list)
+        
+        # Existing customers are referenced by ('db', id), exactly as in upsert_customers_chunk
+        index = CustomerIndex.for_connection(connection)
+        cursor.execute(
+            f"""SELECT id, name, phone, {collation_key_sql('name')}, {collation_key_sql('phone')}
+                FROM Customer WHERE deletedAt IS NULL ORDER BY id"""
+        )
+        for customer_id, name, phone, name_key, phone_key in cursor.fetchall():
+            index.add_with_keys(('db', customer_id), name, phone, name_key, phone_key)
+        index.prefetch([customer_data['name'].strip() for customer_data, _ in rows] + [phone for _, phone in rows])
+        
+        new_customers, phone_updates = plan_customer_upserts(rows, index)
+        staged = write_customer_staging_tsv(staging_file.name, new_customers, phone_updates)
+        print(f"  📦 {len(new_customers)} عميل جديد و {len(phone_updates)} تحديث هاتف في ملف التحميل")
+        
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS customer_staging")
+        cursor.execute(CUSTOMER_STAGING_DDL)
+        cursor.execute(CUSTOMER_STAGING_LOAD_SQL, (staging_file.name,))
+        if cursor.rowcount != staged:
+            raise Error(msg=f"LOAD DATA حمّل {cursor.rowcount} صف من {staged}")
+        
+        cursor.execute(
+            """UPDATE Customer c
+               JOIN customer_staging s ON s.customer_id = c.id
+               SET c.phone = s.phone
+               WHERE s.action = 'phone'"""
+        )
+        cursor.execute(
+            """INSERT INTO Customer (name, phone, address, customFields, createdAt)
+               SELECT name, phone, address, customFields, NOW()
+               FROM customer_staging
+               WHERE action = 'insert'
+               ORDER BY seq"""
+        )
+        
+        # تسجيل صفوف الملف في سجل الاستيراد ضمن نفس الـ transaction
+        if ledger is not None:
+            ledger.record_many(cursor, [(customer_data['csv_order'], None) for customer_data, _ in rows])
+        
+        connection.commit()
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS customer_staging")
+        return len(rows), 0
+        
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+        os.unlink(staging_file.name)
+
+
+def parse_csv_order(csv_order_str: Optional[str]) -> Optional[int]:
+    """رقم العميل في عمود # (أو None إذا كان فارغاً أو غير رقمي)"""
+    csv_order_str = (csv_order_str or '').strip()
+    return int(csv_order_str) if csv_order_str and csv_order_str.isdigit() else None
+
+
+def customer_order_key(csv_order: Optional[int]) -> int:
+    """مفتاح ترتيب العميل: رقم # أو UNNUMBERED_CUSTOMER_ORDER للعملاء بدون رقم"""
+    return csv_order if csv_order else UNNUMBERED_CUSTOMER_ORDER
+
+
+class CustomerCsvReader:
+    """العملاء (dict لكل عميل) من ملف CSV بترتيب الملف
+    
+    يمكن المرور على الملف أكثر من مرة؛ السطور التالفة تُطبع وتُعد في self.skipped.
+    """
+    
+    def __init__(self, csv_file_path: str):
+        self.csv_file_path = csv_file_path
+        self.skipped = 0
+    
+    def rows(self) -> Iterator[Tuple[int, CustomerCsvRow]]:
+        return iter_csv_rows(self.csv_file_path, CustomerCsvRow, CUSTOMER_CSV_COLUMNS, ('#', 'الاسم'))
+    
+    def is_in_order(self) -> bool:
+        """هل العملاء مرتبون بعمود # في الملف (مرور سريع على عمودي # والاسم فقط)"""
+        # Rows that fail to parse are included here, so a sorted result is always safe to stream
+        return is_sorted(
+            customer_order_key(parse_csv_order(row.csv_order))
+            for _, row in self.rows() if row.name and row.name.strip()
+        )
+    
+    def __iter__(self) -> Iterator[Dict]:
+        for row_num, row in self.rows():
+            try:
+                # Skip empty rows
+                if not row.name.strip():
+                    continue
+                
+                # Get CSV order number (from '#' column)
+                csv_order_str = row.csv_order.strip()
+                csv_order = parse_csv_order(csv_order_str)
+                
+                name = row.name.strip()
+                phone = row.phone.strip()
+                address = row.address.strip()
+                notes = row.notes.strip()
+                
+                if name:
+                    yield {
+                        'csv_order': csv_order,
+                        'name': name,
+                        'phone': phone,
+                        'address': address,
+                        'notes': notes
+                    }
+                    
+            except Exception as e:
+                print(f"❌ خطأ في السطر {row_num}: {e}")
+                self.skipped += 1
+                continue
+
+
+def ordered_customers(reader: CustomerCsvReader) -> Iterator[Dict]:
+    """العملاء بترتيب عمود # (نفس نتيجة الترتيب المستقر في الذاكرة) بذاكرة محدودة
+    
+    إذا كان الملف مرتباً تُقرأ الصفوف مباشرة بدون ترتيب، وإلا يتم ترتيبها على أجزاء
+    من CUSTOMER_SORT_CHUNK_ROWS عميل (على القرص إذا كانت أكثر من جزء واحد).
+    """
+    if reader.is_in_order():
+        print("  ↕️  العملاء مرتبون بعمود # في الملف، سيتم الاستيراد مباشرة بدون ترتيب")
+        return iter(reader)
+    return external_sorted(reader, key=lambda x: customer_order_key(x['csv_order']),
+                           chunk_size=CUSTOMER_SORT_CHUNK_ROWS)
+
+
 def import_customers(csv_file_path: str, connection):
     """استيراد العملاء من CSV مع الحفاظ على الترتيب"""
     print(f"\n📋 جاري استيراد العملاء من: {csv_file_path}")
@@ -300,90 +629,165 @@ def import_customers(csv_file_path: str, connection):
         max_id_result = cursor.fetchone()
         current_max_id = max_id_result[0] if max_id_result[0] else 0
         
-        with open(csv_file_path, 'r', encoding='utf-8') as file:
-            # Read all lines
-            lines = file.readlines()
-            
-            # Skip BOM if present
-            if lines and lines[0].startswith('\ufeff'):
-                lines[0] = lines[0][1:]
-            
-            # Skip first line if it's a title (doesn't contain column names)
-            start_line = 0
-            if lines and '#' not in lines[0] and 'الاسم' not in lines[0]:
-                start_line = 1
-            
-            # Create reader starting from actual header
-            reader = csv.DictReader(lines[start_line:])
-            
-            # Store all customers first to maintain order
-            customers_list = []
-            
-            for row_num, row in enumerate(reader, start=start_line+2):
-                try:
-                    # Skip empty rows
-                    if not row.get('الاسم', '').strip():
-                        continue
-                    
-                    # Get CSV order number (from '#' column)
-                    csv_order_str = row.get('#', '').strip()
-                    csv_order = int(csv_order_str) if csv_order_str and csv_order_str.isdigit() else None
-                    
-                    name = row.get('الاسم', '').strip()
-                    phone = row.get('رقم الجوال', '').strip()
-                    address = row.get('المنطقة', '').strip()
-                    notes = row.get('علامه', '').strip()
-                    
-                    if name:
-                        customers_list.append({
-                            'csv_order': csv_order,
-                            'name': name,
-                            'phone': phone,
-                            'address': address,
-                            'notes': notes
-                        })
-                        
-                except Exception as e:
-                    print(f"❌ خطأ في السطر {row_num}: {e}")
-                    customers_skipped += 1
-                    continue
-            
-            # Sort by CSV order to maintain the order
-            customers_list.sort(key=lambda x: x['csv_order'] if x['csv_order'] else 999999)
-            
-            # Insert customers in order
-            for customer_data in customers_list:
-                try:
-                    customer_id = get_or_create_customer(
-                        connection, 
-                        customer_data['name'], 
-                        customer_data['phone'], 
-                        customer_data['address'], 
-                        customer_data['notes'], 
-                        customer_data['csv_order']
-                    )
-                    
-                    if customer_id:
-                        customers_imported += 1
-                        if customers_imported % 50 == 0:
-                            print(f"  ✅ تم استيراد {customers_imported} عميل...")
-                    else:
-                        customers_skipped += 1
-                        
-                except Exception as e:
-                    print(f"❌ خطأ في إدراج العميل {customer_data['name']}: {e}")
-                    customers_skipped += 1
-                    continue
+        # Customers in '#' order: streamed when the file is already sorted, otherwise sorted on disk
+        reader = CustomerCsvReader(csv_file_path)
+        customers = ordered_customers(reader)
         
+        # Skip rows already imported by a previous (interrupted) run
+        ledger = load_ledger(connection, 'csv_customer')
+        if ledger is not None:
+            customers = ledger.skip_done(customers, key=lambda x: x['csv_order'])
+        
+        # Insert customers in order
+        if CUSTOMER_IMPORT_MODE == 'load':
+            # The load path plans the whole file at once, so it needs the full list
+            customers_list = list(customers)
+            try:
+                imported, skipped = upsert_customers_load_data(customers_list, ledger)
+            except Error as e:
+                # e.g. local_infile disabled on the server: use the batched path instead
+                print(f"⚠️  تعذر استخدام LOAD DATA LOCAL INFILE، سيتم الاستيراد على دفعات: {e}")
+                imported, skipped = upsert_customers_batched(connection, customers_list, IMPORT_BATCH_SIZE, ledger)
+        elif CUSTOMER_IMPORT_MODE == 'batch':
+            imported, skipped = upsert_customers_batched(connection, customers, IMPORT_BATCH_SIZE, ledger)
+        else:
+            # Without CUSTOMER_INDEX=1 every row is matched by the server's own queries
+            customer_index = CustomerIndex.load(connection) if CUSTOMER_INDEX else None
+            if customer_index is not None:
+                print(f"  📇 تم تحميل {len(customer_index)} عميل موجود في الفهرس")
+            imported, skipped = upsert_customers_row_by_row(connection, customers, customer_index,
+                                                            ledger=ledger)
+        if ledger is not None:
+            ledger.print_skipped()
+        customers_skipped += reader.skipped
+        customers_imported += imported
+        customers_skipped += skipped
+    
         cursor.close()
         print(f"\n✅ تم استيراد {customers_imported} عميل بالترتيب")
         if customers_skipped > 0:
             print(f"⚠️  تم تخطي {customers_skipped} عميل")
+        print_statement_stats()
             
     except Exception as e:
         print(f"❌ خطأ في قراءة ملف العملاء: {e}")
 
 
+def import_invoice_row(connection, row_num: int, row: InvoiceCsvRow, customer_index: Optional[CustomerIndex] = None,
+                       commit_policy: Optional[CommitPolicy] = None,
+                       ledger: Optional[ImportLedger] = None, parsed: Optional[Tuple] = None) -> Optional[bool]:
+    """استيراد فاتورة واحدة من CSV، ويُرجع True عند الاستيراد و False عند التخطي و None للصفوف الفارغة
+    
+    parsed = (الإجمالي، المدفوع، المتبقي، التاريخ) محوّلة مسبقاً من parse_invoice_columns.
+    """
+    transaction = commit_policy or connection
+    try:
+        # Skip empty rows
+        # CSV has empty first column, so invoice number is under '#' key
+        invoice_number = row.invoice_number.strip()
+        if not invoice_number or invoice_number == '':
+            return None
+        
+        # Get customer name
+        customer_name = row.customer_name.strip()
+        if not customer_name:
+            return False
+        
+        # Get or create customer (phone is not in invoices CSV)
+        customer_id = get_or_create_customer(
+            connection, customer_name, None, customer_index=customer_index, commit_policy=commit_policy
+        )
+        
+        if not customer_id:
+            print(f"⚠️  لم يتم العثور على العميل: {customer_name}")
+            return False
+        
+        if parsed is not None:
+            total_amount, amount_paid, remaining_amount, invoice_date = parsed
+        else:
+            # Parse invoice data
+            total_amount = parse_amount(row.total_amount)
+            amount_paid = parse_amount(row.amount_paid)
+            remaining_amount = parse_amount(row.remaining_amount)
+            
+            # Parse date
+            date_str = row.date
+            invoice_date = parse_arabic_date(date_str)
+        
+        # Map status
+        status = map_invoice_status(row.status)
+        
+        # Map invoice type
+        invoice_type = map_invoice_type(row.invoice_type)
+        
+        # Get branch and user IDs
+        branch_name = row.branch_name.strip()
+        user_name = row.user_name.strip()
+        
+        # Payment method
+        payment_method = row.payment_method.strip()
+        
+        # Insert invoice
+        try:
+            invoice_id = prepared_statements(connection).insert(
+                'Invoice.insert',
+                """INSERT INTO Invoice 
+                   (totalAmount, amountPaid, status, customerId, 
+                    invoiceType, currency, notes, createdAt, updatedAt)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())""",
+                (total_amount, amount_paid, status, customer_id,
+                 invoice_type, 'EGP', 
+                 f'Payment Method: {payment_method}',
+                 invoice_date if invoice_date else datetime.now())
+            )
+            if ledger is not None:
+                ledger.record(connection, invoice_number, invoice_id)
+            transaction.commit()
+            return True
+                
+        except Error as e:
+            # Invoice already exists (Duplicate entry): skip without a message
+            if 'Duplicate entry' not in str(e):
+                print(f"❌ خطأ في إدراج الفاتورة {invoice_number}: {e}")
+            transaction.rollback()
+            return False
+            
+    except BatchRollback:
+        raise
+    except Exception as e:
+        print(f"❌ خطأ في السطر {row_num}: {e}")
+        return False
+
+
+def parse_invoice_columns(rows: List[InvoiceCsvRow]) -> List[Tuple]:
+    """تحويل أعمدة المبالغ والتاريخ لكل الصفوف مرة واحدة: (الإجمالي، المدفوع، المتبقي، التاريخ) لكل صف"""
+    return list(zip(
+        parse_amounts([row.total_amount for row in rows]),
+        parse_amounts([row.amount_paid for row in rows]),
+        parse_amounts([row.remaining_amount for row in rows]),
+        parse_dates([row.date for row in rows]),
+    ))
+
+
+def iter_parsed_invoice_chunks(rows: Iterable[Tuple[int, InvoiceCsvRow]],
+                               chunk_size: int) -> Iterator[List[Tuple[Tuple[int, InvoiceCsvRow], Tuple]]]:
+    """أجزاء من ((رقم السطر، الصف)، القيم المحوّلة)؛ الأعمدة تُحوّل لكل جزء حتى تبقى الذاكرة محدودة"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, max(1, chunk_size)))
+        if not chunk:
+            break
+        yield list(zip(chunk, parse_invoice_columns([row for _, row in chunk])))
+
+
+def print_parse_cache_stats():
+    """طباعة إصابات وإخفاقات الذاكرة المؤقتة لتحويل التواريخ والحالات والأنواع"""
+    print("🧠 ذاكرة التحويل المؤقتة (LRU):")
+    for function in (parse_arabic_date, map_invoice_status, map_invoice_type):
+        info = function.cache_info()
+        print(f"  {function.__name__}: {info.hits} إصابة، {info.misses} إخفاق ({info.currsize}/{info.maxsize} قيمة)")
+
+
 def import_invoices(csv_file_path: str, connection, is_completed: bool = False):
     """استيراد الفواتير من CSV"""
     status_label = "المنتهية" if is_completed else "غير المقفولة"
@@ -397,108 +801,47 @@ def import_invoices(csv_file_path: str, connection, is_completed: bool = False):
     invoices_skipped = 0
     
     try:
-        with open(csv_file_path, 'r', encoding='utf-8') as file:
-            # Read all lines
-            lines = file.readlines()
-            
-            # Skip BOM if present
-            if lines and lines[0].startswith('\ufeff'):
-                lines[0] = lines[0][1:]
-            
-            # Skip first line if it's a title (doesn't contain column names)
-            start_line = 0
-            if lines and '#' not in lines[0] and 'الفرع' not in lines[0]:
-                start_line = 1
-            
-            # Create reader starting from actual header
-            reader = csv.DictReader(lines[start_line:])
-            
-            for row_num, row in enumerate(reader, start=start_line+2):
-                try:
-                    # Skip empty rows
-                    # CSV has empty first column, so invoice number is under '#' key
-                    invoice_number = row.get('#', '').strip()
-                    if not invoice_number or invoice_number == '':
-                        continue
-                    
-                    # Get customer name
-                    customer_name = row.get('العميل', '').strip()
-                    if not customer_name:
-                        invoices_skipped += 1
-                        continue
-                    
-                    # Get or create customer (phone is not in invoices CSV)
-                    customer_id = get_or_create_customer(
-                        connection, customer_name, None
-                    )
-                    
-                    if not customer_id:
-                        print(f"⚠️  لم يتم العثور على العميل: {customer_name}")
-                        invoices_skipped += 1
-                        continue
-                    
-                    # Parse invoice data
-                    total_amount = parse_amount(row.get('الإجمالى', '0'))
-                    amount_paid = parse_amount(row.get('المدفوع', '0'))
-                    remaining_amount = parse_amount(row.get('المتبقى', '0'))
-                    
-                    # Parse date
-                    date_str = row.get('التاريخ', '')
-                    invoice_date = parse_arabic_date(date_str)
-                    
-                    # Map status
-                    status = map_invoice_status(row.get('الحالة', 'تم الاستلام من العميل'))
-                    
-                    # Map invoice type
-                    invoice_type = map_invoice_type(row.get('النوع', 'فاتورة صيانه'))
-                    
-                    # Get branch and user IDs
-                    branch_name = row.get('الفرع', '').strip()
-                    user_name = row.get('المستخدم', '').strip()
-                    
-                    # Payment method
-                    payment_method = row.get('طريقة الدفع', 'كاش').strip()
-                    
-                    # Insert invoice
-                    cursor = connection.cursor()
-                    try:
-                        cursor.execute(
-                            """INSERT INTO Invoice 
-                               (totalAmount, amountPaid, status, customerId, 
-                                invoiceType, currency, notes, createdAt, updatedAt)
-                               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())""",
-                            (total_amount, amount_paid, status, customer_id,
-                             invoice_type, 'EGP', 
-                             f'Payment Method: {payment_method}',
-                             invoice_date if invoice_date else datetime.now())
-                        )
-                        
-                        invoice_id = cursor.lastrowid
-                        connection.commit()
-                        invoices_imported += 1
-                        
-                        if invoices_imported % 50 == 0:
-                            print(f"  ✅ تم استيراد {invoices_imported} فاتورة...")
-                            
-                    except Error as e:
-                        if 'Duplicate entry' in str(e):
-                            # Invoice already exists, skip
-                            invoices_skipped += 1
-                        else:
-                            print(f"❌ خطأ في إدراج الفاتورة {invoice_number}: {e}")
-                            invoices_skipped += 1
-                        connection.rollback()
-                    finally:
-                        cursor.close()
-                        
-                except Exception as e:
-                    print(f"❌ خطأ في السطر {row_num}: {e}")
-                    invoices_skipped += 1
-                    continue
+        customer_index = CustomerIndex.load(connection) if CUSTOMER_INDEX else None
+        
+        # Skip invoices (by '#') already imported from this file by a previous run
+        ledger = load_ledger(connection, 'csv_invoice_completed' if is_completed else 'csv_invoice_open')
+        rows = iter_csv_rows(csv_file_path, InvoiceCsvRow, INVOICE_CSV_COLUMNS, ('#', 'الفرع'), INVOICE_CSV_DEFAULTS)
+        if ledger is not None:
+            rows = ledger.skip_done(rows, key=lambda item: (item[1].invoice_number or '').strip() or None)
         
+        # With IMPORT_PIPELINE the file is read and parsed in a separate thread while rows are inserted
+        chunks = iter_parsed_invoice_chunks(rows, CSV_CHUNK_ROWS)
+        invoice_pipeline = Pipeline('csv_invoices') if IMPORT_PIPELINE else None
+        if invoice_pipeline is not None:
+            chunks = invoice_pipeline.run(chunks)
+        
+        on_rollback = (lambda: customer_index.reload(connection)) if customer_index is not None else None
+        commit_policy = CommitPolicy(connection, on_rollback=on_rollback)
+        results = commit_policy.run(
+            chain.from_iterable(chunks),
+            lambda item: import_invoice_row(
+                connection, item[0][0], item[0][1], customer_index, commit_policy, ledger, item[1]
+            )
+        )
+        for imported in results:
+            if imported is None:
+                continue
+            if imported:
+                invoices_imported += 1
+                if invoices_imported % 50 == 0:
+                    print(f"  ✅ تم استيراد {invoices_imported} فاتورة...")
+            else:
+                invoices_skipped += 1
+    
+        if ledger is not None:
+            ledger.print_skipped()
         print(f"\n✅ تم استيراد {invoices_imported} فاتورة")
         if invoices_skipped > 0:
             print(f"⚠️  تم تخطي {invoices_skipped} فاتورة")
+        print_statement_stats()
+        print_parse_cache_stats()
+        if invoice_pipeline is not None:
+            invoice_pipeline.print_stats()
             
     except Exception as e:
         print(f"❌ خطأ في قراءة ملف الفواتير: {e}")
@@ -523,7 +866,7 @@ def main():
     # Connect to database
     try:
         print(f"\n🔌 جاري الاتصال بقاعدة البيانات: {DB_CONFIG['database']}")
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = connect()
         print("✅ تم الاتصال بنجاح\n")
         
         # Import customers only
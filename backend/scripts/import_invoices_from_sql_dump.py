@@ -13,9 +13,12 @@ import re
 import json
 import os
 import sys
-from datetime import datetime
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
 from decimal import Decimal
-from typing import Dict, Optional, Tuple, List
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Optional, Tuple, List
 
 try:
     import mysql.connector
@@ -25,15 +28,130 @@ except ImportError:
     print("📦 يرجى تثبيته باستخدام: pip3 install mysql-connector-python")
     sys.exit(1)
 
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'user': os.getenv('DB_USER', 'root'),
-    'password': os.getenv('DB_PASSWORD', ''),
-    'database': os.getenv('DB_NAME', 'FZ'),
-    'port': int(os.getenv('DB_PORT', 3306)),
-    'charset': 'utf8mb4',
-    'collation': 'utf8mb4_unicode_ci'
-}
+from customer_index import CUSTOMER_INDEX, CollationKeys, CustomerIndex, collation_key_sql, server_collation_keys
+from db_access import (DB_CONFIG, LEGACY_DATABASE, STATEMENT_STATS, BatchRollback, CommitPolicy, RowTransaction,
+                       connect, connect_server, merge_statement_stats, prepared_statements, print_statement_stats)
+from dump_index import DumpIndex, load_tables_into_temp_db, mysql_cli_command
+from import_ledger import ImportLedger, load_ledger, load_watermark, save_watermark
+from legacy_dump import SqlDumpReader
+from pipeline import IMPORT_PIPELINE, Pipeline
+
+# وضع الاستيراد: 'row' (فاتورة واحدة في كل مرة) أو 'batch' (دفعات متعددة الصفوف)
+# أو 'sql' (جداول staging في قاعدة البيانات الهدف ثم INSERT ... SELECT لكل جدول، للترحيل الكامل)
+INVOICE_IMPORT_MODE = os.getenv('INVOICE_IMPORT_MODE', 'row')
+
+# عدد الفواتير القديمة في كل دفعة (transaction واحدة) في وضع batch
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+
+# مصدر بيانات النظام القديم: 'temp_db' (استيراد الـ dump إلى temp_import_db) أو 'dump' (قراءة الملف مباشرة)
+LEGACY_SOURCE = os.getenv('LEGACY_SOURCE', 'temp_db')
+
+# الإبقاء على temp_import_db بعد الاستيراد حتى تتخطى التشغيلات التالية الجداول التي لم تتغير
+KEEP_TEMP_DB = os.getenv('KEEP_TEMP_DB', '0') == '1'
+
+# جداول النظام القديم التي يحتاجها الترحيل
+IMPORT_TABLES = ('invoices', 'clients', 'branches', 'status', 'invoice_status', 'invoice_services')
+
+# عدد العمليات لترحيل الفواتير بالتوازي من temp_import_db (كل عملية تأخذ نطاقاً من معرفات invoices)
+INVOICE_WORKERS = int(os.getenv('INVOICE_WORKERS', 1))
+
+# الاستيراد التزايدي: ترحيل الفواتير الجديدة أو المعدلة منذ آخر تشغيل فقط (من temp_import_db)
+# وتحديث صفوفها الموجودة بدلاً من إنشاء صفوف جديدة. أول تشغيل بهذا الوضع يرحّل الكل ويحفظ العلامة.
+# إذا فشلت كتابة فواتير لا تتقدم العلامة بعد أقدمها، فتُفحص مرة أخرى في التشغيل التالي
+# (الفواتير بدون عميل تُطبع وتُحسب أخطاء لكنها لا توقف العلامة).
+INVOICE_IMPORT_DELTA = os.getenv('INVOICE_IMPORT_DELTA', '0') == '1'
+
+# مصدر الفواتير في سجل الاستيراد (_import_ledger) والمفتاح هو oldInvoiceId
+LEDGER_SOURCE = 'invoice'
+
+# عدد الصفوف التي تُجلب من الخادم في كل مرة عند قراءة الفواتير القديمة بشكل متدفق
+STREAM_FETCH_SIZE = int(os.getenv('STREAM_FETCH_SIZE', 1000))
+
+DEVICE_INSERT_SQL = """INSERT INTO Device 
+               (customerId, deviceType, brand, model, serialNumber, cpu, gpu, ram, storage, customFields, createdAt)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())"""
+
+REPAIR_REQUEST_INSERT_SQL = """INSERT INTO RepairRequest 
+               (deviceId, customerId, branchId, reportedProblem, status, customFields, createdAt, updatedAt)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
+
+INVOICE_INSERT_SQL = """INSERT INTO Invoice 
+               (repairRequestId, totalAmount, amountPaid, status, currency, notes, createdAt, updatedAt)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
+
+DEVICE_UPDATE_SQL = """UPDATE Device SET
+               customerId = %s, deviceType = %s, brand = %s, model = %s, serialNumber = %s,
+               cpu = %s, gpu = %s, ram = %s, storage = %s, customFields = %s
+               WHERE id = %s"""
+
+REPAIR_REQUEST_UPDATE_SQL = """UPDATE RepairRequest SET
+               deviceId = %s, customerId = %s, branchId = %s, reportedProblem = %s, status = %s,
+               customFields = %s, createdAt = %s, updatedAt = %s
+               WHERE id = %s"""
+
+INVOICE_UPDATE_SQL = """UPDATE Invoice SET
+               repairRequestId = %s, totalAmount = %s, amountPaid = %s, status = %s, currency = %s,
+               notes = %s, createdAt = %s, updatedAt = %s
+               WHERE id = %s"""
+
+# عناصر الفاتورة المنشأة من الخدمات القديمة (خدمات نصية بدون serviceId)
+MIGRATED_ITEMS_DELETE_SQL = """DELETE FROM InvoiceItem
+               WHERE invoiceId = %s AND itemType = 'service' AND serviceId IS NULL"""
+
+INVOICE_ITEM_INSERT_SQL = """INSERT INTO InvoiceItem 
+                       (invoiceId, description, quantity, unitPrice, totalPrice, itemType, serviceId, createdAt, updatedAt)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW())"""
+
+# جداول staging في قاعدة البيانات الهدف لوضع sql (تُحذف بعد الترحيل)
+STAGING_TABLES = ('_import_stage_map', '_import_stage_invoices', '_import_stage_services')
+
+# ربط معرفات النظام القديم بالجديد: kind = 'client' أو 'branch' (new_id) أو 'status' (new_status)
+STAGE_MAP_DDL = """CREATE TABLE _import_stage_map (
+    kind VARCHAR(16) NOT NULL,
+    old_id INT NOT NULL,
+    new_id INT NULL,
+    new_status VARCHAR(32) NULL,
+    PRIMARY KEY (kind, old_id)
+)"""
+
+# الفواتير القديمة بعد التحويل (JSON والتواريخ وآخر حالة والعميل والفرع)، ومعرفات الصفوف الجديدة
+STAGE_INVOICES_DDL = """CREATE TABLE _import_stage_invoices (
+    id INT NOT NULL PRIMARY KEY,
+    client_id INT NULL,
+    customer_id INT NULL,
+    branche_id INT NULL,
+    branch_id INT NULL,
+    status_id INT NULL,
+    new_status VARCHAR(32) NULL,
+    creator_id INT NULL,
+    device_type TEXT NULL,
+    brand TEXT NULL,
+    device_model TEXT NULL,
+    device_sn TEXT NULL,
+    purchase_date TEXT NULL,
+    problem_description TEXT NULL,
+    specs JSON NULL,
+    accessories JSON NULL,
+    examination JSON NULL,
+    received_at DATETIME(6) NULL,
+    invoice_date DATETIME(6) NULL,
+    total DOUBLE NOT NULL,
+    paid DOUBLE NOT NULL,
+    note TEXT NULL,
+    device_id INT NULL,
+    repair_request_id INT NULL,
+    invoice_id INT NULL,
+    KEY (repair_request_id)
+) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"""
+
+# الخدمات القديمة للفواتير المرحّلة (بدون الخدمات بدون اسم)
+STAGE_SERVICES_DDL = """CREATE TABLE _import_stage_services (
+    id INT NOT NULL PRIMARY KEY,
+    invoice_id INT NOT NULL,
+    title TEXT NOT NULL,
+    price DOUBLE NOT NULL,
+    KEY (invoice_id)
+) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"""
 
 SQL_DUMP_FILE = os.path.join(
     os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
@@ -42,10 +160,12 @@ SQL_DUMP_FILE = os.path.join(
 )
 
 
-def import_sql_dump_to_temp_db(sql_file: str) -> bool:
-    """استيراد SQL dump إلى قاعدة بيانات مؤقتة باستخدام mysql command"""
-    import subprocess
-    
+def import_sql_dump_to_temp_db(sql_file: str, tables: Iterable[str] = IMPORT_TABLES) -> bool:
+    """استيراد جداول SQL dump المطلوبة إلى قاعدة بيانات مؤقتة باستخدام mysql command
+
+    يستخدم فهرس الـ dump (ملف .index.json بجانبه) لتمرير جمل الجداول المطلوبة فقط،
+    ويتخطى الجداول التي لم يتغير محتواها منذ آخر استيراد.
+    """
     print(f"📖 جاري استيراد SQL dump إلى قاعدة بيانات مؤقتة...")
     
     if not os.path.exists(sql_file):
@@ -53,92 +173,68 @@ def import_sql_dump_to_temp_db(sql_file: str) -> bool:
         return False
     
     try:
-        # إنشاء قاعدة بيانات مؤقتة
-        print("  📦 إنشاء قاعدة بيانات مؤقتة...")
-        mysql_cmd = f"/opt/lampp/bin/mysql -u {DB_CONFIG['user']}"
-        if DB_CONFIG['password']:
-            mysql_cmd += f" -p{DB_CONFIG['password']}"
-        mysql_cmd += f" -e \"DROP DATABASE IF EXISTS temp_import_db; CREATE DATABASE temp_import_db CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;\""
-        
-        result = subprocess.run(mysql_cmd, shell=True, capture_output=True, text=True)
-        
-        if result.returncode != 0 and 'Access denied' not in result.stderr:
-            print(f"⚠️  تحذير: {result.stderr[:200]}")
-        
-        # استيراد ملف SQL
-        print("  📖 استيراد ملف SQL dump...")
-        mysql_cmd = f"/opt/lampp/bin/mysql -u {DB_CONFIG['user']}"
-        if DB_CONFIG['password']:
-            mysql_cmd += f" -p{DB_CONFIG['password']}"
-        mysql_cmd += " temp_import_db"
-        
-        with open(sql_file, 'r', encoding='utf-8') as f:
-            result = subprocess.run(
-                mysql_cmd,
-                shell=True,
-                stdin=f,
-                capture_output=True,
-                text=True,
-                check=False
-            )
+        print("  🗂️  قراءة فهرس ملف SQL dump...")
+        index = DumpIndex.load(sql_file)
+        
+        connection = connect_server()
+        try:
+            loaded = load_tables_into_temp_db(connection, index, tables, mysql_cli_command(DB_CONFIG))
+        finally:
+            connection.close()
         
-        if result.returncode == 0:
-            print("✅ تم استيراد SQL dump بنجاح")
-            return True
+        if loaded:
+            print(f"✅ تم استيراد الجداول: {', '.join(loaded)}")
         else:
-            # في بعض الأحيان يعود خطأ لكن البيانات تم استيرادها
-            if 'Table' in result.stderr and 'doesn\'t exist' not in result.stderr:
-                print("✅ تم استيراد SQL dump (مع بعض التحذيرات)")
-                return True
-            else:
-                print(f"⚠️  تحذير في استيراد SQL dump: {result.stderr[:300]}")
-                # نحاول المتابعة على أي حال
-                return True
+            print("✅ الجداول لم تتغير منذ آخر استيراد، تم تخطي الاستيراد")
+        return True
         
     except Exception as e:
         print(f"❌ خطأ في استيراد SQL dump: {e}")
         return False
 
 
-def read_invoices_from_temp_db(connection) -> List[Dict]:
+def legacy_invoice_from_row(row: Dict) -> Dict:
+    """تحويل صف من جدول invoices القديم إلى قاموس الفاتورة المستخدم في الترحيل"""
+    return {
+        'id': row.get('id'),
+        'payment': row.get('payment'),
+        'device_type': row.get('device_type'),
+        'brand': row.get('brand'),
+        'device_model': row.get('device_model'),
+        'device_sn': row.get('device_sn'),
+        'purchase_date': row.get('purchase_date'),
+        'problem_description': row.get('problem_description'),
+        'accessories': row.get('accessories'),
+        'specifcations': row.get('specifcations'),
+        'examination': row.get('examination'),
+        'date': row.get('date'),
+        'entery_at': row.get('entery_at'),
+        'exit_at': row.get('exit_at'),
+        'client_id': row.get('client_id'),
+        'total': float(row.get('total', 0)) if row.get('total') else 0.0,
+        'paid': float(row.get('paid', 0)) if row.get('paid') else 0.0,
+        'due': float(row.get('due', 0)) if row.get('due') else 0.0,
+        'note': row.get('note'),
+        'branche_id': row.get('branche_id'),
+        'creator_id': row.get('creator_id'),
+        'status_id': row.get('status_id'),
+    }
+
+
+def read_invoices_from_temp_db(legacy_connection) -> List[Dict]:
     """قراءة بيانات الفواتير من قاعدة البيانات المؤقتة"""
     print("📖 جاري قراءة بيانات الفواتير...")
     
     invoices = []
-    cursor = connection.cursor(dictionary=True)
+    cursor = legacy_connection.cursor(dictionary=True)
     
     try:
-        cursor.execute("USE temp_import_db")
         cursor.execute("SELECT * FROM invoices ORDER BY id")
         
         rows = cursor.fetchall()
         
         for row in rows:
-            invoice = {
-                'id': row.get('id'),
-                'payment': row.get('payment'),
-                'device_type': row.get('device_type'),
-                'brand': row.get('brand'),
-                'device_model': row.get('device_model'),
-                'device_sn': row.get('device_sn'),
-                'purchase_date': row.get('purchase_date'),
-                'problem_description': row.get('problem_description'),
-                'accessories': row.get('accessories'),
-                'specifcations': row.get('specifcations'),
-                'examination': row.get('examination'),
-                'date': row.get('date'),
-                'entery_at': row.get('entery_at'),
-                'exit_at': row.get('exit_at'),
-                'client_id': row.get('client_id'),
-                'total': float(row.get('total', 0)) if row.get('total') else 0.0,
-                'paid': float(row.get('paid', 0)) if row.get('paid') else 0.0,
-                'due': float(row.get('due', 0)) if row.get('due') else 0.0,
-                'note': row.get('note'),
-                'branche_id': row.get('branche_id'),
-                'creator_id': row.get('creator_id'),
-                'status_id': row.get('status_id'),
-            }
-            invoices.append(invoice)
+            invoices.append(legacy_invoice_from_row(row))
         
         print(f"✅ تم قراءة {len(invoices)} فاتورة")
         return invoices
@@ -150,6 +246,44 @@ def read_invoices_from_temp_db(connection) -> List[Dict]:
         cursor.close()
 
 
+def count_invoices_in_temp_db(legacy_connection) -> int:
+    """عدد الفواتير في قاعدة البيانات المؤقتة"""
+    cursor = legacy_connection.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM invoices")
+        return cursor.fetchone()[0]
+    except Exception as e:
+        print(f"❌ خطأ في قراءة البيانات: {e}")
+        return 0
+    finally:
+        cursor.close()
+
+
+def iter_invoices_from_temp_db(legacy_connection, fetch_size: int = STREAM_FETCH_SIZE,
+                               id_range: Optional[Tuple[int, int]] = None) -> Iterator[Dict]:
+    """قراءة الفواتير من قاعدة البيانات المؤقتة بشكل متدفق (fetchmany على cursor غير مخزّن)
+    
+    الـ cursor غير المخزّن يحجز الاتصال حتى انتهاء القراءة، لذلك يجب تمرير اتصال
+    مخصص للقراءة وليس اتصال temp_import_db المستخدم في باقي الاستعلامات.
+    id_range = (أول معرف، آخر معرف) لقراءة جزء من الفواتير فقط.
+    """
+    cursor = legacy_connection.cursor(dictionary=True, buffered=False)
+    try:
+        if id_range:
+            cursor.execute("SELECT * FROM invoices WHERE id BETWEEN %s AND %s ORDER BY id", id_range)
+        else:
+            cursor.execute("SELECT * FROM invoices ORDER BY id")
+        
+        while True:
+            rows = cursor.fetchmany(max(1, fetch_size))
+            if not rows:
+                break
+            for row in rows:
+                yield legacy_invoice_from_row(row)
+    finally:
+        cursor.close()
+
+
 def parse_json_field(value: str) -> Optional[Dict]:
     """تحليل حقل JSON"""
     if not value or value == 'NULL':
@@ -163,10 +297,14 @@ def parse_json_field(value: str) -> Optional[Dict]:
         return None
 
 
-def parse_date(date_str: str) -> Optional[datetime]:
-    """تحليل التاريخ"""
+def parse_date(date_str) -> Optional[datetime]:
+    """تحليل التاريخ (نص، أو date/datetime كما تُرجعه temp_import_db وقارئ الـ dump)"""
     if not date_str or date_str == 'NULL':
         return None
+    if isinstance(date_str, datetime):
+        return date_str
+    if isinstance(date_str, date):
+        return datetime.combine(date_str, datetime.min.time())
     
     try:
         # تنسيقات التاريخ المحتملة
@@ -187,70 +325,119 @@ def parse_date(date_str: str) -> Optional[datetime]:
         return None
 
 
-def map_old_status_to_new(connection, old_status_id: Optional[int]) -> str:
+# تحويل الحالة من العربي إلى الإنجليزي
+OLD_STATUS_MAP = {
+    'تم الاستلام من العميل': 'RECEIVED',
+    'تم التسليم للمهندس وجارى الفحص': 'INSPECTION',
+    'تم الاصلاح وجاهز للاستلام ✨': 'READY_FOR_DELIVERY',
+    'بانتظار قطع غيار': 'WAITING_PARTS',
+    'مرفوض': 'REJECTED',
+    'تم تسليم الجهاز للعميل?✨': 'DELIVERED',
+    'صيانه خارحيه': 'ON_HOLD',
+    'تحت الاختبارت النهائيه...': 'INSPECTION',
+}
+
+
+def map_old_status_to_new(legacy_connection, old_status_id: Optional[int]) -> str:
     """تحويل حالة الفاتورة القديمة إلى الجديدة"""
     if not old_status_id:
         return 'RECEIVED'
     
-    temp_cursor = connection.cursor()
     try:
         # قراءة الحالة من قاعدة البيانات المؤقتة
-        temp_cursor.execute("USE temp_import_db")
-        temp_cursor.execute(
+        status_row = prepared_statements(legacy_connection).fetchone(
+            'status.by_id',
             "SELECT name FROM status WHERE id = %s LIMIT 1",
             (old_status_id,)
         )
-        status_row = temp_cursor.fetchone()
         
         if not status_row:
             return 'RECEIVED'
         
         status_name = status_row[0]
         
-        # تحويل الحالة من العربي إلى الإنجليزي
-        status_map = {
-            'تم الاستلام من العميل': 'RECEIVED',
-            'تم التسليم للمهندس وجارى الفحص': 'INSPECTION',
-            'تم الاصلاح وجاهز للاستلام ✨': 'READY_FOR_DELIVERY',
-            'بانتظار قطع غيار': 'WAITING_PARTS',
-            'مرفوض': 'REJECTED',
-            'تم تسليم الجهاز للعميل?✨': 'DELIVERED',
-            'صيانه خارحيه': 'ON_HOLD',
-            'تحت الاختبارت النهائيه...': 'INSPECTION',
-        }
-        
-        return status_map.get(status_name, 'RECEIVED')
+        return OLD_STATUS_MAP.get(status_name, 'RECEIVED')
         
     except Exception as e:
         print(f"⚠️  خطأ في قراءة الحالة {old_status_id}: {e}")
         return 'RECEIVED'
-    finally:
-        temp_cursor.close()
 
 
-def connect_db():
-    """الاتصال بقاعدة البيانات"""
+class LegacyStatuses:
+    """آخر حالة لكل فاتورة قديمة وجدول الحالات محمّلة مرة واحدة
+
+    بديل عن استعلامي invoice_status و status لكل فاتورة في create_repair_request.
+    """
+
+    def __init__(self, latest_status_ids: Dict[int, int], new_status_by_id: Dict[int, str]):
+        self.latest_status_ids = latest_status_ids
+        self.new_status_by_id = new_status_by_id
+
+    @classmethod
+    def load(cls, legacy_connection, id_range: Optional[Tuple[int, int]] = None) -> 'LegacyStatuses':
+        """قراءة آخر حالة لكل فاتورة (استعلام واحد) وجدول status من قاعدة البيانات المؤقتة
+        
+        id_range = (أول معرف، آخر معرف) لتحميل حالات جزء من الفواتير فقط.
+        """
+        cursor = legacy_connection.cursor()
+        try:
+            cursor.execute(
+                f"""SELECT invoice_id, status_id FROM (
+                       SELECT invoice_id, status_id,
+                              ROW_NUMBER() OVER (
+                                  PARTITION BY invoice_id ORDER BY created_at DESC, id DESC
+                              ) AS rn
+                       FROM invoice_status
+                       {'WHERE invoice_id BETWEEN %s AND %s' if id_range else ''}
+                   ) latest
+                   WHERE rn = 1""",
+                id_range or ()
+            )
+            latest_status_ids = {invoice_id: status_id for invoice_id, status_id in cursor}
+            
+            cursor.execute("SELECT id, name FROM status")
+            new_status_by_id = {
+                status_id: OLD_STATUS_MAP.get(name, 'RECEIVED') for status_id, name in cursor
+            }
+        finally:
+            cursor.close()
+        return cls(latest_status_ids, new_status_by_id)
+
+    def status_for(self, invoice_data: Dict) -> str:
+        """الحالة الجديدة للفاتورة: آخر حالة في invoice_status وإلا status_id في الفاتورة"""
+        status_id = self.latest_status_ids.get(invoice_data.get('id'), invoice_data.get('status_id'))
+        if not status_id:
+            return 'RECEIVED'
+        return self.new_status_by_id.get(status_id, 'RECEIVED')
+
+
+def connect_db(database: Optional[str] = None):
+    """الاتصال بقاعدة البيانات (الهدف افتراضياً أو temp_import_db)"""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = connect(database)
         if connection.is_connected():
-            print(f"✅ تم الاتصال بقاعدة البيانات: {DB_CONFIG['database']}")
+            print(f"✅ تم الاتصال بقاعدة البيانات: {database or DB_CONFIG['database']}")
             return connection
     except Error as e:
         print(f"❌ خطأ في الاتصال بقاعدة البيانات: {e}")
         return None
 
 
-def get_customer_by_old_id(connection, old_client_id: int) -> Optional[int]:
-    """الحصول على ID العميل الجديد من ID القديم"""
-    cursor = connection.cursor()
+def get_customer_by_old_id(connection, legacy_connection, old_client_id: int,
+                           customer_index: Optional[CustomerIndex] = None) -> Optional[int]:
+    """الحصول على ID العميل الجديد من ID القديم
+    
+    connection متصل بقاعدة البيانات الجديدة و legacy_connection بقاعدة البيانات المؤقتة.
+    إذا تم تمرير customer_index تتم المطابقة بالاسم والهاتف من الفهرس بدون استعلام على Customer
+    """
+    statements = prepared_statements(connection)
     try:
         # أولاً: البحث في قاعدة البيانات المؤقتة للحصول على اسم العميل
-        cursor.execute("USE temp_import_db")
-        cursor.execute(
+        old_client = prepared_statements(legacy_connection).fetchone(
+            'clients.by_id',
             "SELECT name, mobile FROM clients WHERE id = %s LIMIT 1",
             (old_client_id,)
         )
-        old_client = cursor.fetchone()
         
         if not old_client:
             return None
@@ -259,29 +446,30 @@ def get_customer_by_old_id(connection, old_client_id: int) -> Optional[int]:
         client_phone = old_client[1] if len(old_client) > 1 else None
         
         # البحث في قاعدة البيانات الجديدة باستخدام الاسم والهاتف
-        cursor.execute("USE FZ")
+        if customer_index is not None:
+            return customer_index.find(client_name, client_phone)
         
         # البحث بالاسم
-        cursor.execute(
+        result = statements.fetchone(
+            'Customer.by_name',
             """SELECT id FROM Customer 
                WHERE name = %s AND deletedAt IS NULL 
                LIMIT 1""",
             (client_name,)
         )
-        result = cursor.fetchone()
         
         if result:
             return result[0]
         
         # إذا لم يتم العثور، البحث بالهاتف
         if client_phone and client_phone != '.':
-            cursor.execute(
+            result = statements.fetchone(
+                'Customer.by_phone',
                 """SELECT id FROM Customer 
                    WHERE phone = %s AND deletedAt IS NULL 
                    LIMIT 1""",
                 (client_phone,)
             )
-            result = cursor.fetchone()
             if result:
                 return result[0]
         
@@ -290,21 +478,17 @@ def get_customer_by_old_id(connection, old_client_id: int) -> Optional[int]:
     except Exception as e:
         print(f"⚠️  خطأ في البحث عن العميل {old_client_id}: {e}")
         return None
-    finally:
-        cursor.close()
 
 
-def get_branch_by_old_id(connection, old_branch_id: int) -> Optional[int]:
+def get_branch_by_old_id(connection, legacy_connection, old_branch_id: int) -> Optional[int]:
     """الحصول على ID الفرع الجديد من ID القديم"""
-    cursor = connection.cursor()
     try:
         # البحث في قاعدة البيانات المؤقتة للحصول على اسم الفرع
-        cursor.execute("USE temp_import_db")
-        cursor.execute(
+        old_branch = prepared_statements(legacy_connection).fetchone(
+            'branches.by_id',
             "SELECT name FROM branches WHERE id = %s LIMIT 1",
             (old_branch_id,)
         )
-        old_branch = cursor.fetchone()
         
         if not old_branch:
             return None
@@ -312,373 +496,1458 @@ def get_branch_by_old_id(connection, old_branch_id: int) -> Optional[int]:
         branch_name = old_branch[0]
         
         # البحث في قاعدة البيانات الجديدة
-        cursor.execute("USE FZ")
-        cursor.execute(
+        result = prepared_statements(connection).fetchone(
+            'Branch.by_name',
             "SELECT id FROM Branch WHERE name = %s LIMIT 1",
             (branch_name,)
         )
-        result = cursor.fetchone()
         
         return result[0] if result else None
         
     except:
         return None
-    finally:
-        cursor.close()
 
 
-def create_device(connection, invoice_data: Dict, customer_id: int) -> Optional[int]:
-    """إنشاء جهاز جديد"""
-    cursor = connection.cursor()
+def spec_value(specs, key: str, length: int) -> Optional[str]:
+    """قيمة نصية غير فارغة من specifications مقصوصة إلى length، وإلا None (أرقام وقيم متداخلة تُتجاهل)"""
+    value = specs.get(key) if isinstance(specs, dict) else None
+    return value[:length] if isinstance(value, str) and value else None
+
+
+def build_device_values(invoice_data: Dict, customer_id: int) -> Tuple:
+    """تجهيز قيم صف Device من بيانات الفاتورة القديمة"""
+    # تحليل specifications
+    specs = parse_json_field(invoice_data.get('specifcations'))
+    
+    # استخراج CPU, GPU, RAM, Storage من specifications
+    cpu = spec_value(specs, 'CPU', 100)
+    gpu = spec_value(specs, 'GPU', 100)
+    ram = spec_value(specs, 'RAM', 50)
+    storage = spec_value(specs, 'Storage', 50)
+    
+    # إنشاء customFields
+    custom_fields = {
+        'oldInvoiceId': invoice_data.get('id'),
+        'purchaseDate': invoice_data.get('purchase_date'),
+        'accessories': parse_json_field(invoice_data.get('accessories')),
+        'examination': parse_json_field(invoice_data.get('examination')),
+    }
     
+    return (
+        customer_id,
+        invoice_data.get('device_type'),
+        invoice_data.get('brand'),
+        invoice_data.get('device_model'),
+        invoice_data.get('device_sn'),
+        cpu,
+        gpu,
+        ram,
+        storage,
+        # purchase_date قد يكون date من temp_import_db: يُحفظ كنص كما في JSON_OBJECT بوضع sql
+        json.dumps(custom_fields, ensure_ascii=False, default=str)
+    )
+
+
+def create_device(connection, invoice_data: Dict, customer_id: int,
+                  commit_policy: Optional[CommitPolicy] = None) -> Optional[int]:
+    """إنشاء جهاز جديد"""
+    transaction = commit_policy or connection
     try:
-        # تحليل specifications
-        specs = parse_json_field(invoice_data.get('specifcations'))
-        
-        # استخراج CPU, GPU, RAM, Storage من specifications
-        cpu = None
-        gpu = None
-        ram = None
-        storage = None
-        
-        if specs:
-            cpu = (specs.get('CPU') or '')[:100] if specs.get('CPU') else None
-            gpu = (specs.get('GPU') or '')[:100] if specs.get('GPU') else None
-            ram = (specs.get('RAM') or '')[:50] if specs.get('RAM') else None
-            storage = (specs.get('Storage') or '')[:50] if specs.get('Storage') else None
-        
-        # إنشاء customFields
-        custom_fields = {
-            'oldInvoiceId': invoice_data.get('id'),
-            'purchaseDate': invoice_data.get('purchase_date'),
-            'accessories': parse_json_field(invoice_data.get('accessories')),
-            'examination': parse_json_field(invoice_data.get('examination')),
-        }
-        
-        cursor.execute(
-            """INSERT INTO Device 
-               (customerId, deviceType, brand, model, serialNumber, cpu, gpu, ram, storage, customFields, createdAt)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())""",
-            (
-                customer_id,
-                invoice_data.get('device_type'),
-                invoice_data.get('brand'),
-                invoice_data.get('device_model'),
-                invoice_data.get('device_sn'),
-                cpu,
-                gpu,
-                ram,
-                storage,
-                json.dumps(custom_fields, ensure_ascii=False)
-            )
+        device_id = prepared_statements(connection).insert(
+            'Device.insert', DEVICE_INSERT_SQL, build_device_values(invoice_data, customer_id)
         )
-        
-        device_id = cursor.lastrowid
-        connection.commit()
+        transaction.commit()
         return device_id
         
     except Error as e:
         print(f"❌ خطأ في إنشاء الجهاز: {e}")
-        connection.rollback()
+        transaction.rollback()
         return None
-    finally:
-        cursor.close()
 
 
-def create_repair_request(connection, invoice_data: Dict, customer_id: int, device_id: int, branch_id: Optional[int]) -> Optional[int]:
-    """إنشاء طلب إصلاح"""
-    cursor = connection.cursor()
+def build_repair_request_values(invoice_data: Dict, customer_id: int, device_id: int,
+                                branch_id: Optional[int], status: str) -> Tuple:
+    """تجهيز قيم صف RepairRequest من بيانات الفاتورة القديمة"""
+    # تحويل التاريخ
+    received_date = parse_date(invoice_data.get('entery_at')) or parse_date(invoice_data.get('date'))
+    
+    # إنشاء customFields
+    custom_fields = {
+        'oldInvoiceId': invoice_data.get('id'),
+        'oldStatusId': invoice_data.get('status_id'),
+        'oldBranchId': invoice_data.get('branche_id'),
+        'oldCreatorId': invoice_data.get('creator_id'),
+    }
+    
+    # إعداد وصف المشكلة مع إضافة رقم الفاتورة القديمة في النهاية
+    problem_description = invoice_data.get('problem_description') or ''
+    old_invoice_id = invoice_data.get('id')
+    if old_invoice_id:
+        problem_description += f"\n\n(الرقم القديم للفاتورة: {old_invoice_id})"
+    
+    return (
+        device_id,
+        customer_id,
+        branch_id,
+        problem_description,
+        status,
+        json.dumps(custom_fields, ensure_ascii=False),
+        received_date or datetime.now(),
+        datetime.now()
+    )
+
+
+def resolve_invoice_status(legacy_connection, invoice_data: Dict) -> str:
+    """قراءة آخر حالة للفاتورة من invoice_status وتحويلها (استعلامان لكل فاتورة)"""
+    # تحويل الحالة - قراءة آخر حالة من invoice_status
+    status_id = invoice_data.get('status_id')
+    # البحث عن آخر حالة في invoice_status من قاعدة البيانات المؤقتة
+    last_status_row = prepared_statements(legacy_connection).fetchone(
+        'invoice_status.latest',
+        """SELECT status_id FROM invoice_status 
+           WHERE invoice_id = %s 
+           ORDER BY created_at DESC, id DESC 
+           LIMIT 1""",
+        (invoice_data.get('id'),)
+    )
+    if last_status_row:
+        status_id = last_status_row[0]
     
+    # تحويل الحالة
+    return map_old_status_to_new(legacy_connection, status_id)
+
+
+def create_repair_request(connection, legacy_connection, invoice_data: Dict, customer_id: int, device_id: int,
+                          branch_id: Optional[int], legacy_statuses: Optional[LegacyStatuses] = None,
+                          commit_policy: Optional[CommitPolicy] = None) -> Optional[int]:
+    """إنشاء طلب إصلاح"""
+    transaction = commit_policy or connection
     try:
-        # تحويل التاريخ
-        received_date = parse_date(invoice_data.get('entery_at')) or parse_date(invoice_data.get('date'))
-        exit_date = parse_date(invoice_data.get('exit_at'))
-        
-        # تحويل الحالة - قراءة آخر حالة من invoice_status
-        status_id = invoice_data.get('status_id')
-        # البحث عن آخر حالة في invoice_status من قاعدة البيانات المؤقتة
-        temp_cursor = connection.cursor()
-        try:
-            temp_cursor.execute("USE temp_import_db")
-            temp_cursor.execute(
-                """SELECT status_id FROM invoice_status 
-                   WHERE invoice_id = %s 
-                   ORDER BY created_at DESC, id DESC 
-                   LIMIT 1""",
-                (invoice_data.get('id'),)
-            )
-            last_status_row = temp_cursor.fetchone()
-            if last_status_row:
-                status_id = last_status_row[0]
-        finally:
-            temp_cursor.close()
-        
-        # تحويل الحالة
-        status = map_old_status_to_new(connection, status_id)
-        
-        # إنشاء customFields
-        custom_fields = {
-            'oldInvoiceId': invoice_data.get('id'),
-            'oldStatusId': invoice_data.get('status_id'),
-            'oldBranchId': invoice_data.get('branche_id'),
-            'oldCreatorId': invoice_data.get('creator_id'),
-        }
-        
-        # إعداد وصف المشكلة مع إضافة رقم الفاتورة القديمة في النهاية
-        problem_description = invoice_data.get('problem_description') or ''
-        old_invoice_id = invoice_data.get('id')
-        if old_invoice_id:
-            problem_description += f"\n\n(الرقم القديم للفاتورة: {old_invoice_id})"
+        # تحويل الحالة (من الخريطة المحمّلة مسبقاً إن وجدت)
+        if legacy_statuses is not None:
+            status = legacy_statuses.status_for(invoice_data)
+        else:
+            status = resolve_invoice_status(legacy_connection, invoice_data)
         
-        # التأكد من أننا نستخدم قاعدة البيانات الرئيسية
-        cursor.execute("USE FZ")
-        cursor.execute(
-            """INSERT INTO RepairRequest 
-               (deviceId, customerId, branchId, reportedProblem, status, customFields, createdAt, updatedAt)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
-            (
-                device_id,
-                customer_id,
-                branch_id,
-                problem_description,
-                status,
-                json.dumps(custom_fields, ensure_ascii=False),
-                received_date or datetime.now(),
-                datetime.now()
-            )
+        repair_request_id = prepared_statements(connection).insert(
+            'RepairRequest.insert',
+            REPAIR_REQUEST_INSERT_SQL,
+            build_repair_request_values(invoice_data, customer_id, device_id, branch_id, status)
         )
-        
-        repair_request_id = cursor.lastrowid
-        connection.commit()
+        transaction.commit()
         return repair_request_id
         
     except Error as e:
         print(f"❌ خطأ في إنشاء طلب الإصلاح: {e}")
-        connection.rollback()
+        transaction.rollback()
         return None
-    finally:
-        cursor.close()
 
 
-def create_invoice(connection, invoice_data: Dict, repair_request_id: int) -> Optional[int]:
-    """إنشاء فاتورة"""
-    cursor = connection.cursor()
+def build_invoice_values(invoice_data: Dict, repair_request_id: int) -> Tuple:
+    """تجهيز قيم صف Invoice من بيانات الفاتورة القديمة"""
+    invoice_date = parse_date(invoice_data.get('date')) or datetime.now()
+    
+    # حساب الحالة
+    total = Decimal(str(invoice_data.get('total', 0)))
+    paid = Decimal(str(invoice_data.get('paid', 0)))
     
+    if paid >= total:
+        status = 'PAID'
+    elif paid > 0:
+        status = 'PARTIAL'
+    else:
+        status = 'UNPAID'
+    
+    return (
+        repair_request_id,
+        total,
+        paid,
+        status,
+        'EGP',
+        invoice_data.get('note'),
+        invoice_date,
+        datetime.now()
+    )
+
+
+def create_invoice(connection, invoice_data: Dict, repair_request_id: int,
+                   commit_policy: Optional[CommitPolicy] = None) -> Optional[int]:
+    """إنشاء فاتورة"""
+    transaction = commit_policy or connection
     try:
-        invoice_date = parse_date(invoice_data.get('date')) or datetime.now()
-        
-        # حساب الحالة
-        total = Decimal(str(invoice_data.get('total', 0)))
-        paid = Decimal(str(invoice_data.get('paid', 0)))
-        
-        if paid >= total:
-            status = 'PAID'
-        elif paid > 0:
-            status = 'PARTIAL'
-        else:
-            status = 'UNPAID'
-        
-        cursor.execute("USE FZ")
-        cursor.execute(
-            """INSERT INTO Invoice 
-               (repairRequestId, totalAmount, amountPaid, status, currency, notes, createdAt, updatedAt)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
-            (
-                repair_request_id,
-                total,
-                paid,
-                status,
-                'EGP',
-                invoice_data.get('note'),
-                invoice_date,
-                datetime.now()
-            )
+        invoice_id = prepared_statements(connection).insert(
+            'Invoice.insert', INVOICE_INSERT_SQL, build_invoice_values(invoice_data, repair_request_id)
         )
-        
-        invoice_id = cursor.lastrowid
-        connection.commit()
+        transaction.commit()
         return invoice_id
         
     except Error as e:
         print(f"❌ خطأ في إنشاء الفاتورة: {e}")
-        connection.rollback()
+        transaction.rollback()
         return None
-    finally:
-        cursor.close()
 
 
-def create_invoice_items_from_old_services(connection, old_invoice_id: int, new_invoice_id: int) -> int:
+def build_invoice_item_values(new_invoice_id: int, title: Optional[str], price) -> Optional[Tuple]:
+    """تجهيز قيم صف InvoiceItem من خدمة قديمة (None إذا كانت الخدمة بدون اسم)"""
+    service_title = (title or '').strip()
+    service_price = float(price or 0)
+    
+    if not service_title:
+        return None
+    
+    # إنشاء InvoiceItem كخدمة نصية (serviceId = NULL)
+    return (
+        new_invoice_id,
+        service_title,
+        1,  # quantity = 1
+        service_price,
+        service_price,  # totalPrice = quantity * unitPrice
+        'service',
+        None,  # serviceId = NULL لأنها خدمة نصية غير محفوظة
+    )
+
+
+def create_invoice_items_from_old_services(connection, legacy_connection, old_invoice_id: int, new_invoice_id: int,
+                                          commit_policy: Optional[CommitPolicy] = None) -> int:
     """إنشاء عناصر الفاتورة من الخدمات القديمة"""
-    cursor = connection.cursor()
+    statements = prepared_statements(connection)
+    transaction = commit_policy or connection
     items_created = 0
     
     try:
         # قراءة الخدمات من قاعدة البيانات المؤقتة
-        temp_cursor = connection.cursor(dictionary=True)
-        temp_cursor.execute("USE temp_import_db")
-        temp_cursor.execute(
+        _, services = prepared_statements(legacy_connection).run(
+            'invoice_services.by_invoice',
             """SELECT title, price 
                FROM invoice_services 
                WHERE invoice_id = %s
                ORDER BY id""",
             (old_invoice_id,)
         )
-        services = temp_cursor.fetchall()
-        temp_cursor.close()
         
         if not services:
             return 0
         
         # إنشاء عناصر الفاتورة
-        cursor.execute("USE FZ")
-        for service in services:
-            service_title_raw = service.get('title')
-            service_title = (service_title_raw or '').strip()
-            service_price = float(service.get('price') or 0)
-            
-            if not service_title:
+        for title, price in services:
+            item_values = build_invoice_item_values(new_invoice_id, title, price)
+            if not item_values:
                 continue
             
             try:
-                # إنشاء InvoiceItem كخدمة نصية (serviceId = NULL)
-                cursor.execute(
-                    """INSERT INTO InvoiceItem 
-                       (invoiceId, description, quantity, unitPrice, totalPrice, itemType, serviceId, createdAt, updatedAt)
-                       VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW())""",
-                    (
-                        new_invoice_id,
-                        service_title,
-                        1,  # quantity = 1
-                        service_price,
-                        service_price,  # totalPrice = quantity * unitPrice
-                        'service',
-                        None,  # serviceId = NULL لأنها خدمة نصية غير محفوظة
-                    )
-                )
+                statements.insert('InvoiceItem.insert', INVOICE_ITEM_INSERT_SQL, item_values)
                 items_created += 1
             except Error as e:
-                print(f"  ⚠️  خطأ في إنشاء عنصر الخدمة '{service_title}': {e}")
+                print(f"  ⚠️  خطأ في إنشاء عنصر الخدمة '{item_values[1]}': {e}")
                 continue
         
-        connection.commit()
+        transaction.commit()
         return items_created
         
     except Error as e:
         print(f"❌ خطأ في إنشاء عناصر الفاتورة: {e}")
-        connection.rollback()
+        transaction.rollback()
         return items_created
+
+
+def migrate_invoice_row(connection, legacy_connection, idx: int, invoice_data: Dict,
+                        customer_index: Optional[CustomerIndex] = None,
+                        legacy_statuses: Optional[LegacyStatuses] = None,
+                        commit_policy: Optional[CommitPolicy] = None,
+                        ledger: Optional[ImportLedger] = None) -> Dict[str, int]:
+    """ترحيل فاتورة قديمة واحدة، ويُرجع ما تم إنشاؤه لها
+    
+    Device و RepairRequest و Invoice وعناصرها وصف سجل الاستيراد تُحفظ في commit واحد (RowTransaction)،
+    فالتوقف في منتصف الفاتورة لا يترك كيانات بدون سجل تتكرر في التشغيل التالي.
+    الفاتورة بدون عميل تُحسب خطأ فقط؛ فشل الكتابة يُعلَّم أيضاً بـ stats['failed'] (يُعاد في التشغيل التالي).
+    """
+    stats = {'devices': 0, 'repair_requests': 0, 'invoices': 0, 'errors': 0}
+    transaction = RowTransaction(commit_policy or connection)
+    device_id = None
+    try:
+        # الحصول على customer_id الجديد
+        old_client_id = invoice_data.get('client_id')
+        if not old_client_id:
+            print(f"⚠️  الفاتورة {idx}: لا يوجد client_id")
+            stats['errors'] += 1
+            return stats
+        
+        customer_id = get_customer_by_old_id(connection, legacy_connection, old_client_id, customer_index)
+        if not customer_id:
+            print(f"⚠️  الفاتورة {idx}: لم يتم العثور على العميل {old_client_id}")
+            stats['errors'] += 1
+            return stats
+        
+        # الحصول على branch_id الجديد
+        old_branch_id = invoice_data.get('branche_id')
+        branch_id = get_branch_by_old_id(connection, legacy_connection, old_branch_id) if old_branch_id else None
+        
+        # إنشاء Device
+        device_id = create_device(connection, invoice_data, customer_id, transaction)
+        if not device_id:
+            print(f"⚠️  الفاتورة {idx}: فشل إنشاء الجهاز")
+            stats['errors'] += 1
+            stats['failed'] = 1
+            return stats
+        
+        # إنشاء RepairRequest
+        repair_request_id = create_repair_request(
+            connection, legacy_connection, invoice_data, customer_id, device_id, branch_id, legacy_statuses,
+            transaction
+        )
+        if not repair_request_id:
+            print(f"⚠️  الفاتورة {idx}: فشل إنشاء طلب الإصلاح")
+            stats['errors'] += 1
+            stats['failed'] = 1
+            return stats
+        
+        # إنشاء Invoice
+        invoice_id = create_invoice(connection, invoice_data, repair_request_id, transaction)
+        if not invoice_id:
+            print(f"⚠️  الفاتورة {idx}: فشل إنشاء الفاتورة")
+            stats['errors'] += 1
+            stats['failed'] = 1
+            return stats
+        
+        # إضافة عناصر الفاتورة من الخدمات القديمة
+        old_invoice_id = invoice_data.get('id')
+        if old_invoice_id:
+            items_count = create_invoice_items_from_old_services(
+                connection, legacy_connection, old_invoice_id, invoice_id, transaction
+            )
+            if transaction.rolled_back:
+                print(f"⚠️  الفاتورة {idx}: فشل إنشاء عناصر الفاتورة")
+                stats['errors'] += 1
+                stats['failed'] = 1
+                return stats
+            if items_count > 0 and idx % 100 == 0:
+                print(f"  ✅ تم إضافة {items_count} خدمة للفاتورة {idx}")
+        
+        # تسجيل الفاتورة في سجل الاستيراد حتى يتخطاها أي تشغيل لاحق (في نفس الـ commit)
+        if ledger is not None:
+            ledger.record(connection, old_invoice_id, invoice_id)
+        transaction.commit_row()
+        stats['devices'] += 1
+        stats['repair_requests'] += 1
+        stats['invoices'] += 1
+        
+        if idx % 50 == 0:
+            print(f"  ✅ تم معالجة {idx} فاتورة...")
+            
+    except BatchRollback:
+        raise
+    except Exception as e:
+        print(f"❌ خطأ في معالجة الفاتورة {idx}: {e}")
+        stats['errors'] += 1
+        stats['failed'] = 1
+        if device_id and not transaction.rolled_back:
+            transaction.rollback()
+    
+    return stats
+
+
+def migrate_invoices_row_by_row(connection, legacy_connection, invoices: Iterable[Dict],
+                                customer_index: Optional[CustomerIndex] = None,
+                                legacy_statuses: Optional[LegacyStatuses] = None, start: int = 1,
+                                commit_policy: Optional[CommitPolicy] = None,
+                                ledger: Optional[ImportLedger] = None,
+                                failed_ids: Optional[List[int]] = None) -> Dict[str, int]:
+    """ترحيل الفواتير القديمة واحدة تلو الأخرى (commit حسب commit_policy، افتراضياً بعد كل فاتورة)
+    
+    معرفات الفواتير التي فشلت كتابتها تُضاف إلى failed_ids.
+    """
+    stats = {'devices': 0, 'repair_requests': 0, 'invoices': 0, 'errors': 0}
+    commit_policy = commit_policy or CommitPolicy(connection)
+    
+    results = commit_policy.run(
+        enumerate(invoices, start),
+        lambda item: (item[1].get('id'), migrate_invoice_row(
+            connection, legacy_connection, item[0], item[1], customer_index, legacy_statuses, commit_policy, ledger
+        ))
+    )
+    for old_invoice_id, invoice_stats in results:
+        if invoice_stats.pop('failed', 0) and failed_ids is not None:
+            failed_ids.append(old_invoice_id)
+        for key, value in invoice_stats.items():
+            stats[key] += value
+    
+    return stats
+
+
+def sql_placeholders(values) -> str:
+    """إنشاء قائمة %s لاستعلام IN"""
+    return ', '.join(['%s'] * len(values))
+
+
+def fetch_legacy_clients(legacy_connection, client_ids: List[int]) -> Dict[int, Tuple]:
+    """قراءة اسم وهاتف العملاء القدامى لمجموعة من المعرفات باستعلام واحد"""
+    if not client_ids:
+        return {}
+    
+    cursor = legacy_connection.cursor()
+    try:
+        cursor.execute(
+            f"SELECT id, name, mobile FROM clients WHERE id IN ({sql_placeholders(client_ids)})",
+            list(client_ids)
+        )
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
     finally:
         cursor.close()
 
 
-def main():
-    """الدالة الرئيسية"""
-    print("=" * 60)
-    print("🚀 بدء استيراد الفواتير من SQL Dump")
-    print("=" * 60)
+def fetch_legacy_branch_names(legacy_connection) -> Dict[int, str]:
+    """أسماء الفروع القديمة من قاعدة البيانات المؤقتة"""
+    cursor = legacy_connection.cursor()
+    try:
+        cursor.execute("SELECT id, name FROM branches")
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def load_branch_map(connection, legacy_branch_names: Dict[int, str],
+                    keys: Optional[CollationKeys] = None) -> Dict[int, int]:
+    """ربط معرفات الفروع القديمة بمعرفات الفروع الجديدة (بالاسم) مرة واحدة
     
-    # استيراد SQL dump إلى قاعدة بيانات مؤقتة
-    if not import_sql_dump_to_temp_db(SQL_DUMP_FILE):
-        return
+    الأسماء تُقارن بمفاتيح collation على الخادم مثل "WHERE name = %s LIMIT 1" في get_branch_by_old_id،
+    وعند تكرار الاسم يُستخدم أصغر معرف.
+    """
+    keys = keys or CollationKeys(server_collation_keys(connection))
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT id, name, {collation_key_sql('name')} FROM Branch ORDER BY id")
+        new_branches = {}
+        for branch_id, name, name_key in cursor.fetchall():
+            if name_key is not None:
+                new_branches.setdefault(name_key, branch_id)
+    finally:
+        cursor.close()
     
-    # الاتصال بقاعدة البيانات
-    connection = connect_db()
-    if not connection:
-        return
+    keys.prefetch(legacy_branch_names.values())
+    branch_map = {}
+    for old_branch_id, name in legacy_branch_names.items():
+        branch_id = new_branches.get(keys[name]) if name is not None else None
+        if branch_id:
+            branch_map[old_branch_id] = branch_id
+    return branch_map
+
+
+def fetch_old_services(legacy_connection, old_invoice_ids: List[int]) -> Dict[int, List[Tuple]]:
+    """قراءة الخدمات القديمة لمجموعة من الفواتير باستعلام واحد"""
+    if not old_invoice_ids:
+        return {}
     
-    # قراءة البيانات من قاعدة البيانات المؤقتة
-    invoices = read_invoices_from_temp_db(connection)
+    cursor = legacy_connection.cursor()
+    try:
+        cursor.execute(
+            f"""SELECT invoice_id, title, price 
+                FROM invoice_services 
+                WHERE invoice_id IN ({sql_placeholders(old_invoice_ids)})
+                ORDER BY id""",
+            list(old_invoice_ids)
+        )
+        services = {}
+        for invoice_id, title, price in cursor.fetchall():
+            services.setdefault(invoice_id, []).append((title, price))
+        return services
+    finally:
+        cursor.close()
+
+
+def insert_rows_and_map_ids(cursor, table: str, insert_sql: str, rows: List[Tuple], key_sql: str) -> Dict[str, int]:
+    """إدراج صفوف بـ INSERT متعدد الصفوف ثم ربط المعرفات الناتجة بمفتاح كل صف
     
-    if not invoices:
-        print("❌ لم يتم العثور على بيانات للاستيراد")
-        # حذف قاعدة البيانات المؤقتة
-        try:
-            cursor = connection.cursor()
-            cursor.execute("DROP DATABASE IF EXISTS temp_import_db")
-            cursor.close()
-        except:
-            pass
-        connection.close()
-        return
+    key_sql هو التعبير الذي يميز كل صف (مثل oldInvoiceId في customFields)،
+    ويتم البحث فقط في الصفوف التي أضيفت بعد أكبر معرف قبل الإدراج.
+    """
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    max_id_before = cursor.fetchone()[0]
+    
+    cursor.executemany(insert_sql, rows)
+    
+    cursor.execute(
+        f"SELECT id, {key_sql} FROM {table} WHERE id > %s ORDER BY id",
+        (max_id_before,)
+    )
+    ids = {}
+    for row_id, key in cursor.fetchall():
+        ids.setdefault(str(key), row_id)
+    return ids
+
+
+def prepare_invoices_chunk(legacy_connection, chunk: List[Dict], customer_index: CustomerIndex,
+                           legacy_statuses: LegacyStatuses, branch_map: Dict[int, int], start: int,
+                           legacy_data: Optional['DumpLegacyData'] = None) -> Tuple[Dict[str, int], List[Tuple]]:
+    """تجهيز دفعة للإدراج بدون الكتابة في قاعدة البيانات الهدف
+    
+    قراءة العملاء والخدمات القديمة ومطابقة العملاء والفروع وتحليل الحقول (JSON والتواريخ)،
+    ويُرجع (العدادات، صف لكل فاتورة: (بياناتها، قيم Device، قيم RepairRequest، قيم Invoice،
+    قيم InvoiceItem)). المعرف الأول في قيم كل جدول يُملأ عند الإدراج.
+    """
+    stats = {'devices': 0, 'repair_requests': 0, 'invoices': 0, 'errors': 0}
     
-    print(f"\n📊 جاري استيراد {len(invoices)} فاتورة...\n")
+    # قراءة بيانات الدفعة من قاعدة البيانات المؤقتة
+    if legacy_data is not None:
+        legacy_clients = legacy_data.clients
+        old_services = legacy_data.services
+    else:
+        client_ids = sorted({invoice_data['client_id'] for invoice_data in chunk if invoice_data.get('client_id')})
+        old_invoice_ids = [invoice_data['id'] for invoice_data in chunk if invoice_data.get('id')]
+        legacy_clients = fetch_legacy_clients(legacy_connection, client_ids)
+        old_services = fetch_old_services(legacy_connection, old_invoice_ids)
     
-    devices_created = 0
-    repair_requests_created = 0
-    invoices_created = 0
-    errors = 0
+    # مفاتيح مقارنة أسماء وهواتف عملاء الدفعة باستعلام واحد على اتصال التجهيز
+    chunk_clients = [legacy_clients.get(invoice_data.get('client_id')) for invoice_data in chunk]
+    customer_index.prefetch([value for client in chunk_clients if client for value in client], legacy_connection)
     
-    for idx, invoice_data in enumerate(invoices, 1):
+    # مطابقة العملاء والفروع في الذاكرة
+    staged = []
+    for idx, invoice_data in enumerate(chunk, start):
+        old_client_id = invoice_data.get('client_id')
+        if not old_client_id:
+            print(f"⚠️  الفاتورة {idx}: لا يوجد client_id")
+            stats['errors'] += 1
+            continue
+        
+        old_client = legacy_clients.get(old_client_id)
+        customer_id = customer_index.find(old_client[0], old_client[1]) if old_client else None
+        if not customer_id:
+            print(f"⚠️  الفاتورة {idx}: لم يتم العثور على العميل {old_client_id}")
+            stats['errors'] += 1
+            continue
+        
+        # بيانات تالفة (specs ليست dict، سعر أو تاريخ غير صالح...) تُحسب خطأ لهذه الفاتورة فقط مثل وضع row
         try:
-            # الحصول على customer_id الجديد
-            old_client_id = invoice_data.get('client_id')
-            if not old_client_id:
-                print(f"⚠️  الفاتورة {idx}: لا يوجد client_id")
-                errors += 1
-                continue
+            branch_id = branch_map.get(invoice_data.get('branche_id'))
+            status = legacy_statuses.status_for(invoice_data)
             
-            customer_id = get_customer_by_old_id(connection, old_client_id)
-            if not customer_id:
-                print(f"⚠️  الفاتورة {idx}: لم يتم العثور على العميل {old_client_id}")
-                errors += 1
-                continue
+            item_rows = []
+            for title, price in old_services.get(invoice_data.get('id'), []):
+                item_values = build_invoice_item_values(None, title, price)
+                if item_values:
+                    item_rows.append(item_values)
             
-            # الحصول على branch_id الجديد
-            old_branch_id = invoice_data.get('branche_id')
-            branch_id = get_branch_by_old_id(connection, old_branch_id) if old_branch_id else None
-            
-            # إنشاء Device
-            device_id = create_device(connection, invoice_data, customer_id)
-            if not device_id:
-                print(f"⚠️  الفاتورة {idx}: فشل إنشاء الجهاز")
-                errors += 1
-                continue
-            
-            devices_created += 1
-            
-            # إنشاء RepairRequest
-            repair_request_id = create_repair_request(connection, invoice_data, customer_id, device_id, branch_id)
-            if not repair_request_id:
-                print(f"⚠️  الفاتورة {idx}: فشل إنشاء طلب الإصلاح")
-                errors += 1
-                continue
-            
-            repair_requests_created += 1
-            
-            # إنشاء Invoice
-            invoice_id = create_invoice(connection, invoice_data, repair_request_id)
-            if not invoice_id:
-                print(f"⚠️  الفاتورة {idx}: فشل إنشاء الفاتورة")
-                errors += 1
-                continue
-            
-            invoices_created += 1
-            
-            # إضافة عناصر الفاتورة من الخدمات القديمة
-            old_invoice_id = invoice_data.get('id')
-            if old_invoice_id:
-                items_count = create_invoice_items_from_old_services(connection, old_invoice_id, invoice_id)
-                if items_count > 0 and idx % 100 == 0:
-                    print(f"  ✅ تم إضافة {items_count} خدمة للفاتورة {idx}")
-            
-            if idx % 50 == 0:
-                print(f"  ✅ تم معالجة {idx} فاتورة...")
-                
+            staged.append((
+                invoice_data,
+                build_device_values(invoice_data, customer_id),
+                build_repair_request_values(invoice_data, customer_id, None, branch_id, status),
+                build_invoice_values(invoice_data, None),
+                item_rows
+            ))
         except Exception as e:
             print(f"❌ خطأ في معالجة الفاتورة {idx}: {e}")
-            errors += 1
+            stats['errors'] += 1
+    
+    return stats, staged
+
+
+def write_invoices_chunk(connection, staged: List[Tuple], ledger: Optional[ImportLedger] = None) -> Dict[str, int]:
+    """إدراج دفعة مجهزة بـ prepare_invoices_chunk في transaction واحدة
+    
+    Device و RepairRequest و Invoice و InvoiceItem بـ INSERT متعدد الصفوف لكل جدول.
+    """
+    stats = {'devices': 0, 'repair_requests': 0, 'invoices': 0, 'errors': 0}
+    if not staged:
+        return stats
+    
+    cursor = connection.cursor()
+    try:
+        # إنشاء الأجهزة
+        device_ids = insert_rows_and_map_ids(
+            cursor, 'Device', DEVICE_INSERT_SQL,
+            [device_values for _, device_values, _, _, _ in staged],
+            "JSON_UNQUOTE(JSON_EXTRACT(customFields, '$.oldInvoiceId'))"
+        )
+        
+        # إنشاء طلبات الإصلاح
+        repair_request_ids = insert_rows_and_map_ids(
+            cursor, 'RepairRequest', REPAIR_REQUEST_INSERT_SQL,
+            [
+                (device_ids[str(invoice_data.get('id'))],) + repair_request_values[1:]
+                for invoice_data, _, repair_request_values, _, _ in staged
+            ],
+            "JSON_UNQUOTE(JSON_EXTRACT(customFields, '$.oldInvoiceId'))"
+        )
+        
+        # إنشاء الفواتير
+        invoice_ids = insert_rows_and_map_ids(
+            cursor, 'Invoice', INVOICE_INSERT_SQL,
+            [
+                (repair_request_ids[str(invoice_data.get('id'))],) + invoice_values[1:]
+                for invoice_data, _, _, invoice_values, _ in staged
+            ],
+            "repairRequestId"
+        )
+        
+        # إنشاء عناصر الفواتير من الخدمات القديمة
+        item_rows = []
+        for invoice_data, _, _, _, invoice_items in staged:
+            new_invoice_id = invoice_ids[str(repair_request_ids[str(invoice_data.get('id'))])]
+            item_rows.extend((new_invoice_id,) + item_values[1:] for item_values in invoice_items)
+        if item_rows:
+            cursor.executemany(INVOICE_ITEM_INSERT_SQL, item_rows)
+        
+        # تسجيل فواتير الدفعة في سجل الاستيراد ضمن نفس الـ transaction
+        if ledger is not None:
+            ledger.record_many(cursor, [
+                (invoice_data.get('id'), invoice_ids[str(repair_request_ids[str(invoice_data.get('id'))])])
+                for invoice_data, _, _, _, _ in staged
+            ])
+        
+        connection.commit()
+        
+    except (Error, KeyError):
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    
+    stats['devices'] += len(staged)
+    stats['repair_requests'] += len(staged)
+    stats['invoices'] += len(staged)
+    return stats
+
+
+def migrate_invoices_chunk(connection, legacy_connection, chunk: List[Dict], customer_index: CustomerIndex,
+                           legacy_statuses: LegacyStatuses, branch_map: Dict[int, int], start: int,
+                           legacy_data: Optional['DumpLegacyData'] = None,
+                           ledger: Optional[ImportLedger] = None) -> Dict[str, int]:
+    """ترحيل دفعة من الفواتير القديمة في transaction واحدة
+    
+    القراءة من قاعدة البيانات المؤقتة تتم باستعلام واحد لكل جدول (أو من legacy_data
+    عند القراءة من ملف الـ dump مباشرة)، ثم يتم إدراج Device و RepairRequest و Invoice
+    و InvoiceItem بـ INSERT متعدد الصفوف لكل جدول.
+    """
+    stats, staged = prepare_invoices_chunk(
+        legacy_connection, chunk, customer_index, legacy_statuses, branch_map, start, legacy_data
+    )
+    for key, value in write_invoices_chunk(connection, staged, ledger).items():
+        stats[key] += value
+    return stats
+
+
+def migrate_invoices_one_by_one(connection, legacy_connection, chunk: List[Dict], customer_index: CustomerIndex,
+                                legacy_statuses: LegacyStatuses, branch_map: Dict[int, int], start: int,
+                                legacy_data: 'DumpLegacyData', ledger: Optional[ImportLedger] = None,
+                                failed_ids: Optional[List[int]] = None) -> Dict[str, int]:
+    """إعادة دفعة فاشلة كدفعات من فاتورة واحدة (بدون الرجوع لقاعدة البيانات المؤقتة)"""
+    stats = {'devices': 0, 'repair_requests': 0, 'invoices': 0, 'errors': 0}
+    for idx, invoice_data in enumerate(chunk, start):
+        try:
+            invoice_stats = migrate_invoices_chunk(
+                connection, legacy_connection, [invoice_data], customer_index, legacy_statuses, branch_map, idx,
+                legacy_data, ledger
+            )
+        except (Error, KeyError) as e:
+            print(f"❌ خطأ في معالجة الفاتورة {idx}: {e}")
+            invoice_stats = {'errors': 1}
+            if failed_ids is not None:
+                failed_ids.append(invoice_data.get('id'))
+        for key, value in invoice_stats.items():
+            stats[key] += value
+    return stats
+
+
+def iter_prepared_invoice_chunks(legacy_connection, invoices: Iterable[Dict], customer_index: CustomerIndex,
+                                 legacy_statuses: LegacyStatuses, branch_map: Dict[int, int], batch_size: int,
+                                 start: int, legacy_data: Optional['DumpLegacyData'] = None) -> Iterator[Tuple]:
+    """الفواتير على دفعات مجهزة للإدراج: (ترتيب أول فاتورة، الدفعة، نتيجة التجهيز أو الخطأ)"""
+    invoices = iter(invoices)
+    while True:
+        chunk = list(islice(invoices, batch_size))
+        if not chunk:
+            break
+        try:
+            prepared = prepare_invoices_chunk(
+                legacy_connection, chunk, customer_index, legacy_statuses, branch_map, start, legacy_data
+            )
+        except (Error, KeyError) as e:
+            prepared = e
+        yield start, chunk, prepared
+        start += len(chunk)
+
+
+def migrate_invoices_batched(connection, legacy_connection, invoices: Iterable[Dict], customer_index: CustomerIndex,
+                             legacy_statuses: LegacyStatuses, batch_size: int,
+                             legacy_data: Optional['DumpLegacyData'] = None, start: int = 1,
+                             ledger: Optional[ImportLedger] = None, pipeline: bool = IMPORT_PIPELINE,
+                             failed_ids: Optional[List[int]] = None) -> Dict[str, int]:
+    """ترحيل الفواتير القديمة على دفعات، كل دفعة في transaction واحدة
+    
+    مع pipeline يتم تجهيز الدفعات (القراءة من النظام القديم وتحليل الحقول) في thread منفصل
+    باتصال خاص به بقاعدة البيانات المؤقتة، بينما تُكتب الدفعات السابقة في قاعدة البيانات الهدف.
+    الدفعة الفاشلة تُعاد فاتورة فاتورة، ومعرفات الفواتير التي فشلت كتابتها تُضاف إلى failed_ids.
+    """
+    stats = {'devices': 0, 'repair_requests': 0, 'invoices': 0, 'errors': 0}
+    batch_size = max(1, batch_size)
+    branch_map = load_branch_map(
+        connection,
+        legacy_data.branch_names if legacy_data is not None else fetch_legacy_branch_names(legacy_connection)
+    )
+    offset = start - 1
+    
+    # اتصال التجهيز منفصل عن legacy_connection الذي تستخدمه إعادة الدفعات الفاشلة أثناء الكتابة
+    # (ومع الملف مباشرة اتصال بالقاعدة الهدف لحساب مفاتيح مقارنة العملاء في thread التجهيز)
+    if pipeline:
+        parse_connection = connect(LEGACY_DATABASE if legacy_data is None else None)
+    else:
+        parse_connection = legacy_connection
+    invoice_pipeline = Pipeline('invoices') if pipeline else None
+    chunks = iter_prepared_invoice_chunks(
+        parse_connection, invoices, customer_index, legacy_statuses, branch_map, batch_size, start, legacy_data
+    )
+    if invoice_pipeline is not None:
+        chunks = invoice_pipeline.run(chunks, size=lambda item: len(item[1]))
+    
+    try:
+        for start, chunk, prepared in chunks:
+            try:
+                if isinstance(prepared, Exception):
+                    raise prepared
+                chunk_stats, staged = prepared
+                for key, value in write_invoices_chunk(connection, staged, ledger).items():
+                    chunk_stats[key] += value
+            except (Error, KeyError) as e:
+                # إعادة الدفعة الفاشلة فاتورة فاتورة لتخطي السجلات التالفة فقط
+                print(f"⚠️  فشلت الدفعة {start}-{start + len(chunk) - 1}، جاري الإعادة فاتورة فاتورة: {e}")
+                if legacy_data is not None:
+                    chunk_stats = migrate_invoices_one_by_one(
+                        connection, legacy_connection, chunk, customer_index, legacy_statuses, branch_map, start,
+                        legacy_data, ledger, failed_ids
+                    )
+                else:
+                    chunk_stats = migrate_invoices_row_by_row(
+                        connection, legacy_connection, chunk, customer_index, legacy_statuses, start,
+                        CommitPolicy(connection, every_rows=1), ledger, failed_ids
+                    )
+            
+            for key, value in chunk_stats.items():
+                stats[key] += value
+            offset += len(chunk)
+            print(f"  ✅ تم معالجة {offset} فاتورة...")
+    finally:
+        # إيقاف التجهيز (وthread خط المعالجة) قبل إغلاق اتصاله
+        chunks.close()
+        if parse_connection is not legacy_connection:
+            parse_connection.close()
+    
+    if invoice_pipeline is not None:
+        invoice_pipeline.print_stats()
+    return stats
+
+
+def legacy_json_sql(column: str) -> str:
+    """تعبير SQL يعادل parse_json_field: إزالة الـ backslashes ثم JSON، أو NULL إذا لم تكن القيمة JSON صالحاً"""
+    backslash = "CHAR(92 USING utf8mb4)"
+    cleaned = f"REPLACE(REPLACE({column}, CONCAT({backslash}, '\"'), '\"'), CONCAT({backslash}, ''''), '''')"
+    return f"CASE WHEN JSON_VALID({cleaned}) THEN CAST({cleaned} AS JSON) END"
+
+
+# التواريخ التي يقبلها parse_date ('%Y-%m-%d' مع وقت وأجزاء ثانية اختيارية) كنمط REGEXP
+LEGACY_DATETIME_PATTERN = ('^[0-9]{4}-(0?[1-9]|1[0-2])-(0?[1-9]|[12][0-9]|3[01])'
+                           '( ([01]?[0-9]|2[0-3]):[0-5]?[0-9]:[0-5]?[0-9]([.][0-9]{1,6})?)?$')
+
+
+def legacy_datetime_sql(column: str) -> str:
+    """تعبير SQL يعادل parse_date: نفس التنسيقات (تاريخ، تاريخ ووقت، مع أجزاء الثانية) وإلا NULL
+
+    النطاقات في النمط هي نفس ما يقبله strptime (شهر 1-12، يوم 1-31، ساعة 0-23، دقيقة وثانية 0-59)،
+    والسنة 0000 (تواريخ MySQL الصفرية) تُعامل كـ NULL كما في parse_date وقارئ الـ dump؛
+    تاريخ غير موجود مثل 2024-02-30 يرجع NULL من CAST كما يفشل strptime.
+    """
+    return (f"CASE WHEN {column} REGEXP '{LEGACY_DATETIME_PATTERN}' AND {column} NOT LIKE '0000-%' "
+            f"THEN CAST({column} AS DATETIME(6)) END")
+
+
+def spec_sql(key: str, length: int) -> str:
+    """تعبير SQL يعادل spec_value: نص JSON غير فارغ مقصوص إلى length، وإلا NULL"""
+    value = f"JSON_EXTRACT(s.specs, '$.{key}')"
+    return f"CASE WHEN JSON_TYPE({value}) = 'STRING' THEN LEFT(NULLIF(JSON_UNQUOTE({value}), ''), {length}) END"
+
+
+def stage_legacy_maps(cursor, legacy_connection, connection, customer_index: CustomerIndex):
+    """ملء _import_stage_map: العملاء (بالاسم والهاتف من الفهرس) والفروع (بالاسم) والحالات (OLD_STATUS_MAP)"""
+    legacy_cursor = legacy_connection.cursor()
+    try:
+        legacy_cursor.execute("SELECT id, name, mobile FROM clients")
+        clients = legacy_cursor.fetchall()
+        legacy_cursor.execute("SELECT id, name FROM status")
+        statuses = legacy_cursor.fetchall()
+    finally:
+        legacy_cursor.close()
+    
+    rows = []
+    customer_index.prefetch(value for client in clients for value in client[1:])
+    for client_id, name, mobile in clients:
+        customer_id = customer_index.find(name, mobile)
+        if customer_id:
+            rows.append(('client', client_id, customer_id, None))
+    for old_branch_id, branch_id in load_branch_map(connection, fetch_legacy_branch_names(legacy_connection)).items():
+        rows.append(('branch', old_branch_id, branch_id, None))
+    for status_id, name in statuses:
+        rows.append(('status', status_id, None, OLD_STATUS_MAP.get(name, 'RECEIVED')))
+    
+    if rows:
+        cursor.executemany(
+            "INSERT INTO _import_stage_map (kind, old_id, new_id, new_status) VALUES (%s, %s, %s, %s)", rows
+        )
+
+
+def drop_staging_tables(cursor):
+    """حذف جداول staging الخاصة بوضع sql"""
+    for table in STAGING_TABLES:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def migrate_invoices_sql_merge(connection, legacy_connection, customer_index: CustomerIndex,
+                               ledger: Optional[ImportLedger] = None) -> Dict[str, int]:
+    """ترحيل كل الفواتير القديمة بجمل INSERT ... SELECT داخل قاعدة البيانات (وضع sql)
+    
+    تُنسخ الفواتير والخدمات وآخر حالة لكل فاتورة من temp_import_db إلى جداول staging في
+    قاعدة البيانات الهدف مع تحويلات build_device_values و build_repair_request_values
+    و build_invoice_values بتعابير SQL، ثم يُنشأ كل جدول (Device ثم RepairRequest ثم Invoice
+    ثم InvoiceItem) بجملة واحدة، وتُربط المعرفات الجديدة بالفواتير القديمة عبر oldInvoiceId.
+    كل الكتابة في transaction واحدة؛ Python يملأ جداول الربط الصغيرة فقط.
+    """
+    stats = {'devices': 0, 'repair_requests': 0, 'invoices': 0, 'errors': 0}
+    legacy = LEGACY_DATABASE
+    cursor = connection.cursor()
+    try:
+        # إنشاء جداول staging (DDL: خارج transaction الترحيل)
+        drop_staging_tables(cursor)
+        for ddl in (STAGE_MAP_DDL, STAGE_INVOICES_DDL, STAGE_SERVICES_DDL):
+            cursor.execute(ddl)
+        
+        started = time.perf_counter()
+        stage_legacy_maps(cursor, legacy_connection, connection, customer_index)
+        
+        # نسخ الفواتير القديمة مع آخر حالة من invoice_status (وإلا status_id في الفاتورة)
+        ledger_filter = (
+            "WHERE CAST(i.id AS CHAR) NOT IN (SELECT legacy_key FROM _import_ledger WHERE source = %s)"
+            if ledger is not None else ""
+        )
+        cursor.execute(
+            f"""INSERT INTO _import_stage_invoices
+                   (id, client_id, customer_id, branche_id, branch_id, status_id, new_status, creator_id,
+                    device_type, brand, device_model, device_sn, purchase_date, problem_description,
+                    specs, accessories, examination, received_at, invoice_date, total, paid, note)
+                SELECT i.id, i.client_id, c.new_id, i.branche_id, b.new_id, i.status_id,
+                       COALESCE(st.new_status, 'RECEIVED'), i.creator_id,
+                       i.device_type, i.brand, i.device_model, i.device_sn, i.purchase_date, i.problem_description,
+                       {legacy_json_sql('i.specifcations')}, {legacy_json_sql('i.accessories')},
+                       {legacy_json_sql('i.examination')},
+                       COALESCE({legacy_datetime_sql('i.entery_at')}, {legacy_datetime_sql('i.date')}),
+                       {legacy_datetime_sql('i.date')},
+                       COALESCE(i.total, 0), COALESCE(i.paid, 0), i.note
+                FROM {legacy}.invoices i
+                LEFT JOIN (
+                    SELECT invoice_id, status_id FROM (
+                        SELECT invoice_id, status_id,
+                               ROW_NUMBER() OVER (PARTITION BY invoice_id ORDER BY created_at DESC, id DESC) AS rn
+                        FROM {legacy}.invoice_status
+                    ) ranked
+                    WHERE rn = 1
+                ) latest ON latest.invoice_id = i.id
+                LEFT JOIN _import_stage_map c ON c.kind = 'client' AND c.old_id = i.client_id
+                LEFT JOIN _import_stage_map b ON b.kind = 'branch' AND b.old_id = i.branche_id
+                LEFT JOIN _import_stage_map st ON st.kind = 'status'
+                     AND st.old_id = CASE WHEN latest.invoice_id IS NULL THEN i.status_id ELSE latest.status_id END
+                {ledger_filter}
+                ORDER BY i.id""",
+            (LEDGER_SOURCE,) if ledger is not None else ()
+        )
+        staged = cursor.rowcount
+        if ledger is not None:
+            ledger.skipped += count_invoices_in_temp_db(legacy_connection) - staged
+        
+        cursor.execute(
+            f"""INSERT INTO _import_stage_services (id, invoice_id, title, price)
+                SELECT sv.id, sv.invoice_id, TRIM(sv.title), COALESCE(sv.price, 0)
+                FROM {legacy}.invoice_services sv
+                JOIN _import_stage_invoices s ON s.id = sv.invoice_id
+                WHERE TRIM(COALESCE(sv.title, '')) <> ''"""
+        )
+        print(f"  📦 تم نسخ {staged} فاتورة و {cursor.rowcount} خدمة إلى جداول staging")
+        
+        # الفواتير بدون عميل مطابق لا يتم ترحيلها
+        cursor.execute(
+            """SELECT COALESCE(SUM(client_id IS NULL OR client_id = 0), 0),
+                      COALESCE(SUM(client_id <> 0 AND customer_id IS NULL), 0)
+               FROM _import_stage_invoices"""
+        )
+        no_client, no_customer = cursor.fetchone()
+        if no_client:
+            print(f"⚠️  {no_client} فاتورة بدون client_id")
+        if no_customer:
+            print(f"⚠️  {no_customer} فاتورة لم يتم العثور على عميلها")
+        stats['errors'] += int(no_client) + int(no_customer)
+        
+        # إنشاء الأجهزة
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Device")
+        max_device_id = cursor.fetchone()[0]
+        cursor.execute(
+            f"""INSERT INTO Device
+                   (customerId, deviceType, brand, model, serialNumber, cpu, gpu, ram, storage, customFields, createdAt)
+                SELECT s.customer_id, s.device_type, s.brand, s.device_model, s.device_sn,
+                       {spec_sql('CPU', 100)}, {spec_sql('GPU', 100)}, {spec_sql('RAM', 50)}, {spec_sql('Storage', 50)},
+                       JSON_OBJECT('oldInvoiceId', s.id, 'purchaseDate', s.purchase_date,
+                                   'accessories', s.accessories, 'examination', s.examination),
+                       NOW()
+                FROM _import_stage_invoices s
+                WHERE s.customer_id IS NOT NULL
+                ORDER BY s.id"""
+        )
+        stats['devices'] = cursor.rowcount
+        cursor.execute(
+            """UPDATE _import_stage_invoices s
+               JOIN Device d ON s.id = CAST(JSON_UNQUOTE(JSON_EXTRACT(d.customFields, '$.oldInvoiceId')) AS UNSIGNED)
+               SET s.device_id = d.id
+               WHERE d.id > %s""",
+            (max_device_id,)
+        )
+        
+        # إنشاء طلبات الإصلاح (رقم الفاتورة القديمة في نهاية وصف المشكلة كما في build_repair_request_values)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM RepairRequest")
+        max_repair_request_id = cursor.fetchone()[0]
+        cursor.execute(
+            """INSERT INTO RepairRequest
+                   (deviceId, customerId, branchId, reportedProblem, status, customFields, createdAt, updatedAt)
+               SELECT s.device_id, s.customer_id, s.branch_id,
+                      CONCAT(COALESCE(s.problem_description, ''), %s, s.id, ')'),
+                      s.new_status,
+                      JSON_OBJECT('oldInvoiceId', s.id, 'oldStatusId', s.status_id,
+                                  'oldBranchId', s.branche_id, 'oldCreatorId', s.creator_id),
+                      COALESCE(s.received_at, NOW()), NOW()
+               FROM _import_stage_invoices s
+               WHERE s.device_id IS NOT NULL
+               ORDER BY s.id""",
+            ("\n\n(الرقم القديم للفاتورة: ",)
+        )
+        stats['repair_requests'] = cursor.rowcount
+        cursor.execute(
+            """UPDATE _import_stage_invoices s
+               JOIN RepairRequest rr ON s.id = CAST(JSON_UNQUOTE(JSON_EXTRACT(rr.customFields, '$.oldInvoiceId')) AS UNSIGNED)
+               SET s.repair_request_id = rr.id
+               WHERE rr.id > %s""",
+            (max_repair_request_id,)
+        )
+        
+        # إنشاء الفواتير (نفس حساب الحالة في build_invoice_values)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Invoice")
+        max_invoice_id = cursor.fetchone()[0]
+        cursor.execute(
+            """INSERT INTO Invoice
+                   (repairRequestId, totalAmount, amountPaid, status, currency, notes, createdAt, updatedAt)
+               SELECT s.repair_request_id, s.total, s.paid,
+                      CASE WHEN s.paid >= s.total THEN 'PAID' WHEN s.paid > 0 THEN 'PARTIAL' ELSE 'UNPAID' END,
+                      'EGP', s.note, COALESCE(s.invoice_date, NOW()), NOW()
+               FROM _import_stage_invoices s
+               WHERE s.repair_request_id IS NOT NULL
+               ORDER BY s.id"""
+        )
+        stats['invoices'] = cursor.rowcount
+        cursor.execute(
+            """UPDATE _import_stage_invoices s
+               JOIN Invoice i ON s.repair_request_id = i.repairRequestId
+               SET s.invoice_id = i.id
+               WHERE i.id > %s""",
+            (max_invoice_id,)
+        )
+        
+        # إنشاء عناصر الفواتير من الخدمات القديمة (خدمات نصية بدون serviceId)
+        cursor.execute(
+            """INSERT INTO InvoiceItem
+                   (invoiceId, description, quantity, unitPrice, totalPrice, itemType, serviceId, createdAt, updatedAt)
+               SELECT s.invoice_id, sv.title, 1, sv.price, sv.price, 'service', NULL, NOW(), NOW()
+               FROM _import_stage_services sv
+               JOIN _import_stage_invoices s ON s.id = sv.invoice_id
+               WHERE s.invoice_id IS NOT NULL
+               ORDER BY s.id, sv.id"""
+        )
+        items = cursor.rowcount
+        
+        # تسجيل الفواتير المرحّلة في سجل الاستيراد ضمن نفس الـ transaction
+        if ledger is not None:
+            cursor.execute(
+                """REPLACE INTO _import_ledger (source, legacy_key, target_id, created_at)
+                   SELECT %s, CAST(id AS CHAR), invoice_id, NOW()
+                   FROM _import_stage_invoices
+                   WHERE invoice_id IS NOT NULL""",
+                (LEDGER_SOURCE,)
+            )
+        
+        connection.commit()
+        print(f"  ✅ تم ترحيل {stats['invoices']} فاتورة و {items} خدمة خلال "
+              f"{time.perf_counter() - started:.1f} ثانية")
+        return stats
+        
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        drop_staging_tables(cursor)
+        cursor.close()
+
+
+def read_legacy_watermark(legacy_connection) -> Dict:
+    """علامة بيانات النظام القديم الحالية: أكبر معرف وآخر تعديل للفواتير وأكبر معرف للخدمات والحالات"""
+    cursor = legacy_connection.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(id), 0), MAX(updated_at) FROM invoices")
+        invoice_id, updated_at = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM invoice_services")
+        service_id = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM invoice_status")
+        status_row_id = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    return {
+        'invoice_id': invoice_id,
+        'invoice_updated_at': str(updated_at) if updated_at else None,
+        'service_id': service_id,
+        'status_row_id': status_row_id,
+    }
+
+
+def watermark_before_failures(watermark: Dict, failed_ids: List[int]) -> Dict:
+    """العلامة التي تُحفظ بعد التشغيل: لا تتقدم بعد أقدم فاتورة فشلت كتابتها حتى يُعاد فحصها
+    
+    failed_ids هي الفواتير التي فشلت كتابتها أو تحديثها في هذا التشغيل فقط (أخطاء مؤقتة)؛ الفواتير
+    التي تم تخطيها بدون عميل لا توقف العلامة. الفواتير الفاشلة معرفاتها >= أقدمها، فتكفي العلامة
+    invoice_id = أقدمها - 1 لإعادة قراءتها (مع ما بعدها، وما تم ترحيله منها يُحدّث فقط) في التشغيل التالي.
+    """
+    if not failed_ids:
+        return watermark
+    oldest = min(failed_ids)
+    print(f"⚠️  {len(set(failed_ids))} فاتورة لم تكتمل: علامة الاستيراد التزايدي تتوقف قبل الفاتورة {oldest} "
+          f"ليُعاد فحصها في التشغيل التالي")
+    return dict(watermark, invoice_id=min(watermark['invoice_id'], oldest - 1))
+
+
+def read_changed_invoices(legacy_connection, watermark: Dict) -> List[Dict]:
+    """الفواتير الجديدة أو المعدلة منذ العلامة، أو التي أضيفت لها خدمات أو حالات جديدة"""
+    cursor = legacy_connection.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            """SELECT * FROM invoices
+               WHERE id > %s
+                  OR updated_at > %s
+                  OR id IN (SELECT invoice_id FROM invoice_services WHERE id > %s)
+                  OR id IN (SELECT invoice_id FROM invoice_status WHERE id > %s)
+               ORDER BY id""",
+            (watermark['invoice_id'], watermark['invoice_updated_at'],
+             watermark['service_id'], watermark['status_row_id'])
+        )
+        return [legacy_invoice_from_row(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def load_migrated_invoices(connection) -> Dict[int, Tuple[int, Optional[int], Optional[int]]]:
+    """الفواتير القديمة التي تم ترحيلها: oldInvoiceId -> (معرف RepairRequest، معرف Device، معرف Invoice)
+    
+    المطابقة عبر customFields.oldInvoiceId في RepairRequest (أول طلب لكل فاتورة قديمة).
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """SELECT JSON_UNQUOTE(JSON_EXTRACT(rr.customFields, '$.oldInvoiceId')), rr.id, rr.deviceId, i.id
+               FROM RepairRequest rr
+               LEFT JOIN Invoice i ON i.repairRequestId = rr.id
+               WHERE rr.deletedAt IS NULL AND rr.customFields IS NOT NULL
+               ORDER BY rr.id"""
+        )
+        migrated = {}
+        for old_invoice_id, repair_request_id, device_id, invoice_id in cursor.fetchall():
+            try:
+                old_invoice_id = int(old_invoice_id)
+            except (TypeError, ValueError):
+                continue
+            migrated.setdefault(old_invoice_id, (repair_request_id, device_id, invoice_id))
+        return migrated
+    finally:
+        cursor.close()
+
+
+def update_migrated_invoice(connection, legacy_connection, idx: int, invoice_data: Dict,
+                            target: Tuple[int, Optional[int], Optional[int]], customer_index: Optional[CustomerIndex],
+                            legacy_statuses: LegacyStatuses,
+                            commit_policy: Optional[CommitPolicy] = None) -> Optional[bool]:
+    """تحديث صفوف فاتورة قديمة تم ترحيلها سابقاً بدلاً من إنشاء صفوف جديدة
+    
+    يتم تحديث Device و RepairRequest و Invoice، وإعادة إنشاء عناصر الفاتورة من الخدمات القديمة.
+    كل ذلك في transaction واحدة: أي خطأ (بما فيه عناصر الفاتورة) يلغي التحديث ويُرجع False.
+    يُرجع None إذا لم يتم العثور على العميل (تخطٍ لا يُعاد في التشغيل التالي).
+    """
+    repair_request_id, device_id, invoice_id = target
+    statements = prepared_statements(connection)
+    transaction = commit_policy or connection
+    try:
+        customer_id = get_customer_by_old_id(
+            connection, legacy_connection, invoice_data.get('client_id'), customer_index
+        ) if invoice_data.get('client_id') else None
+        if not customer_id:
+            print(f"⚠️  الفاتورة {idx}: لم يتم العثور على العميل {invoice_data.get('client_id')}")
+            return None
+        
+        old_branch_id = invoice_data.get('branche_id')
+        branch_id = get_branch_by_old_id(connection, legacy_connection, old_branch_id) if old_branch_id else None
+        status = legacy_statuses.status_for(invoice_data)
+        
+        if device_id:
+            statements.execute(
+                'Device.update', DEVICE_UPDATE_SQL, build_device_values(invoice_data, customer_id) + (device_id,)
+            )
+        statements.execute(
+            'RepairRequest.update', REPAIR_REQUEST_UPDATE_SQL,
+            build_repair_request_values(invoice_data, customer_id, device_id, branch_id, status) + (repair_request_id,)
+        )
+        if invoice_id:
+            statements.execute(
+                'Invoice.update', INVOICE_UPDATE_SQL,
+                build_invoice_values(invoice_data, repair_request_id) + (invoice_id,)
+            )
+            statements.execute('InvoiceItem.delete_migrated', MIGRATED_ITEMS_DELETE_SQL, (invoice_id,))
+        else:
+            invoice_id = statements.insert(
+                'Invoice.insert', INVOICE_INSERT_SQL, build_invoice_values(invoice_data, repair_request_id)
+            )
+        
+        # عناصر الفاتورة في نفس المحاولة حتى يُحسب فشلها خطأ لهذه الفاتورة
+        old_invoice_id = invoice_data.get('id')
+        for title, price in fetch_old_services(legacy_connection, [old_invoice_id]).get(old_invoice_id, []):
+            item_values = build_invoice_item_values(invoice_id, title, price)
+            if item_values:
+                statements.insert('InvoiceItem.insert', INVOICE_ITEM_INSERT_SQL, item_values)
+        transaction.commit()
+        return True
+        
+    except BatchRollback:
+        raise
+    except Exception as e:
+        print(f"❌ خطأ في تحديث الفاتورة {idx}: {e}")
+        transaction.rollback()
+        return False
+
+
+def migrate_delta(connection, legacy_connection, watermark: Dict, customer_index: Optional[CustomerIndex],
+                  legacy_statuses: LegacyStatuses, ledger: Optional[ImportLedger] = None,
+                  failed_ids: Optional[List[int]] = None) -> Dict[str, int]:
+    """ترحيل الفواتير الجديدة أو المعدلة منذ آخر تشغيل فقط
+    
+    الفواتير التي تم ترحيلها سابقاً (حسب customFields.oldInvoiceId) تُحدّث صفوفها،
+    والباقي يُرحّل بالمسار العادي (row أو batch). معرفات الفواتير التي فشلت كتابتها أو تحديثها تُضاف إلى failed_ids.
+    """
+    changed = read_changed_invoices(legacy_connection, watermark)
+    migrated = load_migrated_invoices(connection)
+    updates = [invoice_data for invoice_data in changed if invoice_data.get('id') in migrated]
+    new_invoices = [invoice_data for invoice_data in changed if invoice_data.get('id') not in migrated]
+    print(f"🔄 منذ آخر تشغيل: {len(new_invoices)} فاتورة جديدة، {len(updates)} فاتورة معدلة\n")
+    
+    # وضع sql مخصص للترحيل الكامل؛ الفواتير الجديدة القليلة تُرحّل على دفعات
+    if INVOICE_IMPORT_MODE in ('batch', 'sql'):
+        stats = migrate_invoices_batched(
+            connection, legacy_connection, skip_migrated(new_invoices, ledger), customer_index, legacy_statuses,
+            IMPORT_BATCH_SIZE, ledger=ledger, failed_ids=failed_ids
+        )
+    else:
+        stats = migrate_invoices_row_by_row(
+            connection, legacy_connection, skip_migrated(new_invoices, ledger), customer_index, legacy_statuses,
+            ledger=ledger, failed_ids=failed_ids
+        )
+    
+    stats['updated'] = 0
+    commit_policy = CommitPolicy(connection)
+    results = commit_policy.run(
+        enumerate(updates, 1),
+        lambda item: update_migrated_invoice(
+            connection, legacy_connection, item[0], item[1], migrated[item[1]['id']], customer_index,
+            legacy_statuses, commit_policy
+        )
+    )
+    for invoice_data, updated in zip(updates, results):
+        if updated:
+            stats['updated'] += 1
             continue
+        stats['errors'] += 1
+        if updated is False and failed_ids is not None:
+            failed_ids.append(invoice_data['id'])
+    return stats
+
+
+def skip_migrated(invoices: Iterable[Dict], ledger: Optional[ImportLedger]) -> Iterable[Dict]:
+    """تخطي الفواتير المسجلة في سجل الاستيراد (تم ترحيلها في تشغيل سابق)"""
+    if ledger is None:
+        return invoices
+    return ledger.skip_done(invoices, key=lambda invoice_data: invoice_data.get('id'))
+
+
+class DumpLegacyData:
+    """بيانات النظام القديم مقروءة مباشرة من ملف SQL dump بدون temp_import_db
+
+    الجداول الصغيرة (clients, branches, status, invoice_status, invoice_services) تُحمّل
+    في مرور واحد على الملف، أما invoices فتُقرأ بشكل متدفق في مرور ثانٍ.
+    """
+
+    def __init__(self, dump_file: str):
+        self.reader = SqlDumpReader(dump_file, DumpIndex.load(dump_file))
+        self.clients: Dict[int, Tuple] = {}
+        self.branch_names: Dict[int, str] = {}
+        self.services: Dict[int, List[Tuple]] = {}
+        self.statuses: Optional[LegacyStatuses] = None
+
+    def load(self) -> 'DumpLegacyData':
+        """تحميل الجداول المساعدة من الملف"""
+        status_names = {}
+        latest = {}
+        for table, row in self.reader.iter_tables(
+            ['clients', 'branches', 'status', 'invoice_status', 'invoice_services']
+        ):
+            if table == 'clients':
+                self.clients[row.get('id')] = (row.get('name'), row.get('mobile'))
+            elif table == 'branches':
+                self.branch_names[row.get('id')] = row.get('name')
+            elif table == 'status':
+                status_names[row.get('id')] = row.get('name')
+            elif table == 'invoice_status':
+                # نفس ترتيب ORDER BY created_at DESC, id DESC (القيم NULL في الآخر)
+                created_at = row.get('created_at')
+                key = (1, created_at, row.get('id') or 0) if created_at else (0, datetime.min, row.get('id') or 0)
+                invoice_id = row.get('invoice_id')
+                if invoice_id not in latest or key > latest[invoice_id][0]:
+                    latest[invoice_id] = (key, row.get('status_id'))
+            elif table == 'invoice_services':
+                # الـ dump مرتب بالمفتاح الأساسي، فالخدمات بنفس ترتيب ORDER BY id
+                self.services.setdefault(row.get('invoice_id'), []).append((row.get('title'), row.get('price')))
+        
+        self.statuses = LegacyStatuses(
+            {invoice_id: status_id for invoice_id, (_, status_id) in latest.items()},
+            {status_id: OLD_STATUS_MAP.get(name, 'RECEIVED') for status_id, name in status_names.items()}
+        )
+        return self
+
+    def iter_invoices(self) -> Iterator[Dict]:
+        """قراءة الفواتير القديمة من الملف بشكل متدفق"""
+        for row in self.reader.iter_table('invoices'):
+            yield legacy_invoice_from_row(row)
+
+
+def migrate_from_dump(connection, customer_index: CustomerIndex) -> Optional[Dict[str, int]]:
+    """ترحيل الفواتير بقراءة ملف الـ dump مباشرة (بدون استيراده إلى temp_import_db)"""
+    if not os.path.exists(SQL_DUMP_FILE):
+        print(f"❌ الملف غير موجود: {SQL_DUMP_FILE}")
+        return None
     
-    print("\n" + "=" * 60)
-    print("📊 ملخص الاستيراد:")
-    print(f"  ✅ الأجهزة: {devices_created}")
-    print(f"  ✅ طلبات الإصلاح: {repair_requests_created}")
-    print(f"  ✅ الفواتير: {invoices_created}")
-    if errors > 0:
-        print(f"  ❌ الأخطاء: {errors}")
-    print("=" * 60)
+    print("📖 جاري قراءة الجداول المساعدة من ملف SQL dump...")
+    legacy_data = DumpLegacyData(SQL_DUMP_FILE).load()
+    print(f"✅ العملاء: {len(legacy_data.clients)}، الفروع: {len(legacy_data.branch_names)}")
     
-    # حذف قاعدة البيانات المؤقتة
+    print("\n📊 جاري استيراد الفواتير من الملف...\n")
+    # القراءة من الملف تستخدم مسار الدفعات دائماً؛ وضع row يعادل دفعات من فاتورة واحدة
+    if INVOICE_IMPORT_MODE == 'sql':
+        print("⚠️  وضع sql يتطلب LEGACY_SOURCE=temp_db، سيتم الترحيل على دفعات")
+    batch_size = IMPORT_BATCH_SIZE if INVOICE_IMPORT_MODE in ('batch', 'sql') else 1
+    ledger = load_ledger(connection, LEDGER_SOURCE)
+    stats = migrate_invoices_batched(
+        connection, None, skip_migrated(legacy_data.iter_invoices(), ledger), customer_index, legacy_data.statuses,
+        batch_size, legacy_data, ledger=ledger
+    )
+    if ledger is not None:
+        ledger.print_skipped()
+    return stats
+
+
+def migrate_from_temp_db(connection, customer_index: Optional[CustomerIndex]) -> Optional[Dict[str, int]]:
+    """ترحيل الفواتير من قاعدة البيانات المؤقتة temp_import_db
+
+    القراءة من temp_import_db تتم على اتصالات منفصلة عن اتصال الكتابة، فلا يتم التبديل
+    بين قاعدتي البيانات بـ USE أثناء الترحيل.
+    """
+    # اتصالان بقاعدة البيانات المؤقتة: للاستعلامات، ولقراءة الفواتير بشكل متدفق
+    # (الـ cursor غير المخزّن يحجز اتصاله حتى انتهاء القراءة)
+    legacy_connection = connect_db(LEGACY_DATABASE)
+    if not legacy_connection:
+        return None
+    read_connection = connect_db(LEGACY_DATABASE)
+    if not read_connection:
+        legacy_connection.close()
+        return None
+    
+    invoices = None
+    try:
+        # عدد الفواتير في قاعدة البيانات المؤقتة (تتم قراءتها لاحقاً بشكل متدفق)
+        invoices_count = count_invoices_in_temp_db(legacy_connection)
+        
+        if not invoices_count:
+            print("❌ لم يتم العثور على بيانات للاستيراد")
+            return None
+        
+        print(f"\n📊 جاري استيراد {invoices_count} فاتورة...\n")
+        
+        # تحميل آخر حالة لكل فاتورة وجدول الحالات مرة واحدة
+        legacy_statuses = LegacyStatuses.load(legacy_connection)
+        
+        ledger = load_ledger(connection, LEDGER_SOURCE)
+        
+        # في الوضع التزايدي: العلامة الحالية تُقرأ قبل الترحيل وتُحفظ بعد اكتماله (قبل أقدم فاتورة فشلت كتابتها)
+        watermark = load_watermark(connection, LEDGER_SOURCE) if INVOICE_IMPORT_DELTA else None
+        new_watermark = read_legacy_watermark(legacy_connection) if INVOICE_IMPORT_DELTA else None
+        failed_ids = []
+        
+        if watermark is not None:
+            stats = migrate_delta(connection, legacy_connection, watermark, customer_index, legacy_statuses, ledger,
+                                  failed_ids)
+        else:
+            if INVOICE_IMPORT_DELTA:
+                print("📌 لا توجد علامة من تشغيل سابق: سيتم ترحيل كل الفواتير ثم حفظ العلامة")
+            stats = None
+            if INVOICE_IMPORT_MODE == 'sql':
+                try:
+                    stats = migrate_invoices_sql_merge(connection, legacy_connection, customer_index, ledger)
+                except Error as e:
+                    # الـ transaction أُلغيت كاملة: نفس الفواتير تُرحّل على دفعات
+                    print(f"⚠️  فشل الترحيل بجمل SQL، سيتم الترحيل على دفعات: {e}")
+            if stats is None:
+                invoices = iter_invoices_from_temp_db(read_connection, STREAM_FETCH_SIZE)
+                if INVOICE_IMPORT_MODE in ('batch', 'sql'):
+                    stats = migrate_invoices_batched(
+                        connection, legacy_connection, skip_migrated(invoices, ledger), customer_index,
+                        legacy_statuses, IMPORT_BATCH_SIZE, ledger=ledger, failed_ids=failed_ids
+                    )
+                else:
+                    stats = migrate_invoices_row_by_row(
+                        connection, legacy_connection, skip_migrated(invoices, ledger), customer_index,
+                        legacy_statuses, ledger=ledger, failed_ids=failed_ids
+                    )
+        if ledger is not None:
+            ledger.print_skipped()
+        if new_watermark is not None:
+            skipped = stats['errors'] - len(failed_ids)
+            if skipped > 0:
+                print(f"⏭️  {skipped} فاتورة تم تخطيها (بدون عميل أو ببيانات تالفة) لا توقف علامة الاستيراد التزايدي")
+            save_watermark(connection, LEDGER_SOURCE, watermark_before_failures(new_watermark, failed_ids))
+        return stats
+    finally:
+        if invoices is not None:
+            invoices.close()
+        read_connection.close()
+        legacy_connection.close()
+
+
+def plan_invoice_shards(legacy_connection, workers: int) -> List[Tuple[int, int, int, int]]:
+    """تقسيم معرفات invoices القديمة إلى نطاقات متساوية في عدد الفواتير
+    
+    كل جزء: (رقمه، أول معرف، آخر معرف، ترتيب أول فاتورة فيه بين كل الفواتير).
+    """
+    count = count_invoices_in_temp_db(legacy_connection)
+    if not count:
+        return []
+    workers = max(1, min(workers, count))
+    
+    cursor = legacy_connection.cursor()
+    try:
+        first_ids = []
+        for number in range(workers):
+            offset = number * count // workers
+            cursor.execute("SELECT id FROM invoices ORDER BY id LIMIT 1 OFFSET %s", (offset,))
+            first_ids.append((cursor.fetchone()[0], offset + 1))
+        cursor.execute("SELECT MAX(id) FROM invoices")
+        max_id = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    
+    shards = []
+    for number, (first_id, start) in enumerate(first_ids):
+        last_id = first_ids[number + 1][0] - 1 if number + 1 < len(first_ids) else max_id
+        shards.append((number + 1, first_id, last_id, start))
+    return shards
+
+
+def migrate_invoice_shard(shard: Tuple[int, int, int, int]) -> Tuple[Dict[str, int], Dict[str, List], float]:
+    """ترحيل جزء من الفواتير القديمة في عملية مستقلة باتصالاتها الخاصة
+    
+    يُرجع (العدادات، إحصائيات الجمل المجهزة، الزمن بالثواني).
+    """
+    number, first_id, last_id, start = shard
+    started = time.perf_counter()
+    # العملية قد تُستخدم لأكثر من جزء: الإحصائيات تخص هذا الجزء فقط
+    STATEMENT_STATS.clear()
+    
+    connection = connect()
+    legacy_connection = connect(LEGACY_DATABASE)
+    read_connection = connect(LEGACY_DATABASE)
+    invoices = None
+    try:
+        customer_index = CustomerIndex.load(connection) if INVOICE_IMPORT_MODE == 'batch' or CUSTOMER_INDEX else None
+        legacy_statuses = LegacyStatuses.load(legacy_connection, (first_id, last_id))
+        ledger = load_ledger(connection, LEDGER_SOURCE)
+        invoices = iter_invoices_from_temp_db(read_connection, STREAM_FETCH_SIZE, (first_id, last_id))
+        if INVOICE_IMPORT_MODE == 'batch':
+            stats = migrate_invoices_batched(
+                connection, legacy_connection, skip_migrated(invoices, ledger), customer_index, legacy_statuses,
+                IMPORT_BATCH_SIZE, start=start, ledger=ledger
+            )
+        else:
+            stats = migrate_invoices_row_by_row(
+                connection, legacy_connection, skip_migrated(invoices, ledger), customer_index, legacy_statuses,
+                start, ledger=ledger
+            )
+        if ledger is not None:
+            ledger.print_skipped()
+    finally:
+        if invoices is not None:
+            invoices.close()
+        read_connection.close()
+        legacy_connection.close()
+        connection.close()
+    return stats, dict(STATEMENT_STATS), time.perf_counter() - started
+
+
+def migrate_sharded(workers: int) -> Optional[Dict[str, int]]:
+    """ترحيل الفواتير من temp_import_db على عدة عمليات بالتوازي
+    
+    الفواتير القديمة مستقلة عن بعضها بعد مطابقة العملاء والفروع (لا يتم إنشاء عملاء هنا)،
+    لذلك يأخذ كل جزء نطاقاً من المعرفات ويكتب في transactions خاصة به. معرفات الصفوف
+    الجديدة تتداخل بين الأجزاء ولا تتبع ترتيب الفواتير القديمة.
+    """
+    legacy_connection = connect_db(LEGACY_DATABASE)
+    if not legacy_connection:
+        return None
+    try:
+        shards = plan_invoice_shards(legacy_connection, workers)
+    finally:
+        legacy_connection.close()
+    
+    if not shards:
+        print("❌ لم يتم العثور على بيانات للاستيراد")
+        return None
+    
+    stats = {'devices': 0, 'repair_requests': 0, 'invoices': 0, 'errors': 0}
+    failed = []
+    print(f"\n⚡ ترحيل الفواتير على {len(shards)} عمليات بالتوازي...\n")
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        futures = {pool.submit(migrate_invoice_shard, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            number, first_id, last_id, _ = futures[future]
+            try:
+                shard_stats, statement_stats, seconds = future.result()
+            except Exception as e:
+                print(f"❌ فشل الجزء {number} (الفواتير {first_id}-{last_id}): {e}")
+                failed.append(number)
+                continue
+            for key, value in shard_stats.items():
+                stats[key] += value
+            merge_statement_stats(statement_stats)
+            print(f"  ⏱️  انتهى الجزء {number} (الفواتير {first_id}-{last_id}): "
+                  f"{shard_stats['invoices']} فاتورة، {shard_stats['errors']} خطأ خلال {seconds:.1f} ثانية")
+    
+    if failed:
+        print(f"⚠️  أجزاء لم تكتمل: {', '.join(str(number) for number in sorted(failed))}")
+    return stats
+
+
+def drop_temp_db(connection):
+    """حذف قاعدة البيانات المؤقتة"""
     try:
         cursor = connection.cursor()
         cursor.execute("DROP DATABASE IF EXISTS temp_import_db")
@@ -686,6 +1955,67 @@ def main():
         print("🗑️  تم حذف قاعدة البيانات المؤقتة")
     except:
         pass
+
+
+def main():
+    """الدالة الرئيسية"""
+    print("=" * 60)
+    print("🚀 بدء استيراد الفواتير من SQL Dump")
+    print("=" * 60)
+    
+    from_dump = LEGACY_SOURCE == 'dump'
+    
+    # استيراد SQL dump إلى قاعدة بيانات مؤقتة (غير مطلوب عند القراءة من الملف مباشرة)
+    if not from_dump and not import_sql_dump_to_temp_db(SQL_DUMP_FILE):
+        return
+    
+    # الاتصال بقاعدة البيانات
+    connection = connect_db()
+    if not connection:
+        return
+    
+    # تحميل فهرس العملاء مرة واحدة بدلاً من البحث عن كل عميل بالاسم والهاتف
+    # (مطلوب لمسارات الدفعات؛ مسار الفاتورة الواحدة يستخدمه فقط مع CUSTOMER_INDEX=1)
+    customer_index = None
+    if from_dump or INVOICE_IMPORT_MODE != 'row' or CUSTOMER_INDEX:
+        customer_index = CustomerIndex.load(connection)
+        print(f"📇 تم تحميل {len(customer_index)} عميل في الفهرس")
+    
+    if IMPORT_PIPELINE and INVOICE_IMPORT_MODE == 'row' and not from_dump:
+        print("⚠️  خط المعالجة (IMPORT_PIPELINE) يعمل مع وضع batch فقط، سيتم الترحيل فاتورة فاتورة")
+    
+    if from_dump:
+        if INVOICE_WORKERS > 1:
+            print("⚠️  الترحيل بالتوازي متاح فقط مع LEGACY_SOURCE=temp_db، سيتم الترحيل في عملية واحدة")
+        stats = migrate_from_dump(connection, customer_index)
+    elif INVOICE_WORKERS > 1 and not INVOICE_IMPORT_DELTA and INVOICE_IMPORT_MODE != 'sql':
+        stats = migrate_sharded(INVOICE_WORKERS)
+    else:
+        if INVOICE_WORKERS > 1 and INVOICE_IMPORT_MODE == 'sql' and not INVOICE_IMPORT_DELTA:
+            print("⚠️  وضع sql ينفذ الترحيل داخل قاعدة البيانات، سيتم تجاهل INVOICE_WORKERS")
+        stats = migrate_from_temp_db(connection, customer_index)
+    
+    if stats is None:
+        if not from_dump and not KEEP_TEMP_DB:
+            drop_temp_db(connection)
+        connection.close()
+        return
+    
+    print("\n" + "=" * 60)
+    print("📊 ملخص الاستيراد:")
+    print(f"  ✅ الأجهزة: {stats['devices']}")
+    print(f"  ✅ طلبات الإصلاح: {stats['repair_requests']}")
+    print(f"  ✅ الفواتير: {stats['invoices']}")
+    if stats.get('updated'):
+        print(f"  🔄 الفواتير المحدثة: {stats['updated']}")
+    if stats['errors'] > 0:
+        print(f"  ❌ الأخطاء: {stats['errors']}")
+    print_statement_stats()
+    print("=" * 60)
+    
+    # حذف قاعدة البيانات المؤقتة
+    if not from_dump and not KEEP_TEMP_DB:
+        drop_temp_db(connection)
     
     connection.close()
     print("\n✅ اكتمل الاستيراد!")
@@ -693,4 +2023,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Import Ledger - سجل السجلات التي تم استيرادها (checkpoint) في قاعدة البيانات الهدف
+يُستخدم من import_csv_data.py و import_invoices_from_sql_dump.py حتى يكمل التشغيل
+التالي بعد أي توقف من آخر دفعة تم حفظها بدلاً من البدء من جديد وتكرار البيانات،
+مع علامة (high-water mark) لكل مصدر يبدأ منها الاستيراد التزايدي في التشغيل التالي
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from db_access import prepared_statements
+
+# تعطيل السجل (IMPORT_LEDGER=0) يعيد كل تشغيل من البداية
+IMPORT_LEDGER = os.getenv('IMPORT_LEDGER', '1') == '1'
+
+# الجدول في قاعدة البيانات الهدف: صف لكل سجل قديم تم استيراده، يُكتب في نفس
+# transaction الخاصة بالسجل فلا يُحفظ أحدهما بدون الآخر
+LEDGER_DDL = """CREATE TABLE IF NOT EXISTS _import_ledger (
+    source VARCHAR(32) NOT NULL,
+    legacy_key VARCHAR(64) NOT NULL,
+    target_id INT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (source, legacy_key)
+)"""
+
+# آخر علامة (أكبر معرف / تاريخ تعديل ...) تم استيرادها لكل مصدر، كـ JSON
+WATERMARKS_DDL = """CREATE TABLE IF NOT EXISTS _import_watermarks (
+    source VARCHAR(32) PRIMARY KEY,
+    watermark TEXT NOT NULL,
+    updated_at DATETIME NOT NULL
+)"""
+
+LEDGER_RECORD_SQL = """REPLACE INTO _import_ledger (source, legacy_key, target_id, created_at)
+                       VALUES (%s, %s, %s, %s)"""
+
+
+class ImportLedger:
+    """المفاتيح القديمة التي تم استيرادها لمصدر واحد
+
+    source يحدد نوع السجل (مثل 'invoice' لـ oldInvoiceId أو 'csv_customer' لعمود #).
+    المفاتيح تُحمّل مرة واحدة في set، فالتحقق من كل صف O(1) بدون استعلام.
+    """
+
+    def __init__(self, source: str, done: Set[str]):
+        self.source = source
+        self.done = done
+        self.skipped = 0
+
+    @classmethod
+    def load(cls, connection, source: str) -> 'ImportLedger':
+        """إنشاء جدول السجل إذا لم يكن موجوداً وتحميل مفاتيح المصدر"""
+        cursor = connection.cursor()
+        try:
+            cursor.execute(LEDGER_DDL)
+            cursor.execute("SELECT legacy_key FROM _import_ledger WHERE source = %s", (source,))
+            done = {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+        connection.commit()
+        return cls(source, done)
+
+    def __len__(self) -> int:
+        return len(self.done)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key is not None and str(key) in self.done
+
+    def skip_done(self, items: Iterable, key: Callable) -> Iterator:
+        """تخطي العناصر التي تم استيرادها في تشغيل سابق (مع عدّها في self.skipped)"""
+        for item in items:
+            if key(item) in self:
+                self.skipped += 1
+                continue
+            yield item
+
+    def record(self, connection, key: Hashable, target_id: Optional[int] = None):
+        """تسجيل سجل تم استيراده (بدون commit: يُحفظ مع transaction السجل نفسه)"""
+        if key is None:
+            return
+        prepared_statements(connection).execute(
+            'ImportLedger.record', LEDGER_RECORD_SQL, (self.source, str(key), target_id, datetime.now())
+        )
+
+    def record_many(self, cursor, entries: List[Tuple[Hashable, Optional[int]]]):
+        """تسجيل عدة سجلات بجملة واحدة على cursor الدفعة (بدون commit)"""
+        now = datetime.now()
+        rows = [(self.source, str(key), target_id, now) for key, target_id in entries if key is not None]
+        if rows:
+            cursor.executemany(LEDGER_RECORD_SQL, rows)
+
+    def print_skipped(self):
+        """طباعة عدد السجلات التي تم تخطيها لأنها استوردت في تشغيل سابق"""
+        if self.skipped:
+            print(f"⏭️  تم تخطي {self.skipped} سجل تم استيراده في تشغيل سابق")
+
+
+def load_ledger(connection, source: str) -> Optional[ImportLedger]:
+    """سجل المصدر، أو None إذا كان السجل معطلاً بـ IMPORT_LEDGER=0"""
+    if not IMPORT_LEDGER:
+        return None
+    ledger = ImportLedger.load(connection, source)
+    if len(ledger):
+        print(f"📒 سجل الاستيراد ({source}): {len(ledger)} سجل تم استيراده سابقاً")
+    return ledger
+
+
+def load_watermark(connection, source: str) -> Optional[Dict]:
+    """علامة آخر تشغيل للمصدر، أو None إذا لم يتم حفظ علامة بعد"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(WATERMARKS_DDL)
+        cursor.execute("SELECT watermark FROM _import_watermarks WHERE source = %s", (source,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    connection.commit()
+    return json.loads(row[0]) if row else None
+
+
+def save_watermark(connection, source: str, watermark: Dict):
+    """حفظ علامة المصدر بعد اكتمال التشغيل (التواريخ تُحفظ كنص)"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(WATERMARKS_DDL)
+        cursor.execute(
+            "REPLACE INTO _import_watermarks (source, watermark, updated_at) VALUES (%s, %s, %s)",
+            (source, json.dumps(watermark, default=str), datetime.now())
+        )
+    finally:
+        cursor.close()
+    connection.commit()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+قارئ SQL Dump للنظام القديم بدون قاعدة بيانات مؤقتة
+يقرأ ملف mysqldump سطراً بسطر ويستخرج صفوف جمل
+INSERT INTO ... VALUES (...),(...) لكل جدول مع تحويل القيم لأنواعها
+(int, Decimal, float, date, datetime, str, None) حسب تعريف CREATE TABLE
+"""
+
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# الجداول التي يستخدمها سكربت الاستيراد وسكربت التصدير
+LEGACY_TABLES = (
+    'invoices', 'clients', 'branches', 'status',
+    'invoice_status', 'invoice_services', 'products',
+)
+
+CREATE_TABLE_RE = re.compile(r'^CREATE TABLE `([^`]+)`')
+COLUMN_RE = re.compile(r'^\s*`([^`]+)`\s+([A-Za-z]+)')
+INSERT_RE = re.compile(r'^INSERT INTO `([^`]+)`\s*(?:\(([^)]*)\)\s*)?VALUES\s*', re.I)
+
+VALUE_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?:_\w+\s*)?(?P<string>'(?:[^'\\]|\\.|'')*')
+      | (?P<null>NULL)
+      | 0x(?P<hex>[0-9A-Fa-f]*)
+      | (?P<number>[-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+      | [xX]'(?P<hexstring>[0-9A-Fa-f]*)'
+      | [bB]'(?P<bits>[01]*)'
+      | (?P<punct>[(),;])
+    )
+""", re.X | re.S | re.I)
+
+# بداية نص لم يكتمل بعد في نهاية الـ buffer (يكتمل في السطر التالي)
+PARTIAL_STRING_RE = re.compile(r"\s*(?:_\w+\s*|[xXbB])?'")
+
+ESCAPE_RE = re.compile(r"\\(.)|''", re.S)
+ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+INTEGER_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint', 'year', 'bit'}
+DECIMAL_TYPES = {'decimal', 'numeric'}
+FLOAT_TYPES = {'float', 'double', 'real'}
+DATETIME_TYPES = {'datetime', 'timestamp'}
+
+
+def unescape_sql_string(literal: str) -> str:
+    """إزالة علامات الاقتباس والـ escapes من نص SQL"""
+    def replace(match):
+        char = match.group(1)
+        if char is None:
+            return "'"
+        return ESCAPES.get(char, char)
+    return ESCAPE_RE.sub(replace, literal[1:-1])
+
+
+def convert_value(value, column_type: Optional[str]):
+    """تحويل قيمة من الـ dump إلى نوع Python المناسب لنوع العمود"""
+    if value is None or column_type is None:
+        return value
+    try:
+        if column_type in INTEGER_TYPES:
+            return int(value)
+        if column_type in DECIMAL_TYPES:
+            return Decimal(value)
+        if column_type in FLOAT_TYPES:
+            return float(value)
+        if column_type in DATETIME_TYPES:
+            if value.startswith('0000-00-00'):
+                return None
+            return datetime.fromisoformat(value)
+        if column_type == 'date':
+            if value.startswith('0000-00-00'):
+                return None
+            return date.fromisoformat(value)
+    except (ValueError, ArithmeticError):
+        return value
+    return value
+
+
+class SqlDumpReader:
+    """قراءة جداول ملف SQL dump بشكل متدفق
+
+    لا يحتفظ بالملف في الذاكرة: يُقرأ سطراً بسطر وتُنتج الصفوف فور اكتمال كل tuple.
+    مع فهرس DumpIndex يتم الانتقال مباشرة لمواضع الجداول المطلوبة بدلاً من قراءة الملف كاملاً.
+    أسماء الأعمدة وأنواعها تُحفظ في self.columns / self.column_types عند قراءة CREATE TABLE.
+    """
+
+    def __init__(self, dump_file: str, index=None):
+        self.dump_file = dump_file
+        # فهرس DumpIndex اختياري: عند وجوده تُقرأ مواضع الجداول المطلوبة فقط
+        self.index = index
+        self.columns: Dict[str, List[str]] = {}
+        self.column_types: Dict[str, List[str]] = {}
+
+    def iter_rows(self, tables: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Tuple]]:
+        """إنتاج (اسم الجدول، صف) لكل صف في جمل INSERT للجداول المطلوبة"""
+        if self.index is not None and tables is not None:
+            tables = list(tables)
+            yield from self.iter_rows_from_lines(self.index.iter_lines(tables), tables)
+            return
+        with open(self.dump_file, 'r', encoding='utf-8') as f:
+            yield from self.iter_rows_from_lines(f, tables)
+
+    def iter_rows_from_lines(self, lines: Iterable[str],
+                             tables: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Tuple]]:
+        """مثل iter_rows لكن من أي مصدر أسطر (ملف أو جزء منه)"""
+        wanted = set(tables) if tables is not None else None
+        creating = None
+        inserting = None
+        insert_columns = None
+        buffer = ''
+        row = None
+
+        for line in lines:
+            if inserting is None:
+                if creating is not None:
+                    match = COLUMN_RE.match(line)
+                    if match:
+                        self.columns[creating].append(match.group(1))
+                        self.column_types[creating].append(match.group(2).lower())
+                    elif line.startswith(')'):
+                        creating = None
+                    continue
+
+                match = CREATE_TABLE_RE.match(line)
+                if match:
+                    creating = match.group(1)
+                    self.columns[creating] = []
+                    self.column_types[creating] = []
+                    continue
+
+                match = INSERT_RE.match(line)
+                if not match:
+                    continue
+                inserting = match.group(1)
+                insert_columns = None
+                if match.group(2):
+                    insert_columns = [name.strip().strip('`') for name in match.group(2).split(',')]
+                buffer = line[match.end():]
+                row = None
+            else:
+                buffer += line
+
+            # تحليل القيم المتاحة في الـ buffer
+            skip = wanted is not None and inserting not in wanted
+            types = self.column_types.get(inserting, [])
+            order = self.column_order(inserting, insert_columns)
+            position = 0
+            while True:
+                match = VALUE_TOKEN_RE.match(buffer, position)
+                if not match:
+                    break
+                kind = match.lastgroup
+                if kind == 'string' and buffer.startswith("'", match.end()):
+                    # النص مقطوع عند '' في نهاية السطر: ننتظر بقية النص
+                    break
+                position = match.end()
+                if kind == 'punct':
+                    char = match.group('punct')
+                    if char == '(':
+                        row = []
+                    elif char == ')':
+                        if row is not None and not skip:
+                            if order is not None:
+                                row = [row[index] if index is not None and index < len(row) else None
+                                       for index in order]
+                            yield inserting, tuple(
+                                convert_value(value, types[index] if index < len(types) else None)
+                                for index, value in enumerate(row)
+                            )
+                        row = None
+                    elif char == ';':
+                        inserting = None
+                        break
+                elif row is not None and not skip:
+                    if kind == 'string':
+                        row.append(unescape_sql_string(match.group('string')))
+                    elif kind == 'null':
+                        row.append(None)
+                    elif kind in ('hex', 'hexstring'):
+                        row.append(bytes.fromhex(match.group(kind)))
+                    elif kind == 'bits':
+                        row.append(int(match.group('bits') or '0', 2))
+                    else:
+                        row.append(match.group('number'))
+
+            if inserting is None:
+                buffer = ''
+                continue
+            buffer = buffer[position:]
+            if buffer.strip() and not PARTIAL_STRING_RE.match(buffer):
+                raise ValueError(f"قيمة غير متوقعة في جدول {inserting}: {buffer[:80]!r}")
+
+    def column_order(self, table: str, insert_columns: Optional[List[str]]) -> Optional[List[Optional[int]]]:
+        """ترتيب قيم INSERT حسب أعمدة CREATE TABLE عند وجود قائمة أعمدة مختلفة في الجملة"""
+        columns = self.columns.get(table)
+        if not insert_columns or not columns or insert_columns == columns:
+            return None
+        positions = {name: index for index, name in enumerate(insert_columns)}
+        return [positions.get(name) for name in columns]
+
+    def iter_table(self, table: str) -> Iterator[Dict]:
+        """صفوف جدول واحد كقواميس {اسم العمود: القيمة}"""
+        for _, row in self.iter_rows([table]):
+            yield dict(zip(self.columns.get(table, []), row))
+
+    def iter_tables(self, tables: Iterable[str]) -> Iterator[Tuple[str, Dict]]:
+        """صفوف عدة جداول في مرور واحد على الملف كقواميس"""
+        for table, row in self.iter_rows(tables):
+            yield table, dict(zip(self.columns.get(table, []), row))
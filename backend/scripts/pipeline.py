@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pipeline - تنفيذ الاستيراد على مرحلتين في نفس الوقت: التحليل في thread والكتابة في آخر
+يُستخدم من import_csv_data.py و import_invoices_from_sql_dump.py: مرحلة التحليل (المعالج)
+تجهز دفعات جاهزة للإدراج في طابور محدود الحجم، ومرحلة الكتابة (قاعدة البيانات) تسحب منه،
+فلا ينتظر أحدهما الآخر إلا عند امتلاء الطابور أو فراغه
+"""
+
+import os
+import threading
+import time
+from queue import Empty, Full, Queue
+from typing import Callable, Iterable, Iterator
+
+# تفعيل خط المعالجة (IMPORT_PIPELINE=1) في مسارات الدفعات
+IMPORT_PIPELINE = os.getenv('IMPORT_PIPELINE', '0') == '1'
+
+# أقصى عدد دفعات جاهزة في الطابور؛ عند امتلائه يتوقف التحليل حتى تسحب الكتابة دفعة (backpressure)
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 4))
+
+# نهاية الدفعات في الطابور
+DONE = object()
+
+
+class StageStats:
+    """عدد الصفوف وزمن العمل وزمن الانتظار لمرحلة واحدة"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+
+    def rate(self) -> float:
+        """الصفوف في الثانية من زمن العمل فقط"""
+        return self.rows / self.busy if self.busy else 0.0
+
+
+class PipelineError(Exception):
+    """خطأ في مرحلة التحليل يُنقل إلى مرحلة الكتابة مع الخطأ الأصلي كسبب"""
+
+
+class Pipeline:
+    """مرحلة تحليل في thread منفصل تغذي مرحلة الكتابة عبر طابور محدود
+
+    run(batches) يسحب الدفعات من batches في thread التحليل (فكل العمل داخل المولّد
+    يحدث هناك) ويعيدها بنفس الترتيب للحلقة التي تستدعيه، وهي مرحلة الكتابة.
+    الأخطاء في التحليل تُرفع في مرحلة الكتابة، والخروج من الحلقة يوقف التحليل.
+    """
+
+    def __init__(self, name: str, queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.queue: Queue = Queue(maxsize=max(1, queue_size))
+        self.stop = threading.Event()
+        self.parser = StageStats('التحليل')
+        self.writer = StageStats('الكتابة')
+
+    def put(self, item) -> bool:
+        """إضافة عنصر للطابور (ينتظر إذا كان ممتلئاً)، و False إذا توقفت الكتابة"""
+        started = time.perf_counter()
+        try:
+            while not self.stop.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+        finally:
+            self.parser.waiting += time.perf_counter() - started
+
+    def produce(self, batches: Iterable, size: Callable):
+        """مرحلة التحليل: تجهيز الدفعات ووضعها في الطابور"""
+        batches = iter(batches)
+        try:
+            while not self.stop.is_set():
+                started = time.perf_counter()
+                batch = next(batches, DONE)
+                self.parser.busy += time.perf_counter() - started
+                if batch is DONE:
+                    break
+                self.parser.rows += size(batch)
+                if not self.put(batch):
+                    return
+        except BaseException as e:
+            self.put(PipelineError(e))
+            return
+        self.put(DONE)
+
+    def run(self, batches: Iterable, size: Callable = len) -> Iterator:
+        """الدفعات الجاهزة بالترتيب؛ size(batch) عدد الصفوف في الدفعة لحساب السرعة"""
+        thread = threading.Thread(target=self.produce, args=(batches, size), name=f"{self.name}-parser", daemon=True)
+        thread.start()
+        try:
+            while True:
+                started = time.perf_counter()
+                batch = self.queue.get()
+                self.writer.waiting += time.perf_counter() - started
+                if batch is DONE:
+                    break
+                if isinstance(batch, PipelineError):
+                    raise batch.args[0]
+                started = time.perf_counter()
+                yield batch
+                self.writer.busy += time.perf_counter() - started
+                self.writer.rows += size(batch)
+        finally:
+            # إيقاف التحليل وتفريغ الطابور حتى لا يبقى thread التحليل منتظراً
+            self.stop.set()
+            while thread.is_alive():
+                try:
+                    self.queue.get(timeout=0.1)
+                except Empty:
+                    pass
+            thread.join()
+
+    def print_stats(self):
+        """طباعة سرعة كل مرحلة وزمن انتظارها"""
+        print(f"🔀 خط المعالجة ({self.name}):")
+        for stage, waiting_for in ((self.parser, 'امتلاء الطابور'), (self.writer, 'التحليل')):
+            print(f"  {stage.name}: {stage.rows} صف خلال {stage.busy:.1f} ثانية ({stage.rate():.0f} صف/ثانية)، "
+                  f"انتظار {waiting_for} {stage.waiting:.1f} ثانية")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+اختبارات arabic_normalize: تحويل الأعمدة (parse_amounts و clean_phones و parse_dates) يطابق
+الدوال لكل قيمة (parse_amount و clean_phone و parse_arabic_date)، في الحلقة العادية وبعمليات pandas
+"""
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arabic_normalize  # noqa: E402
+from arabic_normalize import (clean_phones, parse_amount, parse_amounts, parse_arabic_date,  # noqa: E402
+                              parse_dates)
+from customer_index import clean_phone  # noqa: E402
+
+AMOUNTS = ['', None, '0', '١٢٣', '١,٢٣٤.٥٠', '1 000', ' 75 ', '12.5.1', 'abc', '-٣', '٠٫٥', '1e3', '١٢٣']
+PHONES = ['', None, '.', '000', '00000000000', '010 1234 5678', '+20-100-123-4567', '٠١٠١٢٣٤٥٦٧٨',
+          '1234567', '12345678', 'tel: 0100', ' 01001234567 ', '0100\t1234567']
+DATES = ['الخميس, ٢٠ نوفمبر ٢٠٢٥', '٢٠ نوفمبر ٢٠٢٥', ' الأحد,  ١  يناير  ٢٠٢٤ ', '20 مايو 2024',
+         '٣١ فبراير ٢٠٢٤', 'نوفمبر ٢٠٢٥', '', None, 'garbage', 'الخميس, ٢٠ نوفمبر ٢٠٢٥']
+
+
+class ColumnNormalizationTest(unittest.TestCase):
+    def check(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(parse_amounts(AMOUNTS), [parse_amount(value) for value in AMOUNTS])
+            self.assertEqual(parse_dates(DATES), [parse_arabic_date(value) for value in DATES])
+        self.assertEqual(clean_phones(PHONES), [clean_phone(value) for value in PHONES])
+
+    def test_loop(self):
+        with mock.patch.object(arabic_normalize, 'PANDAS_MIN_ROWS', len(AMOUNTS) + len(PHONES) + 1):
+            self.check()
+
+    @unittest.skipUnless(arabic_normalize.pd is not None, 'pandas غير مثبتة')
+    def test_pandas(self):
+        with mock.patch.object(arabic_normalize, 'PANDAS_MIN_ROWS', 0):
+            self.assertTrue(arabic_normalize.use_pandas(AMOUNTS))
+            self.check()
+
+    def test_values(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(parse_amounts(['١,٢٣٤.٥٠', '', 'abc']), [Decimal('1234.50'), Decimal('0'), Decimal('0')])
+        self.assertEqual(clean_phones(['010 1234 5678', '.', '1234567']), ['01012345678', None, None])
+        self.assertEqual(parse_arabic_date('الخميس, ٢٠ نوفمبر ٢٠٢٥'), datetime(2025, 11, 20))
+
+
+if __name__ == '__main__':
+    unittest.main()
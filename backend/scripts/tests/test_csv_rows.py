@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+اختبارات iter_csv_rows: نفس الصفوف وأرقام السطور التي كان ينتجها import_csv_data
+بقراءة الملف بـ readlines ثم csv.DictReader (BOM، سطر العنوان، أعمدة ناقصة ومكررة، صفوف قصيرة وطويلة)
+"""
+
+import csv
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from csv_rows import csv_row_type, iter_csv_rows  # noqa: E402
+
+COLUMNS = {'#': 'csv_order', 'الاسم': 'name', 'رقم الجوال': 'phone', 'المنطقة': 'address', 'علامه': 'notes'}
+HEADER_MARKERS = ('#', 'الاسم')
+DEFAULTS = {'notes': 'default'}
+CELLS = ['', '1', '  أحمد  ', 'a,b', 'line\nbreak', '"quoted"', '٠١٠٠', ' ']
+
+
+def read_with_dict_reader(path):
+    """طريقة القراءة القديمة: readlines، حذف BOM وسطر العنوان، ثم DictReader"""
+    with open(path, 'r', encoding='utf-8') as file:
+        lines = file.readlines()
+    if lines and lines[0].startswith('\ufeff'):
+        lines[0] = lines[0][1:]
+    start_line = 0
+    if lines and not any(marker in lines[0] for marker in HEADER_MARKERS):
+        start_line = 1
+    reader = csv.DictReader(lines[start_line:])
+    return [
+        (row_num, tuple(row.get(column, DEFAULTS.get(field, '')) for column, field in COLUMNS.items()))
+        for row_num, row in enumerate(reader, start=start_line + 2)
+    ]
+
+
+def random_csv(rng):
+    header = rng.sample(list(COLUMNS) + ['عمود آخر', 'الاسم'], rng.randint(1, 7))
+    rows = []
+    for _ in range(rng.randint(0, 12)):
+        if rng.random() < 0.15:
+            rows.append([])
+            continue
+        size = len(header) + rng.choice([-2, -1, 0, 0, 0, 1])
+        rows.append([rng.choice(CELLS) for _ in range(max(1, size))])
+    return header, rows
+
+
+class IterCsvRowsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.row_type = csv_row_type('CustomerRow', COLUMNS)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, text, newline='\n'):
+        path = os.path.join(self.directory.name, 'customers.csv')
+        with open(path, 'w', encoding='utf-8', newline=newline) as file:
+            file.write(text)
+        return path
+
+    def rows(self, path):
+        return [(row_num, tuple(row)) for row_num, row in
+                iter_csv_rows(path, self.row_type, COLUMNS, HEADER_MARKERS, DEFAULTS)]
+
+    def test_matches_dict_reader(self):
+        rng = random.Random(7)
+        for case in range(300):
+            header, rows = random_csv(rng)
+            lines = []
+            if rng.random() < 0.5:
+                lines.append(['قائمة العملاء'])
+            lines.append(header)
+            lines.extend(rows)
+            with tempfile.SpooledTemporaryFile(mode='w+', newline='') as buffer:
+                csv.writer(buffer, lineterminator=rng.choice(['\n', '\r\n'])).writerows(lines)
+                buffer.seek(0)
+                text = ('\ufeff' if rng.random() < 0.5 else '') + buffer.read()
+            path = self.write(text, newline='')
+            with self.subTest(case=case):
+                self.assertEqual(self.rows(path), read_with_dict_reader(path))
+
+    def test_title_line_and_defaults(self):
+        path = self.write('\ufeffقائمة العملاء\n#,الاسم,رقم الجوال\n1,أحمد\n\n2,منى,0100\n')
+        self.assertEqual(self.rows(path), [
+            (3, ('1', 'أحمد', None, '', 'default')),
+            (4, ('2', 'منى', '0100', '', 'default')),
+        ])
+
+    def test_empty_file(self):
+        self.assertEqual(self.rows(self.write('')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+اختبارات customer_index: المطابقة في الفهرس مثل استعلامات WHERE name/phone = %s LIMIT 1
+بمفاتيح collation العمود (بمحاكاة utf8mb4_unicode_ci في unicode_ci.py)، وربط الفروع في load_branch_map
+مثل استعلام WHERE name = %s في get_branch_by_old_id
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from customer_index import (COLLATION_KEYS_PER_QUERY, CollationKeys, CustomerIndex,  # noqa: E402
+                            clean_phone, collation_key_sql)
+from import_invoices_from_sql_dump import load_branch_map  # noqa: E402
+from unicode_ci import sql_first, unicode_ci_key, unicode_ci_keys  # noqa: E402
+
+NAMES = ['أحمد', 'احمد', 'إحمد', 'آحمد', 'أحمد ', 'احمـد', 'أَحْمَد', 'Ali', 'ALI', 'ali  ', 'منى', 'مني', None, '']
+PHONES = ['01000000001', '01000000001 ', ' 01000000001', '010-0000-0001', '٠١٠٠٠٠٠٠٠٠١', '.', '', None]
+
+
+def make_index(rows):
+    """فهرس من صفوف (id, name, phone) بمفاتيح المحاكاة"""
+    index = CustomerIndex(CollationKeys(unicode_ci_keys))
+    for customer_id, name, phone in rows:
+        index.add(customer_id, name, phone)
+    return index
+
+
+class CollationKeysTest(unittest.TestCase):
+
+    def test_prefetch_computes_each_missing_value_once_in_chunks(self):
+        calls = []
+
+        def compute(values):
+            calls.append(list(values))
+            return unicode_ci_keys(values)
+
+        keys = CollationKeys(compute)
+        keys.remember('أحمد', 'known')
+        values = ['أحمد', None] + [f"name{i}" for i in range(COLLATION_KEYS_PER_QUERY + 10)] * 2
+        keys.prefetch(values)
+
+        self.assertEqual([len(chunk) for chunk in calls], [COLLATION_KEYS_PER_QUERY, 10])
+        self.assertEqual(keys['أحمد'], 'known')
+        self.assertIsNone(keys[None])
+        self.assertEqual(keys['name0'], 'name0')
+        self.assertEqual(len(calls), 2)
+
+    def test_missing_value_is_computed_on_first_use(self):
+        keys = CollationKeys(unicode_ci_keys)
+        self.assertEqual(keys['إحمد '], keys['احمد'])
+
+    def test_key_sql_uses_server_collation(self):
+        sql = collation_key_sql('name')
+        self.assertIn('WEIGHT_STRING', sql)
+        self.assertIn("TRIM(TRAILING ' ' FROM name)", sql)
+        self.assertIn('COLLATE utf8mb4_unicode_ci', sql)
+
+
+class CustomerIndexTest(unittest.TestCase):
+
+    def test_find_by_name_matches_sql_collation(self):
+        rows = [(customer_id, name, None) for customer_id, name in enumerate(NAMES * 2, 1)]
+        index = make_index(rows)
+        for name in NAMES + ['احمد  ', 'اَحمد', 'Omar']:
+            self.assertEqual(index.find_by_name(name), sql_first(rows, 1, name), name)
+
+    def test_hamza_and_trailing_space_variants_share_one_customer(self):
+        index = make_index([(7, 'أحمد', None), (3, 'محمد', None)])
+        for name in ('احمد', 'إحمد', 'آحمد', 'أحمد   ', 'احمـد', 'أَحْمَد'):
+            self.assertEqual(index.find_by_name(name), 7, name)
+        self.assertIsNone(index.find_by_name(' أحمد'))
+
+    def test_find_by_phone_compares_the_raw_stored_phone(self):
+        rows = [(customer_id, f"c{customer_id}", phone) for customer_id, phone in enumerate(PHONES * 2, 1)]
+        index = make_index(rows)
+        for phone in PHONES[:-1] + ['01000000001  ', '01000000002']:
+            self.assertEqual(index.find_by_phone(phone), sql_first(rows, 2, phone), phone)
+
+        # '010-0000-0001' is stored as-is: the cleaned CSV phone does not match it
+        index = make_index([(1, 'a', '010-0000-0001'), (2, 'b', '01000000001 ')])
+        self.assertEqual(index.find_by_phone(clean_phone('010-0000-0001')), 2)
+
+    def test_find_skips_dot_phone_and_prefers_name(self):
+        index = make_index([(1, 'a', '.'), (2, 'b', '01000000001')])
+        self.assertIsNone(index.find('x', '.'))
+        self.assertEqual(index.find('x', '01000000001'), 2)
+        self.assertEqual(index.find('A', '01000000001'), 1)
+
+    def test_update_phone_moves_the_customer(self):
+        index = make_index([(1, 'a', '01000000001'), (2, 'b', '01000000001')])
+        index.update_phone(1, '01000000009')
+        self.assertEqual(index.find_by_phone('01000000001'), 2)
+        self.assertEqual(index.find_by_phone('01000000009'), 1)
+        index.update_phone(2, None)
+        self.assertIsNone(index.find_by_phone('01000000001'))
+        self.assertEqual(len(index), 2)
+
+    def test_refs_sort_like_limit_1(self):
+        index = make_index([(('db', 5), 'أحمد', None)])
+        index.add(('new', 0), 'احمد', '01000000001')
+        self.assertEqual(index.find_by_name('إحمد'), ('db', 5))
+        self.assertEqual(index.find_by_phone('01000000001'), ('new', 0))
+
+
+class BranchMapTest(unittest.TestCase):
+
+    def test_matches_sql_collation(self):
+        branches = [(1, ' المعادي', None), (2, 'مدينة نصر ', None), (3, 'المعادى', None), (4, 'المَعادي', None),
+                    (5, 'Main', None), (6, None, None)]
+        legacy_names = ['المعادي', ' المعادي', 'مدينة نصر', 'مدينة  نصر', 'MAIN  ', 'الفرع', '', None]
+        connection = mock.MagicMock()
+        connection.cursor.return_value.fetchall.return_value = [
+            (branch_id, name, unicode_ci_key(name)) for branch_id, name, _ in branches
+        ]
+        branch_map = load_branch_map(connection, dict(enumerate(legacy_names, 10)), CollationKeys(unicode_ci_keys))
+        for old_branch_id, name in enumerate(legacy_names, 10):
+            self.assertEqual(branch_map.get(old_branch_id), sql_first(branches, 1, name), name)
+        self.assertEqual(branch_map[10], 4)
+        self.assertEqual(branch_map[11], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
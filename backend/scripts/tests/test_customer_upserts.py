@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+اختبارات plan_customer_upserts: نتيجة مسارات الدفعات و LOAD DATA مطابقة لتنفيذ
+get_or_create_customer صفاً صفاً على نفس العملاء (بما فيها اختلافات الهمزات والمسافات)
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from customer_index import (CollationKeys, CustomerIndex, build_customer_custom_fields,  # noqa: E402
+                            clean_phone, plan_customer_upserts)
+from unicode_ci import sql_first, unicode_ci_keys  # noqa: E402
+
+NAMES = ['أحمد', 'احمد', 'إحمد', 'آحمد', 'أحمد ', 'احمـد', 'أَحمد', 'Ali', 'ALI', 'ali ', 'منى', 'مني', 'Omar']
+PHONES = ['', '01000000001', '010-0000-0001', '01000000002', '٠١٠٠٠٠٠٠٠٠٢', '.', '000', '0100000000']
+STORED_PHONES = [None, '', '01000000001', '01000000001 ', ' 01000000002', '01000000003']
+
+
+def customer(csv_order, name, phone):
+    return {'csv_order': csv_order, 'name': name, 'phone': phone, 'address': 'a', 'notes': None}
+
+
+def upsert_row_by_row(table, customers):
+    """نفس خطوات get_or_create_customer على جدول في الذاكرة: [id, name, phone, address, customFields]"""
+    for customer_data in customers:
+        name = customer_data['name'].strip()
+        rows = [(row[0], row[1], row[2]) for row in table]
+        phone = clean_phone(customer_data['phone'])
+
+        customer_id = sql_first(rows, 1, name)
+        if customer_id is not None:
+            if phone:
+                table[customer_id - 1][2] = phone
+            continue
+        if phone and sql_first(rows, 2, phone) is not None:
+            continue
+        table.append([len(table) + 1, name, phone, customer_data['address'],
+                      build_customer_custom_fields(customer_data['notes'], customer_data['csv_order'])])
+    return table
+
+
+def upsert_planned(table, customers):
+    """نفس تسلسل upsert_customers_chunk: الخطة ثم UPDATE للهواتف و INSERT للعملاء الجدد"""
+    index = CustomerIndex(CollationKeys(unicode_ci_keys))
+    for customer_id, name, phone, _, _ in table:
+        index.add(('db', customer_id), name, phone)
+
+    rows = [(customer_data, clean_phone(customer_data['phone'])) for customer_data in customers]
+    new_customers, phone_updates = plan_customer_upserts(rows, index)
+    for customer_id, phone in phone_updates.items():
+        table[customer_id - 1][2] = phone
+    for values in new_customers:
+        table.append([len(table) + 1] + list(values))
+    return table
+
+
+class PlanCustomerUpsertsTest(unittest.TestCase):
+
+    def test_batches_match_row_by_row_with_hamza_and_space_variants(self):
+        for seed in range(300):
+            rng = random.Random(seed)
+            existing = [[customer_id, rng.choice(NAMES), rng.choice(STORED_PHONES), 'old', None]
+                        for customer_id in range(1, rng.randint(1, 8))]
+            customers = [customer(csv_order, rng.choice(NAMES), rng.choice(PHONES))
+                         for csv_order in range(1, rng.randint(2, 30))]
+            batch_size = rng.randint(1, 10)
+
+            expected = upsert_row_by_row([list(row) for row in existing], customers)
+            actual = [list(row) for row in existing]
+            for start in range(0, len(customers), batch_size):
+                actual = upsert_planned(actual, customers[start:start + batch_size])
+            self.assertEqual(actual, expected, seed)
+
+    def test_variants_update_the_existing_customer(self):
+        table = [[1, 'أحمد', None, 'old', None]]
+        customers = [customer(1, 'احمد ', '01000000001'), customer(2, 'إحمد', None), customer(3, 'Omar', '01000000001')]
+        self.assertEqual(upsert_planned([list(row) for row in table], customers),
+                         [[1, 'أحمد', '01000000001', 'old', None]])
+
+    def test_new_customer_found_again_in_the_same_batch(self):
+        customers = [customer(1, 'منى', None), customer(2, 'منى ', '01000000002'), customer(3, 'x', '01000000002')]
+        index = CustomerIndex(CollationKeys(unicode_ci_keys))
+        rows = [(customer_data, clean_phone(customer_data['phone'])) for customer_data in customers]
+        new_customers, phone_updates = plan_customer_upserts(rows, index)
+        self.assertEqual(new_customers, [['منى', '01000000002', 'a', '{"csvOrder": 1}']])
+        self.assertEqual(phone_updates, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+اختبارات علامة الاستيراد التزايدي للفواتير: فقط الفواتير التي فشلت كتابتها في التشغيل (row و batch
+وتحديث الفواتير المرحّلة) توقف العلامة، والفواتير بدون عميل تُحسب أخطاء لكنها لا توقفها
+(قاعدة البيانات مستبدلة بـ mock)
+"""
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import import_invoices_from_sql_dump as invoices  # noqa: E402
+from customer_index import CollationKeys, CustomerIndex  # noqa: E402
+from unicode_ci import unicode_ci_keys  # noqa: E402
+
+WATERMARK = {'invoice_id': 5, 'invoice_updated_at': None, 'service_id': 0, 'status_row_id': 0}
+
+# 1: بدون client_id، 2: عميل غير موجود، 3: فشل الكتابة، 4 و 5: تُرحّل
+LEGACY_INVOICES = [
+    {'id': 1, 'client_id': None},
+    {'id': 2, 'client_id': 20},
+    {'id': 3, 'client_id': 30},
+    {'id': 4, 'client_id': 40},
+    {'id': 5, 'client_id': 40},
+]
+LEGACY_CLIENTS = {20: ('عميل غير موجود', None), 30: ('أحمد', None), 40: ('منى', None)}
+CUSTOMERS = {30: 300, 40: 400}
+
+
+def customer_index():
+    index = CustomerIndex(CollationKeys(unicode_ci_keys))
+    index.add(300, 'احمد')
+    index.add(400, 'منى')
+    return index
+
+
+def create_device(connection, invoice_data, customer_id, commit_policy=None):
+    return None if invoice_data['id'] == 3 else 1000 + invoice_data['id']
+
+
+def write_invoices_chunk(connection, staged, ledger=None):
+    if any(invoice_data['id'] == 3 for invoice_data, *_ in staged):
+        raise invoices.Error('Deadlock found when trying to get lock')
+    return {'devices': len(staged), 'repair_requests': len(staged), 'invoices': len(staged), 'errors': 0}
+
+
+class DeltaWatermarkTest(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(invoices, 'get_customer_by_old_id',
+                              side_effect=lambda connection, legacy, client_id, index=None: CUSTOMERS.get(client_id)),
+            mock.patch.object(invoices, 'get_branch_by_old_id', return_value=None),
+            mock.patch.object(invoices, 'create_device', side_effect=create_device),
+            mock.patch.object(invoices, 'create_repair_request', return_value=2000),
+            mock.patch.object(invoices, 'create_invoice', return_value=3000),
+            mock.patch.object(invoices, 'create_invoice_items_from_old_services', return_value=0),
+            mock.patch.object(invoices, 'fetch_legacy_clients', return_value=LEGACY_CLIENTS),
+            mock.patch.object(invoices, 'fetch_legacy_branch_names', return_value={}),
+            mock.patch.object(invoices, 'fetch_old_services', return_value={}),
+            mock.patch.object(invoices, 'write_invoices_chunk', side_effect=write_invoices_chunk),
+            mock.patch.object(CustomerIndex, 'prefetch',
+                              lambda self, values, connection=None: self.keys.prefetch(values)),
+            contextlib.redirect_stdout(io.StringIO()),
+        ]
+        for patch in patches:
+            patch.__enter__()
+            self.addCleanup(patch.__exit__, None, None, None)
+        self.connection = mock.MagicMock()
+        self.legacy_statuses = mock.Mock(status_for=mock.Mock(return_value='RECEIVED'))
+
+    def test_row_by_row(self):
+        failed_ids = []
+        stats = invoices.migrate_invoices_row_by_row(
+            self.connection, mock.MagicMock(), LEGACY_INVOICES, customer_index(), self.legacy_statuses,
+            failed_ids=failed_ids
+        )
+        self.assertEqual(stats['errors'], 3)
+        self.assertEqual(stats['invoices'], 2)
+        self.assertEqual(failed_ids, [3])
+        self.assertEqual(invoices.watermark_before_failures(WATERMARK, failed_ids)['invoice_id'], 2)
+
+    def test_batched(self):
+        failed_ids = []
+        stats = invoices.migrate_invoices_batched(
+            self.connection, mock.MagicMock(), LEGACY_INVOICES, customer_index(), self.legacy_statuses, 2,
+            pipeline=False, failed_ids=failed_ids
+        )
+        self.assertEqual(stats['errors'], 3)
+        self.assertEqual(stats['invoices'], 2)
+        self.assertEqual(failed_ids, [3])
+
+    def test_invoice_without_customer_lets_watermark_advance(self):
+        failed_ids = []
+        stats = invoices.migrate_invoices_row_by_row(
+            self.connection, mock.MagicMock(), [LEGACY_INVOICES[0], LEGACY_INVOICES[1], LEGACY_INVOICES[3]],
+            customer_index(), self.legacy_statuses, failed_ids=failed_ids
+        )
+        self.assertEqual(stats['errors'], 2)
+        self.assertEqual(failed_ids, [])
+        self.assertEqual(invoices.watermark_before_failures(WATERMARK, failed_ids), WATERMARK)
+
+    def test_delta_updates(self):
+        migrated = {2: (12, 22, 32), 3: (13, 23, 33), 4: (14, 24, 34)}
+        statements = mock.Mock()
+        statements.execute.side_effect = (
+            lambda name, sql, values: (_ for _ in ()).throw(invoices.Error('lock wait timeout'))
+            if values[-1] == 13 else None
+        )
+        with mock.patch.object(invoices, 'read_changed_invoices', return_value=LEGACY_INVOICES[1:4]), \
+                mock.patch.object(invoices, 'load_migrated_invoices', return_value=migrated), \
+                mock.patch.object(invoices, 'prepared_statements', return_value=statements), \
+                mock.patch.object(invoices, 'INVOICE_IMPORT_MODE', 'row'):
+            failed_ids = []
+            stats = invoices.migrate_delta(
+                self.connection, mock.MagicMock(), WATERMARK, customer_index(), self.legacy_statuses,
+                failed_ids=failed_ids
+            )
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(stats['errors'], 2)
+        self.assertEqual(failed_ids, [3])
+
+
+if __name__ == '__main__':
+    unittest.main()
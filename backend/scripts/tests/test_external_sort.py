@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+اختبارات external_sorted: نفس نتيجة sorted() المستقر بأي حجم للأجزاء (جزء واحد في الذاكرة
+أو عدة أجزاء على القرص)، مع حذف الملفات المؤقتة، و is_sorted
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from external_sort import external_sorted, is_sorted  # noqa: E402
+from import_csv_data import customer_order_key  # noqa: E402
+
+
+def order_key(customer):
+    return customer_order_key(customer['csv_order'])
+
+
+class ExternalSortedTest(unittest.TestCase):
+    def sort(self, items, key, chunk_size):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return list(external_sorted(items, key, chunk_size))
+
+    def test_stable_like_sorted(self):
+        rng = random.Random(3)
+        for size in (0, 1, 2, 5, 17, 100):
+            customers = [{'csv_order': rng.choice([None, 1, 2, 3, rng.randint(1, 50)]), 'row': row}
+                         for row in range(size)]
+            for chunk_size in (0, 1, 2, 3, 7, size, size + 1):
+                with self.subTest(size=size, chunk_size=chunk_size):
+                    self.assertEqual(self.sort(iter(customers), order_key, chunk_size),
+                                     sorted(customers, key=order_key))
+
+    def test_runs_are_removed(self):
+        before = set(os.listdir(tempfile.gettempdir()))
+        items = list(range(20, 0, -1))
+        self.assertEqual(self.sort(items, lambda item: item, 3), sorted(items))
+        leftovers = {name for name in set(os.listdir(tempfile.gettempdir())) - before
+                     if name.startswith('external_sort_')}
+        self.assertEqual(leftovers, set())
+
+    def test_is_sorted(self):
+        self.assertTrue(is_sorted([]))
+        self.assertTrue(is_sorted(customer_order_key(order) for order in [1, 1, 2, None, None]))
+        self.assertFalse(is_sorted(customer_order_key(order) for order in [2, 1]))
+        self.assertFalse(is_sorted(customer_order_key(order) for order in [None, 1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
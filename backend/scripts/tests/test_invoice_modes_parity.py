@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+اختبارات تطابق وضع sql (INSERT ... SELECT) مع مسار Python في ترحيل الفواتير القديمة:
+تحويل التواريخ و specifications بدون قاعدة بيانات، وتشغيل الوضعين على نفس الفواتير القديمة
+ومقارنة صفوف Device و RepairRequest و Invoice و InvoiceItem عند تحديد IMPORT_TEST_DATABASE
+(قاعدة بيانات تجريبية بجداول FixZone؛ تُنشأ بجانبها قاعدة {IMPORT_TEST_DATABASE}_legacy وتُحذف)
+"""
+
+import json
+import os
+import re
+import sys
+import unittest
+from datetime import date, datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import import_invoices_from_sql_dump as invoices  # noqa: E402
+from customer_index import CustomerIndex  # noqa: E402
+from db_access import DB_CONFIG  # noqa: E402
+
+IMPORT_TEST_DATABASE = os.getenv('IMPORT_TEST_DATABASE')
+
+DATE_STRINGS = [
+    '2024-01-05', '2024-1-5', '2024-01-05 10:00:00', '2024-1-5 7:5:3', '2024-01-05 10:00:00.25',
+    '2024-01-05 23:59:59.999999', '0000-00-00', '0000-00-00 00:00:00', '2024-13-01', '2024-00-10',
+    '2024-01-00', '2024-01-32', '2024-01-05 24:00:00', '2024-01-05 10:60:00', '2024-01-05T10:00:00',
+    '05/01/2024', '2024-01-05 ', ' 2024-01-05', 'garbage', '',
+]
+
+SPECIFICATIONS = [
+    None, '', 'NULL', 'garbage', '[1, 2]', '5', '"CPU"',
+    '{"CPU": "i7", "GPU": "RTX", "RAM": "8GB", "Storage": "512GB"}',
+    '{\\"CPU\\": \\"i5\\", \\"RAM\\": \\"16GB\\"}',
+    '{"CPU": "", "GPU": " ", "RAM": 8, "Storage": ["a"]}',
+    '{"CPU": null, "GPU": {"model": "x"}, "RAM": true, "Storage": "' + 'x' * 80 + '"}',
+    '{"CPU": "' + 'c' * 150 + '"}',
+]
+
+
+class ParseDateTest(unittest.TestCase):
+    def test_objects_from_temp_db(self):
+        moment = datetime(2024, 1, 5, 10, 30, 15, 250000)
+        self.assertEqual(invoices.parse_date(moment), moment)
+        self.assertEqual(invoices.parse_date(date(2024, 1, 5)), datetime(2024, 1, 5))
+        self.assertIsNone(invoices.parse_date(None))
+
+    def test_sql_pattern_matches_strptime(self):
+        pattern = re.compile(invoices.LEGACY_DATETIME_PATTERN)
+        for value in DATE_STRINGS:
+            with self.subTest(value=value):
+                accepted_by_sql = bool(pattern.search(value)) and not value.startswith('0000-')
+                self.assertEqual(accepted_by_sql, invoices.parse_date(value) is not None)
+
+
+class SpecValueTest(unittest.TestCase):
+    def test_values(self):
+        specs = {'CPU': 'i7', 'GPU': '', 'RAM': 8, 'Storage': 'x' * 80, 'Other': {'a': 1}}
+        self.assertEqual(invoices.spec_value(specs, 'CPU', 100), 'i7')
+        self.assertIsNone(invoices.spec_value(specs, 'GPU', 100))
+        self.assertIsNone(invoices.spec_value(specs, 'RAM', 50))
+        self.assertEqual(invoices.spec_value(specs, 'Storage', 50), 'x' * 50)
+        self.assertIsNone(invoices.spec_value(specs, 'Other', 50))
+        self.assertIsNone(invoices.spec_value([1, 2], 'CPU', 100))
+        self.assertIsNone(invoices.spec_value(None, 'CPU', 100))
+
+    def test_device_values_accept_legacy_types(self):
+        for specifications in SPECIFICATIONS:
+            with self.subTest(specifications=specifications):
+                values = invoices.build_device_values(
+                    {'id': 1, 'specifcations': specifications, 'purchase_date': date(2023, 6, 1)}, 7
+                )
+                self.assertEqual(json.loads(values[-1])['purchaseDate'], '2023-06-01')
+
+
+LEGACY_DDL = [
+    """CREATE TABLE invoices (
+        id INT PRIMARY KEY, payment VARCHAR(32) NULL, device_type VARCHAR(64) NULL, brand VARCHAR(64) NULL,
+        device_model VARCHAR(64) NULL, device_sn VARCHAR(64) NULL, purchase_date DATE NULL,
+        problem_description TEXT NULL, accessories TEXT NULL, specifcations TEXT NULL, examination TEXT NULL,
+        date VARCHAR(32) NULL, entery_at DATETIME NULL, exit_at DATETIME NULL, client_id INT NULL,
+        total DOUBLE NULL, paid DOUBLE NULL, due DOUBLE NULL, note TEXT NULL, branche_id INT NULL,
+        creator_id INT NULL, status_id INT NULL, updated_at DATETIME NULL
+    ) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+    "CREATE TABLE clients (id INT PRIMARY KEY, name VARCHAR(255) NULL, mobile VARCHAR(50) NULL) "
+    "DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci",
+    "CREATE TABLE branches (id INT PRIMARY KEY, name VARCHAR(255) NULL) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci",
+    "CREATE TABLE status (id INT PRIMARY KEY, name VARCHAR(255) NULL) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci",
+    "CREATE TABLE invoice_status (id INT PRIMARY KEY, invoice_id INT, status_id INT, created_at DATETIME NULL)",
+    "CREATE TABLE invoice_services (id INT PRIMARY KEY, invoice_id INT, title VARCHAR(255) NULL, price DOUBLE NULL, "
+    "created_at DATETIME NULL) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci",
+]
+
+CLIENT_NAMES = ['parity-test-أحمد', 'parity-test-احمد ', 'parity-test-Omar', 'parity-test-missing']
+ENTERED_AT = [datetime(2024, 1, 5, 10, 0), None, datetime(2023, 12, 31, 23, 59, 59)]
+
+
+def legacy_invoices():
+    """فواتير قديمة تغطي التواريخ النصية والتالفة و specifications بكل أنواع JSON"""
+    rows = []
+    for position in range(1, 41):
+        rows.append((
+            position, None, 'Laptop', 'HP', f'model {position}', f'sn{position}',
+            date(2023, position % 12 + 1, position % 28 + 1) if position % 3 else None,
+            'broken screen' if position % 2 else None,
+            '{"bag": "yes"}' if position % 4 else None,
+            SPECIFICATIONS[position % len(SPECIFICATIONS)],
+            None,
+            DATE_STRINGS[position % len(DATE_STRINGS)],
+            ENTERED_AT[position % len(ENTERED_AT)],
+            None, position % (len(CLIENT_NAMES) + 1), [0, 100, 50][position % 3], [0, 50, 100][position % 3 - 1], 0,
+            'note' if position % 5 else None, position % 3 or None, 1, position % 4 or None, None,
+        ))
+    return rows
+
+
+@unittest.skipUnless(IMPORT_TEST_DATABASE, 'IMPORT_TEST_DATABASE غير محدد (اختبار يحتاج MySQL)')
+class InvoiceModesParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import mysql.connector
+
+        cls.legacy_database = f'{IMPORT_TEST_DATABASE}_legacy'
+        config = dict(DB_CONFIG, database=IMPORT_TEST_DATABASE)
+        cls.connection = mysql.connector.connect(**config)
+        cursor = cls.connection.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{cls.legacy_database}`")
+        cursor.execute(f"CREATE DATABASE `{cls.legacy_database}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+        cls.legacy_connection = mysql.connector.connect(**dict(config, database=cls.legacy_database))
+
+        legacy_cursor = cls.legacy_connection.cursor()
+        for ddl in LEGACY_DDL:
+            legacy_cursor.execute(ddl)
+        legacy_cursor.executemany(
+            f"INSERT INTO invoices VALUES ({', '.join(['%s'] * 23)})", legacy_invoices()
+        )
+        legacy_cursor.executemany(
+            "INSERT INTO clients VALUES (%s, %s, %s)",
+            [(position, name, '.' if position % 2 else None) for position, name in enumerate(CLIENT_NAMES, 1)]
+        )
+        legacy_cursor.executemany("INSERT INTO branches VALUES (%s, %s)", [(1, 'parity-test-branch'), (2, None)])
+        legacy_cursor.executemany(
+            "INSERT INTO status VALUES (%s, %s)", list(enumerate(invoices.OLD_STATUS_MAP, 1))[:4]
+        )
+        legacy_cursor.executemany(
+            "INSERT INTO invoice_status VALUES (%s, %s, %s, %s)",
+            [(position, position % 40 + 1, position % 4 + 1, datetime(2024, 1, position % 3 + 1))
+             for position in range(1, 31)]
+        )
+        legacy_cursor.executemany(
+            "INSERT INTO invoice_services VALUES (%s, %s, %s, %s, %s)",
+            [(position, position % 40 + 1, ['Screen', ' Battery ', '', None][position % 4],
+              [100, None, 25.5][position % 3], None) for position in range(1, 61)]
+        )
+        cls.legacy_connection.commit()
+
+        # العملاء بنفس الاسم حسب collation (الهمزة والمسافة في النهاية)
+        cursor.executemany(
+            "INSERT INTO Customer (name, phone, address, customFields, createdAt) VALUES (%s, NULL, NULL, NULL, NOW())",
+            [('parity-test-احمد',), ('parity-test-omar',)]
+        )
+        cls.connection.commit()
+        cursor.close()
+        legacy_cursor.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cursor = cls.connection.cursor()
+        cursor.execute("DELETE FROM Customer WHERE name LIKE 'parity-test-%'")
+        cursor.execute(f"DROP DATABASE IF EXISTS `{cls.legacy_database}`")
+        cls.connection.commit()
+        cursor.close()
+        cls.legacy_connection.close()
+        cls.connection.close()
+
+    def max_ids(self):
+        cursor = self.connection.cursor()
+        ids = {}
+        for table in ('Device', 'RepairRequest', 'Invoice', 'InvoiceItem'):
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+            ids[table] = cursor.fetchone()[0]
+        cursor.close()
+        return ids
+
+    def snapshot(self, before, started):
+        """صفوف الترحيل مرتبة برقم الفاتورة القديمة، بدون المعرفات الجديدة و NOW()"""
+        def at(value):
+            return None if isinstance(value, datetime) and value >= started else value
+
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """SELECT customerId, deviceType, brand, model, serialNumber, cpu, gpu, ram, storage, customFields
+               FROM Device WHERE id > %s""", (before['Device'],)
+        )
+        devices = sorted((json.loads(row[-1])['oldInvoiceId'], row[:-1], json.loads(row[-1]))
+                         for row in cursor.fetchall())
+        cursor.execute(
+            """SELECT rr.customFields, rr.customerId, rr.branchId, rr.reportedProblem, rr.status, rr.createdAt,
+                      i.totalAmount, i.amountPaid, i.status, i.currency, i.notes, i.createdAt
+               FROM RepairRequest rr LEFT JOIN Invoice i ON i.repairRequestId = rr.id
+               WHERE rr.id > %s""", (before['RepairRequest'],)
+        )
+        repair_requests = sorted(
+            (json.loads(row[0])['oldInvoiceId'], row[1:5], at(row[5]), row[6:11], at(row[11]))
+            for row in cursor.fetchall()
+        )
+        cursor.execute(
+            """SELECT rr.customFields, item.description, item.quantity, item.unitPrice, item.totalPrice,
+                      item.itemType, item.serviceId
+               FROM InvoiceItem item
+               JOIN Invoice i ON i.id = item.invoiceId
+               JOIN RepairRequest rr ON rr.id = i.repairRequestId
+               WHERE item.id > %s ORDER BY item.id""", (before['InvoiceItem'],)
+        )
+        items = sorted((json.loads(row[0])['oldInvoiceId'],) + row[1:] for row in cursor.fetchall())
+        cursor.close()
+        return {'Device': devices, 'RepairRequest': repair_requests, 'InvoiceItem': items}
+
+    def remove(self, before):
+        cursor = self.connection.cursor()
+        for table in ('InvoiceItem', 'Invoice', 'RepairRequest', 'Device'):
+            cursor.execute(f"DELETE FROM {table} WHERE id > %s", (before[table],))
+        for table in invoices.STAGING_TABLES:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        self.connection.commit()
+        cursor.close()
+
+    def run_mode(self, mode):
+        before = self.max_ids()
+        started = datetime.now().replace(microsecond=0)
+        customer_index = CustomerIndex.load(self.connection)
+        try:
+            with mock.patch.object(invoices, 'LEGACY_DATABASE', self.legacy_database):
+                if mode == 'batch':
+                    stats = invoices.migrate_invoices_batched(
+                        self.connection, self.legacy_connection,
+                        invoices.iter_invoices_from_temp_db(self.legacy_connection, 7), customer_index,
+                        invoices.LegacyStatuses.load(self.legacy_connection), 9, pipeline=False
+                    )
+                else:
+                    stats = invoices.migrate_invoices_sql_merge(self.connection, self.legacy_connection,
+                                                                customer_index)
+            return stats, self.snapshot(before, started)
+        finally:
+            self.remove(before)
+
+    def test_batch_and_sql_create_same_rows(self):
+        batch_stats, batch_rows = self.run_mode('batch')
+        sql_stats, sql_rows = self.run_mode('sql')
+        self.assertGreater(batch_stats['invoices'], 0)
+        self.assertEqual(batch_stats, sql_stats)
+        for table in batch_rows:
+            with self.subTest(table=table):
+                self.assertEqual(batch_rows[table], sql_rows[table])
+
+
+if __name__ == '__main__':
+    unittest.main()
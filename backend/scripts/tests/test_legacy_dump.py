@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+اختبارات SqlDumpReader: صفوف جمل INSERT بقيمها المحوّلة (نصوص بـ escapes، NULL، أرقام، تواريخ
+صفرية، hex و bit)، الصفوف والنصوص الممتدة على عدة أسطر، قائمة أعمدة بترتيب مختلف، وتطابق القراءة
+عبر DumpIndex مع قراءة الملف كاملاً
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dump_index import DumpIndex  # noqa: E402
+from legacy_dump import SqlDumpReader, convert_value, unescape_sql_string  # noqa: E402
+
+DUMP = r"""-- phpMyAdmin SQL Dump
+SET SQL_MODE = "NO_AUTO_VALUE_ON_ZERO";
+/*!40101 SET NAMES utf8mb4 */;
+
+CREATE TABLE `clients` (
+  `id` int(11) NOT NULL,
+  `name` varchar(255) NOT NULL,
+  `mobile` varchar(50) DEFAULT NULL,
+  `balance` decimal(10,2) DEFAULT NULL,
+  `created_at` timestamp NULL DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO `clients` (`id`, `name`, `mobile`, `balance`, `created_at`) VALUES
+(1, 'Ali\'s shop', '0100', 10.50, '2024-01-01 10:00:00'),
+(2, 'a,b (c);', '.', NULL, '0000-00-00 00:00:00'),
+(3, 'line\nbreak ''q''', NULL, -3, NULL);
+INSERT INTO `clients` (`mobile`, `id`, `name`) VALUES
+('0111', 4, 'multi
+line'),
+(NULL, 5, 'أحمد ''
+''');
+
+CREATE TABLE `invoices` (
+  `id` int(11) NOT NULL,
+  `date` date DEFAULT NULL,
+  `total` double DEFAULT NULL,
+  `flags` bit(1) DEFAULT NULL,
+  `data` blob DEFAULT NULL,
+  `note` text DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO `invoices` VALUES (1,'2024-02-03',1.5e2,b'1',0x4142,_utf8mb4'x\\y'),(2,'0000-00-00',NULL,b'0',X'',''),
+(3,'not a date',7,NULL,NULL,'tab\there');
+
+ALTER TABLE `clients`
+  ADD PRIMARY KEY (`id`);
+COMMIT;
+"""
+
+CLIENTS = [
+    (1, "Ali's shop", '0100', Decimal('10.50'), datetime(2024, 1, 1, 10, 0)),
+    (2, 'a,b (c);', '.', None, None),
+    (3, "line\nbreak 'q'", None, Decimal('-3'), None),
+    (4, 'multi\nline', '0111', None, None),
+    (5, "أحمد '\n'", None, None, None),
+]
+
+INVOICES = [
+    (1, date(2024, 2, 3), 150.0, 1, b'AB', 'x\\y'),
+    (2, None, None, 0, b'', ''),
+    (3, 'not a date', 7.0, None, None, 'tab\there'),
+]
+
+
+class SqlDumpReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.dump_file = os.path.join(self.directory.name, 'legacy.sql')
+        with open(self.dump_file, 'w', encoding='utf-8') as f:
+            f.write(DUMP)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_rows(self):
+        reader = SqlDumpReader(self.dump_file)
+        rows = list(reader.iter_rows())
+        self.assertEqual([row for table, row in rows if table == 'clients'], CLIENTS)
+        self.assertEqual([row for table, row in rows if table == 'invoices'], INVOICES)
+        self.assertEqual(reader.columns['clients'], ['id', 'name', 'mobile', 'balance', 'created_at'])
+
+    def test_tables_filter_and_dicts(self):
+        reader = SqlDumpReader(self.dump_file)
+        self.assertEqual(list(reader.iter_rows(['invoices'])), [('invoices', row) for row in INVOICES])
+        self.assertEqual(next(reader.iter_table('clients')),
+                         {'id': 1, 'name': "Ali's shop", 'mobile': '0100', 'balance': Decimal('10.50'),
+                          'created_at': datetime(2024, 1, 1, 10, 0)})
+
+    def test_index_matches_full_read(self):
+        index = DumpIndex.load(self.dump_file)
+        for tables in (['clients'], ['invoices'], ['clients', 'invoices']):
+            with self.subTest(tables=tables):
+                self.assertEqual(list(SqlDumpReader(self.dump_file, index).iter_rows(tables)),
+                                 list(SqlDumpReader(self.dump_file).iter_rows(tables)))
+
+    def test_unexpected_value(self):
+        with open(self.dump_file, 'w', encoding='utf-8') as f:
+            f.write("INSERT INTO `clients` VALUES (1, NOW());\n")
+        with self.assertRaises(ValueError):
+            list(SqlDumpReader(self.dump_file).iter_rows())
+
+    def test_helpers(self):
+        self.assertEqual(unescape_sql_string(r"'a\'b''c\\d\0'"), "a'b'c\\d\0")
+        self.assertEqual(convert_value('12', 'int'), 12)
+        self.assertEqual(convert_value('abc', 'int'), 'abc')
+        self.assertIsNone(convert_value('0000-00-00', 'date'))
+        self.assertEqual(convert_value('2024-01-05 10:00:00.5', 'datetime'), datetime(2024, 1, 5, 10, 0, 0, 500000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+محاكاة utf8mb4_unicode_ci للاختبارات بدون قاعدة بيانات
+تقريب لما يهم أسماء العملاء: الهمزات (أ/إ/آ/ٱ = ا)، التشكيل والتطويل مُهملة،
+الأرقام العربية = الإنجليزية، حالة الأحرف مُهملة، والمسافات في النهاية مُهملة (PAD SPACE)
+"""
+
+from typing import List, Optional
+
+UNICODE_CI_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    **{chr(code): None for code in range(0x064B, 0x0653)},
+    'ٰ': None,
+    'ـ': None,
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+})
+
+
+def unicode_ci_key(value) -> Optional[str]:
+    """مفتاح القيمة: قيمتان متساويتان في المقارنة إذا تساوى مفتاحاهما"""
+    if value is None:
+        return None
+    return str(value).rstrip(' ').translate(UNICODE_CI_MAP).casefold()
+
+
+def unicode_ci_keys(values: List) -> List[Optional[str]]:
+    """بديل server_collation_keys: مفاتيح قائمة قيم"""
+    return [unicode_ci_key(value) for value in values]
+
+
+def sql_first(rows: List[tuple], column: int, value) -> Optional[int]:
+    """مثل SELECT id ... WHERE <column> = %s ORDER BY id LIMIT 1 على صفوف (id, name, phone)"""
+    if value is None:
+        return None
+    matches = [row[0] for row in rows if row[column] is not None and unicode_ci_key(row[column]) == unicode_ci_key(value)]
+    return min(matches) if matches else None